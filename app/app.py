@@ -2,27 +2,48 @@ import gzip
 import json
 import logging
 import os
-import re
-from collections.abc import Mapping
+import subprocess
+import sys
+import tomllib
+from collections.abc import Callable, Mapping
 from datetime import datetime
-from pathlib import Path
 from types import MappingProxyType
 from typing import Any
 
 import numpy as np
 from flask import Flask, Response, request
 from flask_babel import Babel
-from huggingface_hub import snapshot_download
 from lru import LRU
-from speaklater import make_lazy_string
 from werkzeug.exceptions import HTTPException
 
 from app.blueprints.help import help
 from app.blueprints.index import index
 from app.blueprints.results import results
-from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
+from app.blueprints.results.results import prerender_article_pages
+from app.calculations.batching import BatchScheduler
+from app.calculations.cache import RESULTS_CACHE_BACKENDS, QueryCache, ResultsSerializer, SQLiteCache
+from app.calculations.core import LabelTable
+from app.calculations.models import EmbeddingClassifier, EmbeddingModel, ViTEmbeddingModel, ViTModelConfig
+from app.calculations.models.backends import apply_inference_backend
+from app.calculations.text_index import TextIndex
+from app.calculations.workers import RemoteClassifier, get_authkey_from_config
+from app.cli import calibrate_threads_command, check_inference_backend, generate_thumbnails_command, serve_inference
+from app.embedding_store import get_file_digest, load_embedding_store, write_embedding_store
+from app.image_manifest import load_image_manifest
+from app.meta_data_store import (
+    get_code_digest,
+    get_meta_data_artifact_key,
+    load_meta_data_artifact,
+    write_meta_data_artifact,
+)
+from app.meta_data_translation import MetaDataValueTranslator
+from app.metrics import init_metrics
 from app.requests.validate import clean_text
+from app.snapshots import get_snapshot_revision, sync_snapshot
+from app.thumbnails import THUMBNAILS_DIRNAME
+from app.torch_threads import configure_torch_threads_from_config
 from app.utils import get_locale, redirect_to
+from config.render import meta_data_mapping
 from config.render.meta_data_mapping import (
     META_DATA_KEY_MAPPING,
     META_DATA_VALUE_MAPPING_STRING,
@@ -32,9 +53,67 @@ from config.render.meta_data_mapping import (
 APP_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
 
-def get_model(model_name: str, checkpoint_dir: str, meta_data: Mapping[str, Any]) -> EmbeddingClassifier:
-    snapshot_download(repo_id=model_name, local_dir=checkpoint_dir)
+def get_model(
+    model_name: str,
+    checkpoint_dir: str,
+    meta_data: Mapping[str, Any],
+    inference_backend: str | None = None,
+    offline: bool = False,
+    **classifier_params,
+) -> EmbeddingClassifier:
+    sync_snapshot(repo_id=model_name, local_dir=checkpoint_dir, offline=offline)
+    embedding_model = load_embedding_model(checkpoint_dir, inference_backend=inference_backend)
+
+    model = EmbeddingClassifier(model=embedding_model, **classifier_params)
+    model.update_embeddings(meta_data)
+
+    return model
+
 
+def load_classifier(
+    app_config: Mapping[str, Any], meta_data: Mapping[str, Any], offline: bool | None = None
+) -> EmbeddingClassifier:
+    """
+    Load the classifier configured in `app_config` with the reference embeddings of `meta_data` (see `get_model`).
+
+    :param app_config: Global constants used in the application
+    :param meta_data: the meta-data holding the reference embeddings
+    :param offline: whether to use the downloaded model without any requests, defaults to `OFFLINE`
+    :returns: the classifier
+    """
+    return get_model(
+        app_config.get("MODEL_HF"),
+        app_config["MODEL_DIR"],
+        meta_data,
+        n_lists=app_config.get('ANN_N_LISTS', 0),
+        n_probe=app_config.get('ANN_N_PROBE', 8),
+        top_k=app_config.get('ANN_TOP_K', 50),
+        index_dir=get_artifact_dir(app_config),
+        inference_backend=app_config.get('INFERENCE_BACKEND'),
+        offline=app_config.get('OFFLINE', False) if offline is None else offline,
+    )
+
+
+def load_inference_worker_classifier(app_config: Mapping[str, Any]) -> EmbeddingClassifier:
+    """
+    Load the classifier in a worker process of `flask serve-inference`, from the model and meta-data synchronized by
+    the server before starting the workers, so without any requests. With the embedding store, the reference embeddings
+    are memory-mapped, and so shared by all worker processes.
+    """
+    configure_torch_threads_from_config(app_config)
+    meta_data = get_meta_data(app_config | {'META_DATA_HF': None})
+    return load_classifier(app_config, meta_data, offline=True)
+
+
+def load_embedding_model(checkpoint_dir: str, inference_backend: str | None = None) -> EmbeddingModel:
+    """
+    Load the embedding model from the checkpoint directory and prepare it for inference on CPU.
+
+    :param checkpoint_dir: directory containing the `settings.json` and the `best_weights.pt` of the model
+    :param inference_backend: one of `INFERENCE_BACKENDS`, defaults to the `inference_backend` in `settings.json` (or
+        'float32' if it is not set)
+    :returns: the loaded embedding model
+    """
     with open(os.path.join(checkpoint_dir, 'settings.json')) as f:
         model_config = json.load(f)
 
@@ -49,10 +128,9 @@ def get_model(model_name: str, checkpoint_dir: str, meta_data: Mapping[str, Any]
     else:
         raise ValueError("'backbone' field missing in `settings.json`")
 
-    model = EmbeddingClassifier(model=embedding_model)
-    model.update_embeddings(meta_data)
-
-    return model
+    return apply_inference_backend(
+        embedding_model, inference_backend or model_config.get('inference_backend', 'float32')
+    )
 
 
 def build_image_url(category: str, label: str, filename: str) -> str:
@@ -60,28 +138,132 @@ def build_image_url(category: str, label: str, filename: str) -> str:
     return f'{category}/{label}/{filename}'
 
 
-def parse_json(filename: str) -> Mapping[str, Any]:
+def parse_json(filename: str, object_hook: Callable[[dict], Any] | None = None) -> Mapping[str, Any]:
     if filename.endswith('.gz'):
         fh = gzip.open
     else:
         fh = open
     with fh(filename, 'r') as f:
-        return json.loads(f.read())
+        return json.loads(f.read(), object_hook=object_hook)
 
 
-def get_meta_data(app_config: Mapping[str, Any]) -> Mapping[str, Any]:
+def get_model_version(checkpoint_dir: str, inference_backend: str | None = None) -> str:
     """
-    Download, parse and return the fireworks meta-data from the meta-data directory. The meta-data should consist of
-    a `meta.json.gz` file and nested folders each category/label containing the images.
+    Identify the model checkpoint by the digests of its (existing) settings and weights files, and the inference
+    backend if it overrides the one in the settings.
+    """
+    filenames = (os.path.join(checkpoint_dir, filename) for filename in ('settings.json', 'best_weights.pt'))
+    digests = [get_file_digest(filename) for filename in filenames if os.path.exists(filename)]
+    return ':'.join(digests + ([inference_backend] if inference_backend else []))
+
+
+def get_app_version(project_dir: str = APP_DIR) -> str:
+    """
+    Identify the release of the application by the version in its `pyproject.toml` and the git revision of its
+    checkout (if it is one), so that the ETags of the rendered pages change with every deploy.
+    """
+    try:
+        with open(os.path.join(project_dir, 'pyproject.toml'), 'rb') as f:
+            version = tomllib.load(f)['project']['version']
+    except (OSError, KeyError, tomllib.TOMLDecodeError):
+        version = 'unknown'
+    try:
+        # the arguments are fixed, and git is looked up on the PATH like any other tool
+        revision = subprocess.run(  # noqa: S603
+            ['git', 'rev-parse', 'HEAD'],  # noqa: S607
+            cwd=project_dir,
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return version
+    return f'{version}+{revision}'
+
+
+def get_artifact_dir(app_config: Mapping[str, Any]) -> str:
+    """Get the directory for the files derived from the reference data, which defaults to the reference data itself."""
+    return app_config.get('ARTIFACT_DIR') or app_config['REFERENCE_DATA_DIR']
+
+
+def get_thumbnail_dir(app_config: Mapping[str, Any]) -> str:
+    """
+    Get the directory of the thumbnails of the reference images, which defaults to a folder in the `ARTIFACT_DIR`, or
+    otherwise in the `META_DATA_DIR` next to the reference data, so that the generated thumbnails are never part of the
+    reference data.
+    """
+    if thumbnail_dir := app_config.get('THUMBNAIL_DIR'):
+        return thumbnail_dir
+    return os.path.join(app_config.get('ARTIFACT_DIR') or app_config['META_DATA_DIR'], THUMBNAILS_DIRNAME)
+
+
+def get_results_cache(app_config: Mapping[str, Any], data_version: str):
+    """
+    Create the cache for the search results of `CACHE_BACKEND`: either an in-memory LRU cache of `CACHE_SIZE` entries
+    per worker process ('memory'), or a SQLite database shared by all worker processes ('sqlite'), see `SQLiteCache`.
 
     :param app_config: Global constants used in the application
-    :returns: an immutable mapping containing all the parsed meta-data
+    :param data_version: identifier of the meta-data
+    :returns: the cache, supporting `cache[key] = value` and `cache.get(key)`
     """
-    if app_config.get('META_DATA_HF'):
-        snapshot_download(
-            repo_id=app_config['META_DATA_HF'], repo_type="dataset", local_dir=app_config['META_DATA_DIR']
-        )
-    meta_data = parse_json(filename=os.path.join(app_config['REFERENCE_DATA_DIR'], 'meta.json.gz'))
+    backend = app_config.get('CACHE_BACKEND') or 'memory'
+    if backend not in RESULTS_CACHE_BACKENDS:
+        raise ValueError(f'`CACHE_BACKEND` must be one of {RESULTS_CACHE_BACKENDS}, not {backend!r}')
+    if backend == 'memory':
+        return LRU(app_config.get('CACHE_SIZE'))
+    return SQLiteCache(
+        path=app_config.get('CACHE_PATH') or os.path.join(get_artifact_dir(app_config), 'results_cache.sqlite'),
+        serializer=ResultsSerializer(data_version),
+        ttl=app_config.get('CACHE_TTL', 24 * 60 * 60),
+        max_bytes=app_config.get('CACHE_MAX_BYTES', 1 << 28),
+    )
+
+
+def _drop_embeddings(obj: dict) -> dict:
+    """
+    Drop the embeddings of an article while parsing the meta-data, so that their memory is freed (and reused for
+    parsing the next article) immediately.
+    """
+    if 'wrappers' in obj:
+        obj.pop('embeddings', None)
+    return obj
+
+
+def parse_meta_data(
+    filename: str, app_config: Mapping[str, Any]
+) -> tuple[dict[str, Any], Mapping[tuple[str, str], np.ndarray]]:
+    """
+    Parse the meta-data file and get the reference embeddings for every (category, label). Unless disabled with
+    `EMBEDDING_STORE`, the embeddings are read-only views on a memory-mapped float32 embedding store, which is
+    generated from the meta-data file once and then shared by all (worker) processes. In that case, the embeddings in
+    the meta-data file are only used for generating the store.
+    """
+    if not app_config.get('EMBEDDING_STORE', True):
+        meta_data = parse_json(filename=filename)
+        return meta_data, {
+            (category, label): np.asarray(article['embeddings'])
+            for category, articles in meta_data.items()
+            for label, article in articles.items()
+        }
+
+    store_dir, key = get_artifact_dir(app_config), get_file_digest(filename)
+    if store := load_embedding_store(store_dir, key):
+        meta_data = parse_json(filename=filename, object_hook=_drop_embeddings)
+    else:
+        meta_data = parse_json(filename=filename)
+        write_embedding_store(store_dir, key, meta_data)
+        store = load_embedding_store(store_dir, key)
+    matrix, rows = store
+    return meta_data, {label: matrix[label_rows] for label, label_rows in rows.items()}
+
+
+def process_meta_data(filename: str, app_config: Mapping[str, Any]) -> dict[str, Any]:
+    """
+    Parse the meta-data file and prepare the meta-data of every article for the application: its keys are sorted, its
+    text is cleaned, and the urls of its images are added.
+    """
+    meta_data, embeddings = parse_meta_data(filename=filename, app_config=app_config)
     for category, articles in meta_data.items():
         for label, article in articles.items():
             article_meta_data = article.get('wrappers', {})
@@ -103,8 +285,55 @@ def get_meta_data(app_config: Mapping[str, Any]) -> Mapping[str, Any]:
             )
             # overwrite entry
             article["wrappers"] = article_meta_data
-            # convert the embeddings to numpy arrays
-            article["embeddings"] = np.asarray(article["embeddings"])
+            # replace the embeddings by numpy arrays
+            article["embeddings"] = embeddings[(category, label)]
+    return meta_data
+
+
+def get_meta_data(app_config: Mapping[str, Any]) -> Mapping[str, Any]:
+    """
+    Download, parse and return the fireworks meta-data from the meta-data directory. The meta-data should consist of
+    a `meta.json.gz` file and nested folders each category/label containing the images. With the embedding store, the
+    processed meta-data is stored as an artifact as well (see `process_meta_data`), which is reused by all (worker)
+    processes until the meta-data file or the folders change.
+
+    :param app_config: Global constants used in the application
+    :returns: an immutable mapping containing all the parsed meta-data
+    """
+    if app_config.get('META_DATA_HF'):
+        sync_snapshot(
+            repo_id=app_config['META_DATA_HF'],
+            local_dir=app_config['META_DATA_DIR'],
+            repo_type="dataset",
+            offline=app_config.get('OFFLINE', False),
+        )
+    meta_data_filename = os.path.join(app_config['REFERENCE_DATA_DIR'], 'meta.json.gz')
+    if not app_config.get('EMBEDDING_STORE', True):
+        return MappingProxyType(process_meta_data(meta_data_filename, app_config))
+
+    # reuse the processed meta-data from the artifact, as long as the meta-data and the image folders are unchanged
+    artifact_dir, meta_data_digest = get_artifact_dir(app_config), get_file_digest(meta_data_filename)
+    key = get_meta_data_artifact_key(
+        meta_data_digest,
+        app_config['REFERENCE_DATA_DIR'],
+        parts=(
+            app_config['WRAPPER_FILENAME'],
+            # the processing code, so that artifacts of other versions of the processing are not used
+            get_code_digest(sys.modules[__name__], sys.modules[clean_text.__module__], meta_data_mapping),
+        ),
+        # the generated files may be stored in the reference data, but do not change it
+        exclude=(artifact_dir, get_thumbnail_dir(app_config)),
+    )
+    meta_data = load_meta_data_artifact(artifact_dir, key)
+    store = load_embedding_store(artifact_dir, meta_data_digest) if meta_data is not None else None
+    if store is None:
+        meta_data = process_meta_data(meta_data_filename, app_config)
+        write_meta_data_artifact(artifact_dir, key, meta_data)
+    else:
+        matrix, rows = store
+        for category, articles in meta_data.items():
+            for label, article in articles.items():
+                article['embeddings'] = matrix[rows[category, label]]
     return MappingProxyType(meta_data)
 
 
@@ -128,19 +357,58 @@ def create_app(config: str | Mapping[str, Any] = 'setup.cfg'):
     app.register_blueprint(help.help_page)
     app.register_blueprint(results.results_page)
 
-    if not os.path.isabs(app.config['META_DATA_DIR']):
-        app.config['META_DATA_DIR'] = str(Path().absolute() / app.config['META_DATA_DIR'])
+    # relative data directories are relative to the working directory
+    for key in ('META_DATA_DIR', 'MODEL_DIR'):
+        app.config[key] = os.path.abspath(app.config[key])
     app.config['REFERENCE_DATA_DIR'] = os.path.join(app.config['META_DATA_DIR'], 'reference_data')
+    app.config['THUMBNAIL_DIR'] = get_thumbnail_dir(app.config)
     app.meta_data = get_meta_data(app_config=app.config)
-
-    if not os.path.isabs(app.config['MODEL_DIR']):
-        app.config['MODEL_DIR'] = str(Path().absolute() / app.config['MODEL_DIR'])
-    app.config["MODEL_DIR"] = str(Path().absolute() / Path(app.config['MODEL_DIR']))
-    app.model = get_model(app.config.get("MODEL_HF"), app.config["MODEL_DIR"], app.meta_data)
-    app.cache = LRU(app.config.get('CACHE_SIZE'))
+    app.data_version = get_file_digest(os.path.join(app.config['REFERENCE_DATA_DIR'], 'meta.json.gz'))
+    app.app_version = get_app_version()
+    app.image_manifest = load_image_manifest(
+        app.config['REFERENCE_DATA_DIR'], get_artifact_dir(app.config), app.config['ALLOWED_EXTENSIONS']
+    )
+    app.labels = LabelTable.from_meta_data(app.meta_data)
+    app.text_index = TextIndex.from_meta_data(app.meta_data)
+
+    if app.config.get('INFERENCE_SOCKET'):
+        # the model is run by the worker processes of `flask serve-inference`
+        app.model = RemoteClassifier(
+            app.config['INFERENCE_SOCKET'],
+            get_authkey_from_config(app.config),
+            timeout=app.config.get('INFERENCE_TIMEOUT', 60),
+        )
+    else:
+        configure_torch_threads_from_config(app.config)
+        app.model = load_classifier(app.config, app.meta_data)
+    # the revisions of the model and data recorded when downloading them, shown on the help page
+    app.model_revision = get_snapshot_revision(app.config['MODEL_DIR'])
+    app.data_revision = get_snapshot_revision(app.config['META_DATA_DIR'])
+    app.model_version = get_model_version(app.config["MODEL_DIR"], app.config.get('INFERENCE_BACKEND'))
+    app.query_cache = QueryCache(app.config.get('QUERY_CACHE_SIZE', 0))
+    app.scheduler = BatchScheduler(
+        predict_batch=lambda instances: app.model.predict_batch(instances),
+        max_batch_size=app.config.get('BATCH_MAX_SIZE', 8),
+        max_wait=app.config.get('BATCH_MAX_WAIT_MS', 5) / 1000,
+    )
+    app.cache = get_results_cache(app.config, app.data_version)
     app.jinja_env.filters['zip'] = zip
-    app.jinja_env.filters['translate_meta_data_values'] = translate_meta_data_values
+    app.jinja_env.filters['translate_meta_data_values'] = MetaDataValueTranslator(
+        META_DATA_VALUE_MAPPING_STRING, META_DATA_VALUE_MAPPING_WORDS
+    )
+
+    app.page_cache = QueryCache(app.config.get('PAGE_CACHE_SIZE', 0))
+    if app.config.get('PAGE_CACHE_SIZE', 0) and app.config.get('PAGE_CACHE_PRERENDER', False):
+        n_rendered = prerender_article_pages(app)
+        logging.info(f"Pre-rendered {n_rendered} article pages")
+
+    if app.config.get('METRICS', False):
+        init_metrics(app)
 
+    app.cli.add_command(check_inference_backend)
+    app.cli.add_command(generate_thumbnails_command)
+    app.cli.add_command(serve_inference)
+    app.cli.add_command(calibrate_threads_command)
     register_error_handlers(app)
 
     app.after_request(after_request)
@@ -148,28 +416,6 @@ def create_app(config: str | Mapping[str, Any] = 'setup.cfg'):
     return app
 
 
-def translate_meta_data_values(input: str):
-    """
-    Translate the parts of the string defined in `META_DATA_VALUE_MAPPING_STRING` and then split the string in words and
-    translate individually from `META_DATA_VALUE_MAPPING_WORDS`. Return the translated string as a LazyString.
-    """
-    # Make the mapping keys lowercase
-    smap = {k.lower(): v for k, v in META_DATA_VALUE_MAPPING_STRING.items()}
-    wmap = {k.lower(): v for k, v in META_DATA_VALUE_MAPPING_WORDS.items()}
-
-    # Compile the patterns to replace
-    sub_pat = re.compile("|".join(map(re.escape, sorted(smap, key=len, reverse=True))), re.IGNORECASE)
-    word_pat = re.compile(rf"(?<![A-Za-z0-9])({'|'.join(map(re.escape, wmap))})(?![A-Za-z0-9])", re.IGNORECASE)
-
-    def apply_subs(string: str) -> str:
-        string = sub_pat.sub(lambda m: str(smap[m.group(0).lower()]), string)
-        string = word_pat.sub(lambda m: str(wmap[m.group(0).lower()]), string)
-        return string
-
-    # Apply the substitutions and return as a lazy string
-    return make_lazy_string(lambda t: apply_subs(t).capitalize(), input)
-
-
 def register_error_handlers(app):
     app.register_error_handler(404, redirect_bad_request)
     app.register_error_handler(405, redirect_bad_request)
@@ -1,6 +1,9 @@
 from flask_babel import lazy_gettext
 
-from app.utils import get_commit_hash_data, get_commit_hash_model
+
+def _short_revision(revision: str | None) -> str:
+    """Shorten the revision (commit sha) recorded when downloading the model or data, like git does."""
+    return revision[:7] if revision else '-'
 
 
 def get_faq(current_app):
@@ -154,8 +157,8 @@ def get_faq(current_app):
                 "(versienummer) {commit_hash_model}. De huidige versie van de database heeft commit hash (versienummer)"
                 " {commit_hash_data}."
             ).format(
-                commit_hash_model=get_commit_hash_model(current_app.config.get('MODEL_HF')),
-                commit_hash_data=get_commit_hash_data(current_app.config.get('META_DATA_HF')),
+                commit_hash_model=_short_revision(current_app.model_revision),
+                commit_hash_data=_short_revision(current_app.data_revision),
             ),
         },
         {
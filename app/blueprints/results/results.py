@@ -1,22 +1,37 @@
-import pathlib
-from collections import Counter
-from collections.abc import Sequence
-
-from flask import Blueprint, abort, current_app, jsonify, render_template, request, send_from_directory
+from itertools import islice
+
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    send_file,
+    send_from_directory,
+    url_for,
+)
 from flask_babel import gettext
 from flask_paginate import Pagination
 
 from app.blueprints.results.pagination import create_navigation
-from app.calculations import get_search_results
+from app.calculations import get_batch_search_results, get_search_results
 from app.calculations.cache import add_to_cache, get_from_cache
-from app.calculations.core import Result
+from app.calculations.core import Result, ResultViews
+from app.metrics import timed
 from app.requests.messages import NO_MATCH_FOUND, RESULTS_NOT_AVAILABLE, RESULTS_NOT_AVAILABLE_FOR_PAGE
 from app.requests.validate import (
+    process_batch_post_request,
     process_get_request_article_page,
     process_get_request_category_page,
     process_get_request_results_page,
     process_post_request,
 )
+from app.thumbnails import get_thumbnail, has_image_extension, select_thumbnail_width
+from app.utils import add_cache_headers, get_etag, get_locale, is_not_modified
 from config.render.endangerment_mapping import ENDANGERMENT_MAPPING
 from config.render.meta_data_mapping import META_DATA_KEY_MAPPING
 
@@ -30,11 +45,12 @@ def run_model():
     :return: The id of the cached results.
     """
     # process post request and verify its content
-    processed_post_request = process_post_request(request)
+    with timed('parse'):
+        processed_post_request = process_post_request(request)
     errors = processed_post_request.errors
     if not errors:
         results, search_errors = get_search_results(
-            processed_post_request.image_data,
+            processed_post_request.query_image,
             processed_post_request.query_text,
             processed_post_request.text_filter,
             processed_post_request.include_digits,
@@ -48,18 +64,42 @@ def run_model():
     if not results:
         return jsonify(errors=NO_MATCH_FOUND)
 
-    return jsonify(results_id=add_to_cache(results))
+    # compute the views shown by the results and category pages once, instead of for every page
+    with timed('views'):
+        views = ResultViews.from_results(results, current_app.labels)
+    return jsonify(results_id=add_to_cache(views))
+
+
+@results_page.route('/search/batch', methods=['POST'])
+def run_model_batch():
+    """
+    Run the model to generate search results for several images at once and store these in cache.
+    :return: The ids of the cached results of every image (None for images without results), or the id of the fused
+        results of all images if `fuse` is requested.
+    """
+    with timed('parse'):
+        processed_post_request = process_batch_post_request(request)
+    errors = processed_post_request.errors
+    if not errors:
+        results, search_errors = get_batch_search_results(
+            processed_post_request.query_images,
+            processed_post_request.query_texts,
+            processed_post_request.text_filter,
+            processed_post_request.include_digits,
+            processed_post_request.fuse,
+        )
+        errors += search_errors
 
+    if len(errors) > 0:
+        string_errors = [str(error) for error in errors]
+        return jsonify(errors=",".join(string_errors))
 
-def _group_results_by_category(results: Sequence[Result]) -> list[Result]:
-    """Group the results by category. If there are multiple labels per category, show only the first one."""
-    results_by_category = []
-    category_set = set()
-    for result in results:
-        if result.category not in category_set:
-            results_by_category.append(result)
-            category_set.add(result.category)
-    return results_by_category
+    with timed('views'):
+        views = [ResultViews.from_results(r, current_app.labels) if r else None for r in results]
+    results_ids = [add_to_cache(v) if v else None for v in views]
+    if processed_post_request.fuse:
+        return jsonify(results_id=results_ids[0]) if results_ids[0] else jsonify(errors=NO_MATCH_FOUND)
+    return jsonify(results_ids=results_ids)
 
 
 @results_page.route('/search/results', methods=['GET'])
@@ -74,43 +114,40 @@ def show_search_results_page():
     processed_get_request = process_get_request_results_page(request)
     errors = processed_get_request.errors
     page = processed_get_request.page
-    results = None
-    counts = None
+    views = None
 
     if not errors:
-        results = get_from_cache(processed_get_request.results_id)
+        views = get_from_cache(processed_get_request.results_id)
 
-        if not results:
+        if not views:
             errors.append(RESULTS_NOT_AVAILABLE)
-        else:
-            counts = Counter(r.category for r in results)
-            results = _group_results_by_category(results)
-            if not results:
-                errors.append(NO_MATCH_FOUND)
-            elif page <= 0 or len(results) <= (page - 1) * results_per_page:
-                errors.append(RESULTS_NOT_AVAILABLE_FOR_PAGE)
+        # the results are grouped by category, showing only the first label of every category
+        elif len(views.groups) == 0:
+            errors.append(NO_MATCH_FOUND)
+        elif page <= 0 or len(views.groups) <= (page - 1) * results_per_page:
+            errors.append(RESULTS_NOT_AVAILABLE_FOR_PAGE)
 
     if errors:
         return render_template("results.html", errors=errors)
 
     # get results for current page
     start = (page - 1) * results_per_page
-    end = min(start + results_per_page, len(results))
-    page_results = results[start:end]
+    labels = current_app.labels
 
     # retrieve the first wrapper image and number of articles of every group
     page_results = [
         Result(
             category=r.category,
             label=r.label,
-            meta=current_app.meta_data[r.category][r.label]['wrappers'] | {'n_articles': counts[r.category]},
+            meta=current_app.meta_data[r.category][r.label]['wrappers']
+            | {'n_articles': views.count(labels.category_codes[r.category])},
         )
-        for r in page_results
+        for r in labels.materialize(views.grouped(start, start + results_per_page))
     ]
 
     pagination = Pagination(
         page=page,
-        total=len(results),
+        total=len(views.groups),
         search=False,
         record_name=gettext('resultaten'),
         display_msg=gettext("<b>{start} - {end}</b> van <b>{total}</b> {record_name}"),
@@ -151,16 +188,34 @@ def show_category_page(category: str):
     if errors:
         return render_template("category.html", errors=errors)
 
-    # sort articles based on cached predictions
-    if cached_predictions := get_from_cache(results_id):
-        articles = {
-            result.label: articles[result.label] for result in cached_predictions if result.category == category
-        }
+    # the page changes with the app, the reference data and the language, and with whether the results of the id are
+    # (still) cached: the results of an id never change, but they expire or are evicted, after which the page is not
+    # ordered by them anymore
+    views = get_from_cache(results_id) if results_id else None
+    cached = 'cached' if views else ''
+    etag = get_etag(current_app.app_version, current_app.data_version, get_locale(), request.full_path, cached)
+    if is_not_modified(etag):
+        return add_cache_headers(Response(status=304), etag, private=True)
 
-    # get results for current page
+    # get results for current page, sorted based on cached predictions
     start = (page - 1) * results_per_page
-    end = min(start + results_per_page, len(articles))
+    end = start + results_per_page
+    if views:
+        category_code = current_app.labels.category_codes[category]
+        keys = [r.label for r in current_app.labels.materialize(views.in_category(category_code, start, end))]
+        html = render_category_page(category, page, keys, views.count(category_code))
+    else:
+        # without the ordering of cached results, the page only depends on the category, the page and the language
+        html = current_app.page_cache.get_or_compute(
+            ('category', category, page, get_locale(), current_app.data_version),
+            lambda: render_category_page(category, page, list(islice(articles, start, end)), len(articles)),
+        )
+    return add_cache_headers(make_response(html), etag, private=True)
 
+
+def render_category_page(category: str, page: int, keys: list[str], total: int) -> str:
+    """Render a page of the articles with labels `keys` of a category with `total` articles."""
+    articles = current_app.meta_data[category]
     page_results = [
         Result(
             category=category,
@@ -171,16 +226,16 @@ def show_category_page(category: str):
                 'label': key,
             },
         )
-        for key in list(articles)[start:end]
+        for key in keys
     ]
 
     pagination = Pagination(
         page=page,
-        total=len(articles),
+        total=total,
         search=False,
         record_name=gettext('artikelen in categorie'),
         display_msg=gettext('<b>{start} - {end}</b> van <b>{total}</b> {record_name}'),
-        per_page=results_per_page,
+        per_page=current_app.config['MAX_WRAPPERS_PER_PAGE'],
         href='javascript:getCategoryData(\'' + category + '\',{0})',
         inner_window=1,
         outer_window=0,
@@ -207,20 +262,77 @@ def show_article_page(category: str, label: str):
     if errors:
         return render_template("article.html", errors=errors)
 
-    article = current_app.meta_data[category][label]['wrappers']
-    return render_template(
-        "article.html",
-        article=article,
-        meta_data_key_mapping=META_DATA_KEY_MAPPING,
-        endangerment_mapping=ENDANGERMENT_MAPPING,
-        errors=None,
+    etag = get_etag(current_app.app_version, current_app.data_version, get_locale(), request.full_path)
+    if is_not_modified(etag):
+        return add_cache_headers(Response(status=304), etag, private=True)
+
+    html = get_article_page(category, label)
+    return add_cache_headers(make_response(html), etag, private=True)
+
+
+def get_article_page(category: str, label: str) -> str:
+    """Get the rendered article page of a category and label in the current language from the page cache."""
+    return current_app.page_cache.get_or_compute(
+        ('article', category, label, get_locale(), current_app.data_version),
+        lambda: render_template(
+            "article.html",
+            article=current_app.meta_data[category][label]['wrappers'],
+            meta_data_key_mapping=META_DATA_KEY_MAPPING,
+            endangerment_mapping=ENDANGERMENT_MAPPING,
+            errors=None,
+        ),
     )
 
 
+def prerender_article_pages(app: Flask) -> int:
+    """
+    Render the article pages of all articles in all languages into the page cache of `app`, so that they are served
+    without rendering from the first request on.
+
+    :returns: the number of rendered pages
+    """
+    n_rendered = 0
+    for locale in app.config['LANGUAGES']:
+        with app.test_request_context(headers={'Cookie': f'locale={locale}'}):
+            for category, articles in app.meta_data.items():
+                for label in articles:
+                    get_article_page(category, label)
+                    n_rendered += 1
+    return n_rendered
+
+
 @results_page.route('/images/<path:filename>')
 def show_image(filename: str):
-    """Show the image of a specific firework wrapper."""
+    """
+    Show the image of a specific firework wrapper. If a `width` is requested, show its WebP thumbnail of the smallest
+    configured width of at least `width` pixels instead, or the image itself if that thumbnail has not been generated
+    (see `flask generate-thumbnails`). Images are looked up in `current_app.image_manifest`, whose content digests are
+    used as ETags, so that revalidated images are answered without reading them.
+    """
     if meta_data_dir := current_app.config.get("REFERENCE_DATA_DIR", None):
-        if pathlib.Path(filename).suffix in current_app.config["ALLOWED_EXTENSIONS"]:
-            return send_from_directory(meta_data_dir, filename)
+        image = current_app.image_manifest.get(filename)
+        if image and has_image_extension(filename, current_app.config["ALLOWED_EXTENSIONS"]):
+            widths, thumbnail = current_app.config.get('THUMBNAIL_WIDTHS'), None
+            if widths and (width := request.args.get('width', type=int)):
+                width = select_thumbnail_width(widths, width)
+                thumbnail = get_thumbnail(meta_data_dir, current_app.config['THUMBNAIL_DIR'], filename, width)
+            quality = current_app.config.get('THUMBNAIL_QUALITY', 80)
+            etag = f'{image.digest}-{width}w-q{quality}' if thumbnail else image.digest
+            if is_not_modified(etag):
+                return add_cache_headers(Response(status=304), etag)
+
+            if thumbnail:
+                response = send_file(thumbnail, mimetype='image/webp', etag=etag)
+            else:
+                response = send_from_directory(meta_data_dir, filename, etag=etag)
+            return add_cache_headers(response, etag)
     return abort(404)
+
+
+@results_page.app_template_filter('thumbnail_srcset')
+def thumbnail_srcset(filename: str) -> str:
+    """Build the `srcset` of an image, so that browsers request the thumbnail width matching the displayed size."""
+    return ', '.join(
+        f"{url_for('results.show_image', filename=filename, width=width)} {width}w"
+        for width in current_app.config.get('THUMBNAIL_WIDTHS') or ()
+    )
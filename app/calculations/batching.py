@@ -0,0 +1,150 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future
+from typing import Any, NamedTuple
+
+from app.metrics import collect_timings, get_timings
+
+
+class _Job(NamedTuple):
+    instances: Sequence[Any]
+    future: Future
+    single: bool  # whether the future gets the result of the single instance, rather than a list of results
+    timings: list | None  # the stage timings of the request that submitted the job
+    submitted: float
+
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler for model predictions. Concurrent requests are collected for at most `max_wait` seconds
+    (or until `max_batch_size` requests are collected) and are then handled with a single call to `predict_batch` in a
+    background thread. Since this thread is the only one running the model, no lock is needed around the model itself.
+    Several instances can also be submitted at once (see `submit_many`), which are always predicted in the same batch.
+    When the requests are timed (see `app.metrics`), the time an instance waited in the queue and the stages of the
+    prediction of its batch are added to the timings of its request.
+    """
+
+    def __init__(
+        self, predict_batch: Callable[[Sequence[Any]], Sequence[Any]], max_batch_size: int = 8, max_wait: float = 0.005
+    ):
+        """
+        Create an instance of BatchScheduler.
+
+        :param predict_batch: function making the predictions for a batch of instances, returning one result for each
+        :param max_batch_size: the maximum number of instances in a single batch
+        :param max_wait: the maximum time (in seconds) to wait for more instances after receiving the first one
+        """
+        if max_batch_size < 1:
+            raise ValueError('`max_batch_size` must be at least 1')
+
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, instance: Any) -> Future:
+        """Schedule a single (preprocessed) instance for prediction and return a future for its result."""
+        future = Future()
+        self._ensure_worker().put(_Job((instance,), future, True, get_timings(), time.perf_counter()))
+        return future
+
+    def submit_many(self, instances: Sequence[Any]) -> Future:
+        """
+        Schedule several (preprocessed) instances for prediction in the same batch, also if there are more than
+        `max_batch_size`, and return a future for the list of their results.
+        """
+        future = Future()
+        self._ensure_worker().put(_Job(tuple(instances), future, False, get_timings(), time.perf_counter()))
+        return future
+
+    def predict(self, instance: Any) -> Any:
+        """Schedule a single (preprocessed) instance for prediction and wait for its result."""
+        return self.submit(instance).result()
+
+    def _ensure_worker(self) -> queue.SimpleQueue:
+        """
+        Start the background thread on first use. Threads do not survive a fork, so the thread (and its queue) are
+        recreated when the scheduler is used from a new process, e.g. from a forked gunicorn worker. A thread which
+        stopped in the current process is restarted on the same queue, so that the jobs queued already are kept.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue, self._thread, self._pid = queue.SimpleQueue(), None, os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=_run, args=(weakref.ref(self), self._queue), daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _collect(self, first: _Job, pending: queue.SimpleQueue) -> list[_Job]:
+        """Collect the jobs arriving within `max_wait` seconds after the first one into a batch."""
+        batch = [first]
+        size = len(first.instances)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                job = pending.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += len(job.instances)
+        return batch
+
+    def _process(self, batch: list[_Job]):
+        """
+        Run the predictions for a batch and hand the results back to each of the waiting requests. Every request gets
+        either its results or an exception, also when handing back the results fails, so that no request waits forever.
+        """
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self._predict(batch)
+        except Exception as ex:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(ex)
+
+    def _predict(self, batch: list[_Job]):
+        start = time.perf_counter()
+        timings = [] if any(job.timings is not None for job in batch) else None
+        instances = [instance for job in batch for instance in job.instances]
+        with collect_timings(timings):
+            results = list(self.predict_batch(instances))
+        # the timings are added before the results are handed back, after which the requests read them
+        for job in batch:
+            if job.timings is not None:
+                job.timings.append(('queue', start - job.submitted))
+                job.timings.extend(timings)
+        if len(results) != len(instances):
+            raise ValueError(f'`predict_batch` returned {len(results)} results for {len(instances)} instances')
+        offset = 0
+        for job in batch:
+            job_results = results[offset : offset + len(job.instances)]
+            offset += len(job.instances)
+            job.future.set_result(job_results[0] if job.single else job_results)
+
+
+def _run(scheduler_ref: weakref.ref, pending: queue.SimpleQueue, poll_interval: float = 1.0):
+    """
+    Process the batches of a scheduler in the background thread. The thread only holds a weak reference to the
+    scheduler while waiting, so that the scheduler (and the model it uses) can be garbage collected, after which the
+    thread stops.
+    """
+    while True:
+        try:
+            first = pending.get(timeout=poll_interval)
+        except queue.Empty:
+            if scheduler_ref() is None:
+                return
+            continue
+        if (scheduler := scheduler_ref()) is None:
+            return
+        scheduler._process(scheduler._collect(first, pending))
+        del scheduler, first
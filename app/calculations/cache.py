@@ -1,7 +1,21 @@
+import os
+import sqlite3
+import struct
+import threading
+import time
 import uuid
+from collections.abc import Callable, Hashable, Sequence
+from concurrent.futures import Future
 from typing import Any
 
+import numpy as np
 from flask import current_app
+from lru import LRU
+
+from app.calculations.core import Results, ResultViews
+from app.metrics import timed
+
+RESULTS_CACHE_BACKENDS = ('memory', 'sqlite')
 
 
 def add_to_cache(value: Any) -> str:
@@ -12,3 +26,198 @@ def add_to_cache(value: Any) -> str:
 
 def get_from_cache(key: str) -> Any:
     return current_app.cache.get(key, None)
+
+
+class QueryCache:
+    """
+    Bounded LRU cache for the results of expensive computations for a query, keyed by the content of the query.
+    Concurrent requests for the same key share a single in-flight computation ("single-flight"), also when caching
+    is disabled (i.e. when `size` is 0).
+    """
+
+    def __init__(self, size: int):
+        self._cache = LRU(size) if size > 0 else None
+        self._in_flight: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Get the cached value for `key`, or wait for the in-flight computation or compute it otherwise."""
+        return self.get_or_compute_many([key], lambda _: [compute()])[0]
+
+    def get_or_compute_many(self, keys: Sequence[Hashable], compute: Callable[[list[int]], Sequence[Any]]) -> list[Any]:
+        """
+        Get the cached values for several `keys`, like `get_or_compute`. The values of all keys which are neither
+        cached nor in flight are computed with a single call of `compute` with their positions in `keys` (e.g. to
+        predict them in a single batch), which returns their values in the same order.
+        """
+        values, computed, shared = [None] * len(keys), {}, {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if self._cache is not None and key in self._cache:
+                    self.hits += 1
+                    values[i] = self._cache[key]
+                elif (future := self._in_flight.get(key)) is not None:
+                    self.shared += 1
+                    shared[i] = future
+                else:
+                    self.misses += 1
+                    computed[i] = self._in_flight[key] = Future()
+
+        if computed:
+            for i, value in zip(computed, self._compute(keys, computed, compute)):
+                values[i] = value
+        if shared:
+            with timed('cache_wait'):
+                for i, future in shared.items():
+                    values[i] = future.result()
+        return values
+
+    def _compute(
+        self, keys: Sequence[Hashable], computed: dict[int, Future], compute: Callable[[list[int]], Sequence[Any]]
+    ) -> list[Any]:
+        """Compute the values of the `computed` positions in `keys`, and hand them to the requests sharing them."""
+        try:
+            results = list(compute(list(computed)))
+            if len(results) != len(computed):
+                raise ValueError(f'{len(results)} values were computed for {len(computed)} keys')
+        except Exception as ex:
+            with self._lock:
+                for i in computed:
+                    del self._in_flight[keys[i]]
+            for future in computed.values():
+                future.set_exception(ex)
+            raise
+        with self._lock:
+            for i, value in zip(computed, results):
+                if self._cache is not None:
+                    self._cache[keys[i]] = value
+                del self._in_flight[keys[i]]
+        for future, value in zip(computed.values(), results):
+            future.set_result(value)
+        return results
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """The number of cache hits, misses and requests that shared an in-flight computation."""
+        return {'hits': self.hits, 'misses': self.misses, 'shared': self.shared}
+
+
+class ResultsSerializer:
+    """
+    Compact binary serialization of cached values. Search results (see `ResultViews`) are stored as their arrays of
+    label positions and scores (and the precomputed views), together with the version of the meta-data the positions
+    refer to. Other values are not supported, so that nothing in the (shared) cache file is ever unpickled.
+    """
+
+    def __init__(self, version: str):
+        """
+        Create an instance of ResultsSerializer.
+
+        :param version: identifier of the meta-data, results stored for other meta-data are not loaded
+        """
+        self.version = version.encode()
+
+    def dumps(self, value: ResultViews) -> bytes:
+        if not isinstance(value, ResultViews):
+            raise TypeError(f'Cannot serialize a {type(value).__name__}, only search results are cached')
+        arrays = (
+            value.results.indices,
+            value.results.scores,
+            value.groups,
+            value.category_rows,
+            value.category_offsets,
+            value.counts,
+            value.tail_categories,
+        )
+        lengths = (len(array) for array in arrays)
+        header = b'V' + struct.pack('<HI7I', len(self.version), value.results.ranked, *lengths) + self.version
+        return header + b''.join(array.tobytes() for array in arrays)
+
+    def loads(self, data: bytes) -> ResultViews | None:
+        """
+        Load serialized search results, or return None (a cache miss) if they refer to labels of other meta-data, or
+        were written in another format.
+        """
+        if data[:1] != b'V':
+            return None
+
+        version_length, ranked, *lengths = struct.unpack_from('<HI7I', data, 1)
+        offset = 1 + struct.calcsize('<HI7I') + version_length
+        if data[offset - version_length : offset] != self.version:
+            return None
+        arrays = []
+        # all arrays hold 4-byte values: int32, except for the scores
+        for length, dtype in zip(lengths, (np.int32, np.float32, *[np.int32] * 5)):
+            arrays.append(np.frombuffer(data, dtype=dtype, count=length, offset=offset))
+            offset += 4 * length
+        indices, scores, *views = arrays
+        return ResultViews(Results(indices, scores, ranked), *views)
+
+
+class SQLiteCache:
+    """
+    Cache stored in a SQLite database on the local machine, which is shared by all worker processes and survives
+    restarts. Entries expire `ttl` seconds after they are stored, and the oldest entries are removed when the
+    serialized entries exceed `max_bytes`. Like `lru.LRU`, it supports `cache[key] = value` and `cache.get(key)`.
+    """
+
+    def __init__(self, path: str, serializer: ResultsSerializer, ttl: float = 24 * 60 * 60, max_bytes: int = 1 << 28):
+        """
+        Create an instance of SQLiteCache.
+
+        :param path: the path of the SQLite database, which is created if it does not exist
+        :param serializer: the serializer for the cached values
+        :param ttl: the number of seconds after which entries expire
+        :param max_bytes: the maximum total size of the serialized entries
+        """
+        self.path = path
+        self.serializer = serializer
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread, since connections cannot be shared by threads or processes."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10)
+            # write-ahead logging, so that readers and writers in other processes do not block each other
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = (
+            self._connection()
+            .execute('SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time()))
+            .fetchone()
+        )
+        if row is None or (value := self.serializer.loads(row[0])) is None:
+            return default
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        data = self.serializer.dumps(value)
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, size, expires) VALUES (?, ?, ?, ?)',
+                (key, data, len(data), now + self.ttl),
+            )
+            # remove the oldest entries exceeding the byte budget
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM '
+                '(SELECT key, SUM(size) OVER (ORDER BY expires DESC, rowid DESC) AS total FROM cache) WHERE total > ?)',
+                (self.max_bytes,),
+            )
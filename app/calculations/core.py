@@ -1,14 +1,16 @@
-import threading
-from collections.abc import Mapping
-from functools import cache
+import hashlib
+import os
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, NamedTuple
 
+import numpy as np
 from flask import current_app
 
-from app.calculations.models.utils import convert_bytes_to_pil_image, convert_pil_image_to_numpy
-from app.requests.validate import process_query_text
-
-LOCK = threading.Lock()
+from app.calculations.models import Prediction
+from app.calculations.models.utils import convert_pil_image_to_numpy, decode_pil_image
+from app.metrics import timed
+from app.requests.validate import QueryImage, process_query_text
 
 
 class Result(NamedTuple):
@@ -18,9 +20,197 @@ class Result(NamedTuple):
     meta: Mapping[str, Any] = None
 
 
+class Results:
+    """
+    Search results stored column-wise: the positions of the labels in the `LabelTable` (int32) and their scores
+    (float32), in the order of the results. `Result` objects are only created for the results that are shown (see
+    `LabelTable.materialize`). The results can be partially ranked (see `sorted`): only the first `ranked` results are
+    in their final order, the others all have a lower (or the same) score, but keep the order they had before sorting.
+    """
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray | None = None, ranked: int | None = None):
+        """
+        Create an instance of Results.
+
+        :param indices: the positions of the labels in the `LabelTable`
+        :param scores: the scores of the labels, defaults to a score of 1 for all labels
+        :param ranked: the number of leading results in their final order, defaults to all results
+        """
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.scores = np.ones(len(self.indices), dtype=np.float32) if scores is None else np.asarray(scores, np.float32)
+        self.ranked = len(self.indices) if ranked is None else ranked
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, item: slice | np.ndarray) -> 'Results':
+        if isinstance(item, np.ndarray) and item.dtype == bool:
+            # filtering keeps the order of the results, and so the ranked results
+            return Results(self.indices[item], self.scores[item], int(np.count_nonzero(item[: self.ranked])))
+        return Results(self.indices[item], self.scores[item])
+
+    def sorted(self, top_k: int | None = None) -> 'Results':
+        """
+        Sort the results on descending score (stable, so results with the same score keep their order). If `top_k` is
+        given, only the first `top_k` results are ranked, after selecting them with a partition of the scores, which
+        is linear in the number of results.
+        """
+        if not top_k or top_k >= len(self):
+            return self[np.argsort(-self.scores, kind='stable')]
+
+        # select the results with a higher score than the top_k-th score, and the first results with the same score
+        threshold = np.partition(self.scores, len(self) - top_k)[len(self) - top_k]
+        higher = self.scores > threshold
+        same = self.scores == threshold
+        top = higher | same & (np.cumsum(same) <= top_k - np.count_nonzero(higher))
+        rows = np.flatnonzero(top)
+        rows = np.concatenate([rows[np.argsort(-self.scores[rows], kind='stable')], np.flatnonzero(~top)])
+        return Results(self.indices[rows], self.scores[rows], ranked=top_k)
+
+
+class LabelTable:
+    """
+    The (category, label) of all articles, in the order of the meta-data (which is also the order of the labels of
+    `TextIndex.from_meta_data`), and the category of every label as an integer code.
+    """
+
+    def __init__(self, labels: Sequence[tuple[str, str]]):
+        """
+        Create an instance of LabelTable.
+
+        :param labels: the (category, label) of all articles
+        """
+        self.labels = tuple(labels)
+        self.positions = {label: i for i, label in enumerate(self.labels)}
+        category_names, categories = np.unique([category for category, _ in self.labels], return_inverse=True)
+        self.category_codes = {category: i for i, category in enumerate(category_names.tolist())}
+        self.categories = categories.astype(np.int32)
+        # the positions of the labels of the last seen model, which returns the same labels for every prediction
+        self._prediction_indices = ((), np.empty(0, dtype=np.int32))
+
+    @classmethod
+    def from_meta_data(cls, meta_data: Mapping[str, Mapping[str, Any]]) -> 'LabelTable':
+        return cls([(category, label) for category, articles in meta_data.items() for label in articles])
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def from_prediction(self, prediction: Prediction) -> Results:
+        """Get the (unsorted) results of a model prediction, leaving out labels which are not in the table."""
+        labels, indices = self._prediction_indices
+        if prediction.labels is not labels:
+            indices = np.fromiter((self.positions.get(label, -1) for label in prediction.labels), dtype=np.int32)
+            self._prediction_indices = (prediction.labels, indices)
+        known = indices >= 0
+        return Results(indices[known], np.asarray(prediction.scores)[known])
+
+    def materialize(self, results: Results) -> list[Result]:
+        """Create the `Result` objects for (a page of) the results."""
+        return [
+            Result(category=self.labels[i][0], label=self.labels[i][1], score=score)
+            for i, score in zip(results.indices.tolist(), results.scores.tolist())
+        ]
+
+
+class ResultViews:
+    """
+    The views of the search results shown by the results and category pages, which are computed once when the results
+    are cached, so that showing a page only takes a slice of the size of the page. Of partially ranked results (see
+    `Results.sorted`), the first result of every category is still found exactly, but the results of a category
+    beyond its ranked results are only ranked when a page needs them.
+    """
+
+    def __init__(
+        self,
+        results: Results,
+        groups: np.ndarray,
+        category_rows: np.ndarray,
+        category_offsets: np.ndarray,
+        counts: np.ndarray | None = None,
+        tail_categories: np.ndarray | None = None,
+    ):
+        """
+        Create an instance of ResultViews, see `from_results`.
+
+        :param results: the search results
+        :param groups: the rows of the first result of every category, in the order of the results
+        :param category_rows: the rows of the ranked results ordered by category code, and by rank within each category
+        :param category_offsets: the start of the rows of every category code in `category_rows`
+        :param counts: the number of results of every category code, defaults to the number of ranked results
+        :param tail_categories: the category codes of the results which are not ranked
+        """
+        self.results = results
+        self.groups = np.asarray(groups, dtype=np.int32)
+        self.category_rows = np.asarray(category_rows, dtype=np.int32)
+        self.category_offsets = np.asarray(category_offsets, dtype=np.int32)
+        self.counts = np.diff(self.category_offsets) if counts is None else np.asarray(counts, dtype=np.int32)
+        self.tail_categories = np.asarray(() if tail_categories is None else tail_categories, dtype=np.int32)
+        # the rows of the results of a category which are not ranked, ranked when a page of the category needs them
+        self._tail_rows = {}
+
+    @classmethod
+    def from_results(cls, results: Results, labels: LabelTable) -> 'ResultViews':
+        categories = labels.categories[results.indices]
+        ranked, tail = categories[: results.ranked], categories[results.ranked :]
+        _, first = np.unique(ranked, return_index=True)
+        n_categories = len(labels.category_codes)
+        ranked_counts = np.bincount(ranked, minlength=n_categories)
+        counts = ranked_counts + np.bincount(tail, minlength=n_categories)
+        groups = np.sort(first)
+        if len(tail):
+            # the first result of a category without ranked results is its result with the highest score, or the
+            # first of those with the same score, since the results which are not ranked keep their order
+            scores = results.scores[results.ranked :]
+            best = np.full(n_categories, -np.inf, dtype=np.float32)
+            np.maximum.at(best, tail, scores)
+            candidates = np.flatnonzero((ranked_counts[tail] == 0) & (scores == best[tail]))
+            _, first = np.unique(tail[candidates], return_index=True)
+            tail_groups = np.sort(candidates[first])
+            tail_groups = tail_groups[np.argsort(-scores[tail_groups], kind='stable')] + results.ranked
+            groups = np.concatenate([groups, tail_groups])
+        return cls(
+            results,
+            groups=groups,
+            category_rows=np.argsort(ranked, kind='stable'),
+            category_offsets=np.concatenate([[0], np.cumsum(ranked_counts)]),
+            counts=counts,
+            tail_categories=tail,
+        )
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def count(self, category_code: int) -> int:
+        """Get the number of results in a category."""
+        return int(self.counts[category_code])
+
+    def grouped(self, start: int, end: int) -> Results:
+        """Get the first result of the categories `start` up to `end`, in the order of the results."""
+        return self.results[self.groups[start:end]]
+
+    def in_category(self, category_code: int, start: int = 0, end: int | None = None) -> Results:
+        """Get the results `start` up to `end` within a category."""
+        offset, stop = self.category_offsets[category_code : category_code + 2]
+        end = self.count(category_code) if end is None else min(end, self.count(category_code))
+        if end <= stop - offset:
+            return self.results[self.category_rows[offset + start : offset + end]]
+        rows = np.concatenate([self.category_rows[offset:stop], self._rank_tail(category_code)])
+        return self.results[rows[start:end]]
+
+    def _rank_tail(self, category_code: int) -> np.ndarray:
+        """Rank the results of a category which are not ranked yet."""
+        if (rows := self._tail_rows.get(category_code)) is None:
+            rows = np.flatnonzero(self.tail_categories == category_code) + self.results.ranked
+            rows = self._tail_rows[category_code] = rows[np.argsort(-self.results.scores[rows], kind='stable')]
+        return rows
+
+
 def get_search_results(
-    query_image: bytes | None, query_text: str | None, text_filter: bool = False, include_digits: bool = False
-) -> tuple[list[Result], list[str]]:
+    query_image: QueryImage | None,
+    query_text: str | None,
+    text_filter: bool = False,
+    include_digits: bool = False,
+) -> tuple[Results, list[str]]:
     """
     Get the search results for a given query image and query text. If a query image is provided, sort the results based
     on the model predictions. Else, if a query_text is provided, sort based on the presence of the entire query text on
@@ -43,68 +233,130 @@ def get_search_results(
 
     # filter on presence query_text tokens
     if text_filter and query_text:
-        results = filter_results(query_text, results)
+        with timed('filter'):
+            results = filter_results(query_text, results)
     return results, errors
 
 
-def filter_results(query_text: str, results: list[Result]) -> list[Result]:
+def get_batch_search_results(
+    query_images: Sequence[QueryImage],
+    query_texts: Sequence[str | None],
+    text_filter: bool = False,
+    include_digits: bool = False,
+    fuse: bool = False,
+) -> tuple[list[Results], list[str]]:
+    """
+    Get the search results for several query images, e.g. photos of the snippets of a single case, each with an
+    optional query text, which are predicted together in a single batch. Like `get_search_results`, the results of
+    every image are sorted on their scores, and are filtered on its query text if text_filter is True. If `fuse` is
+    True, a single list of results is returned instead, sorted on the mean score over all images, and filtered on the
+    tokens of all query texts.
+
+    :returns: the results of every image (or the fused results), and the errors of the query texts
+    """
+    errors = []
+    texts = []
+    for query_text in query_texts:
+        text, error = process_query_text(query_text=query_text, include_digits=include_digits)
+        errors.extend(error)
+        texts.append(text)
+
+    predictions = get_batch_model_predictions(images=query_images)
+    top_k = current_app.config.get('RESULTS_TOP_K')
+    with timed('sort'):
+        if fuse:
+            # all predictions are of the same labels, so their scores are aligned
+            scores = np.mean([prediction.scores for prediction in predictions], axis=0)
+            results = [Results(predictions[0].indices, scores).sorted(top_k=top_k)]
+            texts = [' '.join(text for text in texts if text)]
+        else:
+            results = [prediction.sorted(top_k=top_k) for prediction in predictions]
+
+    if text_filter:
+        with timed('filter'):
+            results = [filter_results(text, result) if text else result for text, result in zip(texts, results)]
+    return results, errors
+
+
+def filter_results(query_text: str, results: Results) -> Results:
     """Filter the results based on the presence of all individual tokens of the query text in the wrapper text."""
-    tokens = query_text.split(' ')
-    results = [
-        result
-        for result in results
-        if all(token in current_app.meta_data[result.category][result.label]['wrappers']['text'] for token in tokens)
-    ]
-    return results
+    mask = current_app.text_index.contains_all(query_text.split(' '))
+    return results[mask[results.indices]]
 
 
-def get_sorted_results_by_image(query_image: bytes) -> list[Result]:
+def get_sorted_results_by_image(query_image: QueryImage) -> Results:
     """Get the results sorted by classification score. Here it is assumed that `query_image` is a verified image."""
-    # get the model predictions for a query image
     predictions = get_model_predictions(image=query_image)
-    # use the predicted scores
-    classification_scores = tuple(
-        Result(category=category, label=label, score=score) for (category, label), score in predictions.items()
-    )
-    # sort on descending scores
-    classification_scores = sorted(classification_scores, key=lambda item: item.score, reverse=True)
-    return classification_scores
+    with timed('sort'):
+        return predictions.sorted(top_k=current_app.config.get('RESULTS_TOP_K'))
 
 
-def get_sorted_results_by_query_text(query_text: str) -> list[Result]:
+def get_sorted_results_by_query_text(query_text: str) -> Results:
     """Get the results sorted by the presence of the complete query text in the wrapper text."""
-    results = get_unsorted_results()
-    return list(
-        sorted(
-            results,
-            key=lambda x: query_text in current_app.meta_data[x.category][x.label]['wrappers']['text'],
-            reverse=True,
-        )
-    )
+    with timed('sort'):
+        mask = current_app.text_index.contains(query_text)
+        # a stable sort, so the order within the matching and non-matching results is unchanged
+        return Results(np.argsort(~mask, kind='stable'))
 
 
-@cache
-def get_unsorted_results() -> list[Result]:
+def get_unsorted_results() -> Results:
     """Return all unsorted entries with score = 1."""
-    return [
-        Result(category=category, label=label, score=1)
-        for category, data in current_app.meta_data.items()
-        for label in data
-    ]
+    return Results(np.arange(len(current_app.labels)))
+
+
+def get_model_predictions(image: QueryImage) -> Results:
+    """
+    Get the predictions for a single (validated) image using the model stored in `current_app.model`. The predictions
+    are cached in `current_app.query_cache` by the hash of the raw image data, and the model and data version, so that
+    identical (and concurrent) uploads are only computed once.
 
+    :param image: the image to get the prediction(s) for
+    :returns: the (unsorted) predicted scores of the labels for the image
+    """
+    prediction = current_app.query_cache.get_or_compute(_get_query_key(image), lambda: _predict(image))
+    return current_app.labels.from_prediction(prediction)
+
+
+def get_batch_model_predictions(images: Sequence[QueryImage]) -> list[Results]:
+    """
+    Get the predictions for several (validated) images. Like for single images (see `get_model_predictions`), the
+    predictions are cached in `current_app.query_cache`, and the images which are not cached are decoded and
+    preprocessed in parallel, and embedded and scored by `current_app.scheduler` in a single batch.
 
-def get_model_predictions(image: bytes) -> Mapping[str, float]:
+    :param images: the images to get the predictions for
+    :returns: the (unsorted) predicted scores of the labels for every image
     """
-    Get the predictions for a single image stored in raw bytes format using the model stored in `current_app.model`.
+    model = current_app.model
 
-    :param image: the raw image to get the prediction(s) for
-    :returns: a mapping of labels -> predicted scores for the image
+    def preprocess(image: QueryImage):
+        pil_image = decode_pil_image(image.image, size=model.input_size)
+        return model.preprocess(convert_pil_image_to_numpy(pil_image))
+
+    def predict(positions: list[int]) -> list[Prediction]:
+        with timed('preprocess'), ThreadPoolExecutor(max_workers=min(len(positions), os.cpu_count() or 1)) as executor:
+            instances = list(executor.map(preprocess, [images[i] for i in positions]))
+        return current_app.scheduler.submit_many(instances).result()
+
+    keys = [_get_query_key(image) for image in images]
+    predictions = current_app.query_cache.get_or_compute_many(keys, predict)
+    return [current_app.labels.from_prediction(prediction) for prediction in predictions]
+
+
+def _get_query_key(image: QueryImage) -> tuple[str, str, str]:
+    """Get the key of the predictions for an image: the hash of the raw image data, and the model and data version."""
+    return hashlib.sha256(image.data).hexdigest(), current_app.model_version, current_app.data_version
+
+
+def _predict(image: QueryImage) -> Prediction:
+    """
+    Decode and preprocess the image (which was opened while validating the request) in the calling thread, after which
+    the model prediction is made by `current_app.scheduler`, possibly batched together with concurrent requests.
     """
-    with LOCK:
-        model = current_app.model
-        image = convert_pil_image_to_numpy(convert_bytes_to_pil_image(image))
-        predictions = model.predict(instance=image)
-        return predictions
+    with timed('decode'):
+        pil_image = decode_pil_image(image.image, size=current_app.model.input_size)
+    with timed('preprocess'):
+        instance = current_app.model.preprocess(convert_pil_image_to_numpy(pil_image))
+    return current_app.scheduler.predict(instance)
 
 
 def filter_articles_in_category_on_text(
@@ -118,9 +370,6 @@ def filter_articles_in_category_on_text(
     :param query_text: the text on the image which is assumed to be sanitized by app.requests.validate.clean_text.
     :returns: a filtered dictionary containing only items that match the query text.
     """
-    tokens = query_text.split(' ')
-    return {
-        label: articles[label]
-        for label in articles
-        if all(token in current_app.meta_data[category][label]['wrappers']['text'] for token in tokens)
-    }
+    mask = current_app.text_index.contains_all(query_text.split(' '))
+    positions = current_app.text_index.positions
+    return {label: articles[label] for label in articles if mask[positions[category, label]]}
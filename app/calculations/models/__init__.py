@@ -1,5 +1,14 @@
-from app.calculations.models.base import ClassificationModel, EmbeddingModel
+from app.calculations.models.base import ClassificationModel, EmbeddingModel, Prediction
 from app.calculations.models.embedding import ViTEmbeddingModel, ViTModelConfig
 from app.calculations.models.embedding_classifier import EmbeddingClassifier
+from app.calculations.models.index import IVFIndex
 
-__all__ = ("ClassificationModel", "EmbeddingModel", "EmbeddingClassifier", "ViTEmbeddingModel", "ViTModelConfig")
+__all__ = (
+    "ClassificationModel",
+    "EmbeddingModel",
+    "EmbeddingClassifier",
+    "IVFIndex",
+    "Prediction",
+    "ViTEmbeddingModel",
+    "ViTModelConfig",
+)
@@ -0,0 +1,83 @@
+import time
+from collections.abc import Callable
+from typing import NamedTuple
+
+import numpy as np
+import torch
+from torch import nn
+
+from app.calculations.models.base import EmbeddingModel
+
+# 'float32' runs the model as trained, 'int8-dynamic' quantizes the weights of all linear layers (i.e. those of the
+# ViT encoder and the projector) to int8 and quantizes their activations dynamically, which is faster on CPU
+INFERENCE_BACKENDS = ('float32', 'int8-dynamic')
+
+
+class BackendComparison(NamedTuple):
+    min_similarity: float
+    mean_similarity: float
+    top_k_agreement: float
+    reference_latency: float
+    latency: float
+
+
+def apply_inference_backend(model: EmbeddingModel, backend: str) -> EmbeddingModel:
+    """
+    Prepare a (loaded) embedding model for inference with the given backend. The model is modified in place.
+
+    :param model: the float32 embedding model, after loading its weights
+    :param backend: one of `INFERENCE_BACKENDS`
+    :returns: the model to use for inference
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f'inference backend must be one of {", ".join(INFERENCE_BACKENDS)}')
+    if backend == 'int8-dynamic':
+        return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def compare_backends(
+    reference: EmbeddingModel,
+    candidate: EmbeddingModel,
+    inputs: torch.Tensor,
+    score: Callable[[np.ndarray], np.ndarray],
+    top_k: int = 10,
+) -> BackendComparison:
+    """
+    Compare the embeddings of a candidate model (e.g. a quantized model) with those of the reference float32 model,
+    and the top-k labels ranked on these embeddings.
+
+    :param reference: the reference embedding model
+    :param candidate: the embedding model to compare with the reference model
+    :param inputs: a batch of preprocessed (reference) images
+    :param score: function scoring a batch of embeddings against all labels, e.g. `EmbeddingClassifier.score`
+    :param top_k: the number of best labels to compare
+    :returns: the (minimum and mean) cosine similarities between the embeddings of both models, the fraction of the
+        top-k labels of the reference model that is also in the top-k labels of the candidate model, and the latency
+        (in milliseconds) of embedding the batch with both models
+    """
+    embeddings, latencies = [], []
+    with torch.no_grad():
+        for model in (reference, candidate):
+            model.eval().embed(inputs[:1])  # warm-up
+            start = time.perf_counter()
+            embeddings.append(model.embed(inputs).cpu().numpy())
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    reference_embeddings, candidate_embeddings = embeddings
+    similarities = np.sum(_normalize(reference_embeddings) * _normalize(candidate_embeddings), axis=-1)
+    reference_top, candidate_top = (
+        np.argsort(-score(e), axis=-1, kind='stable')[:, :top_k] for e in (reference_embeddings, candidate_embeddings)
+    )
+    agreement = np.mean([len(np.intersect1d(r, c)) / len(r) for r, c in zip(reference_top, candidate_top)])
+    return BackendComparison(
+        min_similarity=float(similarities.min()),
+        mean_similarity=float(similarities.mean()),
+        top_k_agreement=float(agreement),
+        reference_latency=latencies[0],
+        latency=latencies[1],
+    )
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), np.finfo(np.float32).tiny)
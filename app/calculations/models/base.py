@@ -1,11 +1,22 @@
 import os
 from abc import ABC, abstractmethod
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping, Sequence
+from typing import Any, NamedTuple
 
 import numpy as np
 import torch
 
 
+class Prediction(NamedTuple):
+    labels: tuple
+    scores: np.ndarray
+    embedding: np.ndarray | None = None
+
+    def as_dict(self) -> dict[Any, float]:
+        """Get the prediction as a mapping between labels and scores."""
+        return dict(zip(self.labels, self.scores.tolist()))
+
+
 class ClassificationModel(ABC):
     """
     Abstract base class that specifies the interface all classification models must adhere to.
@@ -21,11 +32,58 @@ class ClassificationModel(ABC):
         """
         raise NotImplementedError
 
+    def preprocess(self, instance: np.ndarray) -> Any:
+        """
+        Convert a single image instance into the input expected by `predict_batch`. By default, the instance itself
+        is used as input.
+        """
+        return instance
+
+    def get_preprocessor(self) -> Callable[[np.ndarray], Any]:
+        """
+        Get a picklable function doing the same as `preprocess`, which does not hold the model itself, so that the
+        instances can be preprocessed in another process than the one running the model.
+        """
+        raise NotImplementedError(f'{type(self).__name__} cannot preprocess instances in another process')
+
+    def predict_batch(self, instances: Sequence[Any]) -> list[Prediction]:
+        """
+        Make predictions for a batch of preprocessed instances (see `preprocess`). By default, `predict` is called for
+        every instance separately.
+
+        :param instances: The preprocessed instances to make predictions for
+        :returns: The model predictions, holding the labels and their scores (and optionally the embedding of the
+            instance), for every instance
+        """
+        predictions = []
+        for instance in instances:
+            scores = self.predict(instance)
+            predictions.append(Prediction(labels=tuple(scores), scores=np.fromiter(scores.values(), dtype=np.float64)))
+        return predictions
+
+    @property
+    def input_size(self) -> int | None:
+        """The size of the (square) model input, or None if the model accepts images of any size."""
+        return None
+
 
 class EmbeddingModel(ABC, torch.nn.Module):
+    def forward(self, images: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """Implement the forward pass of the model: preprocess the raw images and embed them."""
+        return self.embed(self.preprocess(images))
+
+    @abstractmethod
+    def preprocess(self, images: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """Convert the raw images into a batch of model inputs."""
+        raise NotImplementedError
+
+    def get_preprocessor(self) -> Callable[[np.ndarray | torch.Tensor], torch.Tensor]:
+        """Get a picklable function doing the same as `preprocess`, which does not hold the weights of the model."""
+        raise NotImplementedError(f'{type(self).__name__} cannot preprocess images in another process')
+
     @abstractmethod
-    def forward(self, images: torch.Tensor) -> torch.Tensor:
-        """Implement the forward pass of the model."""
+    def embed(self, inputs: torch.Tensor) -> torch.Tensor:
+        """Compute the embeddings for a batch of preprocessed model inputs."""
         raise NotImplementedError
 
     def load(self, path: str, device: str = 'cpu'):
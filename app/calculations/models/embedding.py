@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 import torch
 import torch.nn.functional as F  # noqa: N812
@@ -58,10 +60,16 @@ class ViTEmbeddingModel(EmbeddingModel):
         # update input size
         self.processor.size = {'height': self.config.image_size, 'width': self.config.image_size}
 
-    def forward(self, images: np.ndarray | torch.Tensor) -> torch.Tensor:
-        """Forward pass."""
-        inputs = self.processor(images, return_tensors="pt").to(self.config.device)
-        outputs = self.vit(**inputs)
+    def preprocess(self, images: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """Resize and normalize the raw images into a batch of pixel values."""
+        return _preprocess(self.processor, images)
+
+    def get_preprocessor(self) -> functools.partial:
+        return functools.partial(_preprocess, self.processor)
+
+    def embed(self, inputs: torch.Tensor) -> torch.Tensor:
+        """Compute the embeddings for a batch of pixel values."""
+        outputs = self.vit(pixel_values=inputs.to(self.config.device))
         if self.config.add_pooling_layer:
             # option 1: feed the (non-linear) pooler output to the linear layer
             embedding = outputs.pooler_output
@@ -80,3 +88,7 @@ class ViTEmbeddingModel(EmbeddingModel):
     @property
     def embedding_size(self) -> int:
         return self.config.embedding_size
+
+
+def _preprocess(processor: ViTImageProcessor, images: np.ndarray | torch.Tensor) -> torch.Tensor:
+    return processor(images, return_tensors="pt")["pixel_values"]
@@ -1,11 +1,23 @@
-from collections import defaultdict
-from collections.abc import Mapping
+import os
+from collections.abc import Callable, Mapping, Sequence
 
 import numpy as np
-from scipy.spatial.distance import cdist
-from torch import no_grad
+import torch
 
-from app.calculations.models.base import ClassificationModel, EmbeddingModel
+from app.calculations.models.base import ClassificationModel, EmbeddingModel, Prediction
+from app.calculations.models.index import ANN_INDEX_FILENAME, IVFIndex, get_index_key
+from app.metrics import timed
+
+# aggregators that can be evaluated as a segmented reduction (`ufunc.reduceat`) over all labels at once, mapped to
+# the reducing ufunc and whether the reduced values have to be divided by the number of embeddings per label
+SEGMENTED_AGGREGATORS = {
+    np.min: (np.minimum, False),
+    np.amin: (np.minimum, False),
+    np.max: (np.maximum, False),
+    np.amax: (np.maximum, False),
+    np.sum: (np.add, False),
+    np.mean: (np.add, True),
+}
 
 
 class EmbeddingClassifier(ClassificationModel):
@@ -13,7 +25,11 @@ class EmbeddingClassifier(ClassificationModel):
         self,
         model: EmbeddingModel,
         metric: str = 'cosine',
-        class_aggregator: np.ufunc = np.min,
+        class_aggregator: Callable[..., np.ndarray] = np.min,
+        n_lists: int = 0,
+        n_probe: int = 8,
+        top_k: int = 50,
+        index_dir: str | None = None,
     ):
         """
         Create an instance of EmbeddingClassifier.
@@ -22,45 +38,223 @@ class EmbeddingClassifier(ClassificationModel):
         :param metric: The metric used for computing the distances between the embeddings. Possible values are
             'euclidean' or 'cosine'
         :param class_aggregator: A numpy function for aggregating the distances per class (i.e. np.min or np.mean etc.)
+        :param n_lists: The number of lists of the approximate nearest-neighbour index over the reference embeddings,
+            or 0 to always score all reference embeddings exactly
+        :param n_probe: The number of lists of the index to search for every query (trading recall for latency)
+        :param top_k: The number of candidate labels found with the index that are scored exactly. The scores of the
+            other labels are approximated by the distances to their mean reference embeddings
+        :param index_dir: Directory in which the index is persisted (and loaded from, if it is still valid)
         """
         if not model:
             raise ValueError('`EmbeddingClassifierModel` requires an embedding model')
         if metric not in ('cosine', 'euclidean'):
             raise ValueError('metric must be one of "cosine" or "euclidean"')
+        if n_lists and (n_probe < 1 or top_k < 1):
+            raise ValueError('`n_probe` and `top_k` must be at least 1')
 
         self.model = model
         self.metric = metric
         self.class_aggregator = class_aggregator
-        self.reference_embeddings = None
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.top_k = top_k
+        self.index_dir = index_dir
+        self.index = None
+        # the reference embeddings of all labels are stored in a single contiguous matrix, where the embeddings of
+        # label `labels[i]` are the rows `reference_matrix[label_offsets[i]:label_offsets[i + 1]]`
+        self.labels = ()
+        self.reference_matrix = None
+        self.reference_norms = None
+        self.label_offsets = None
+        self.row_labels = None
+        # the mean reference embedding of every label, which approximates the labels outside the probed lists
+        self.label_means = None
+        self.label_mean_norms = None
         self.model.eval()
 
     def predict(self, instance: np.ndarray) -> dict[tuple[str, str], float]:
         """Predict the labels for a single instance."""
-        if not self.reference_embeddings:
+        return self.predict_batch([self.preprocess(instance)])[0].as_dict()
+
+    def preprocess(self, instance: np.ndarray) -> torch.Tensor:
+        """Convert a single image instance into the model inputs of the embedding model."""
+        return self.model.preprocess(instance)
+
+    def get_preprocessor(self) -> Callable[[np.ndarray], torch.Tensor]:
+        return self.model.get_preprocessor()
+
+    @property
+    def input_size(self) -> int:
+        return self.model.input_size
+
+    def predict_batch(self, instances: Sequence[torch.Tensor]) -> list[Prediction]:
+        """Predict the labels for a batch of preprocessed instances with a single forward pass."""
+        if self.reference_matrix is None:
             raise ValueError('Reference embeddings are not set.')
 
-        with no_grad():
+        with torch.no_grad(), timed('forward'):
             # compute the embeddings for the input batch
-            val_embeddings = self.model(instance).cpu().numpy()
-        scores = []
-        for category, label in self.reference_embeddings:
-            # compute the distances between the query embedding and the reference embeddings for this label
-            # TODO: benchmark this against cdist() on all embeddings at the same time
-            dists = cdist(val_embeddings, self.reference_embeddings[(category, label)], metric=self.metric)
-            scores.extend(self.class_aggregator(dists, axis=-1))
+            val_embeddings = self.model.embed(torch.cat(list(instances))).cpu().numpy()
+        with timed('score'):
+            scores = self.score(val_embeddings)
+
+        # return the predicted scores, together with the query embeddings
+        return [
+            Prediction(labels=self.labels, scores=instance_scores, embedding=embedding)
+            for instance_scores, embedding in zip(scores, val_embeddings)
+        ]
 
-        scores = np.asarray(scores)
-        scores = 1 - scores / 2.0  # ensure 0. <= scores <= 1.
+    def score(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Score query embeddings against the reference embeddings of every label.
 
-        # return the predicted scores
-        return dict(zip(tuple(self.reference_embeddings), scores.tolist()))
+        :param embeddings: the query embeddings, with shape (n_queries, embedding_size)
+        :returns: the scores with shape (n_queries, n_labels), ordered as `self.labels`, with 0. <= scores <= 1.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if self.index is None:
+            distances = self._exact_distances(queries)
+        else:
+            distances = np.stack([self._approximate_distances(query) for query in queries])
+        return 1 - distances / 2.0  # ensure 0. <= scores <= 1.
+
+    def _exact_distances(self, queries: np.ndarray) -> np.ndarray:
+        """Compute the distances per label between the queries and all reference embeddings with a single matmul."""
+        distances = self._distances(queries, self.reference_matrix, self.reference_norms)
+        return self._aggregate(distances, self.label_offsets)
+
+    def _approximate_distances(self, query: np.ndarray) -> np.ndarray:
+        """
+        Compute the distances per label for a single query with the approximate nearest-neighbour index. The closest
+        `top_k` labels among the rows in the probed lists are scored exactly, and are ranked before all other labels,
+        whose distances are approximated by the distances between the query and their mean reference embeddings (so
+        that the other labels are still ranked per label, at the cost of a matmul over the labels rather than over all
+        reference embeddings). When the probed lists contain fewer than `top_k` labels, all labels are scored exactly.
+        """
+        centroid_distances = self._distances(query[None], self.index.centroids, np.ones(self.index.n_lists))[0]
+        rows = self.index.probe(centroid_distances, self.n_probe)
+        # the rows are sorted, so the rows of every candidate label are contiguous
+        row_labels = self.row_labels[rows]
+        boundaries = np.flatnonzero(np.diff(row_labels)) + 1
+        candidates = row_labels[np.concatenate([[0], boundaries])] if len(rows) else row_labels
+        if len(candidates) < min(self.top_k, len(self.labels)):
+            return self._exact_distances(query[None])[0]
+
+        # select the top-k candidates on the distances to their probed rows
+        distances = self._distances(query[None], self.reference_matrix[rows], self.reference_norms[rows])
+        candidate_distances = self._aggregate(distances, np.concatenate([[0], boundaries, [len(rows)]]))[0]
+        if len(candidates) > self.top_k:
+            candidates = candidates[np.argpartition(candidate_distances, self.top_k - 1)[: self.top_k]]
+
+        # approximate the other labels by the distances to their mean reference embeddings
+        approximations = self._distances(query[None], self.label_means, self.label_mean_norms)[0]
+        return self._rerank(query, candidates, approximations)
+
+    def _rerank(self, query: np.ndarray, candidates: np.ndarray, approximations: np.ndarray) -> np.ndarray:
+        """
+        Score the candidate labels exactly on all their rows, and rank the approximated distances of the other labels
+        after the candidates, by moving them (keeping their order) past the largest exact distance when needed. Cosine
+        distances are compressed into the range up to the maximum distance of 2, rather than shifted beyond it.
+        """
+        offsets = np.concatenate([[0], np.cumsum(np.diff(self.label_offsets)[candidates])])
+        candidate_rows = np.concatenate(
+            [np.arange(self.label_offsets[i], self.label_offsets[i + 1]) for i in candidates]
+        )
+        distances = self._distances(
+            query[None], self.reference_matrix[candidate_rows], self.reference_norms[candidate_rows]
+        )
+        exact_distances = self._aggregate(distances, offsets)[0]
+
+        others = np.ones(len(approximations), dtype=bool)
+        others[candidates] = False
+        # a margin of a few float32 steps, which is kept when converting the distances to scores
+        largest = exact_distances.max()
+        minimum = largest + max(abs(largest), 1) * 4 * np.finfo(np.float32).eps
+        if others.any() and (lowest := approximations[others].min()) < minimum:
+            if self.metric == 'cosine' and lowest < 2 and minimum < 2:
+                approximations = minimum + (approximations - lowest) * ((2 - minimum) / (2 - lowest))
+            else:
+                approximations = approximations + (minimum - lowest)
+        approximations = np.array(approximations, dtype=exact_distances.dtype)
+        approximations[candidates] = exact_distances
+        return approximations
+
+    def _distances(self, queries: np.ndarray, matrix: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """Compute the distances between the queries and the rows of the matrix (with precomputed norms)."""
+        query_norms = np.linalg.norm(queries, axis=-1)
+        similarities = queries @ matrix.T
+        if self.metric == 'cosine':
+            return 1 - similarities / np.outer(query_norms, norms)
+        squared = query_norms[:, None] ** 2 + norms[None, :] ** 2 - 2 * similarities
+        return np.sqrt(np.maximum(squared, 0))  # clip the small negative values caused by rounding errors
+
+    def _aggregate(self, distances: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Aggregate the distances (n_queries, n_rows) to distances per label (n_queries, n_labels), where the distances
+        of label `i` are `distances[:, offsets[i]:offsets[i + 1]]`.
+        """
+        if aggregator := SEGMENTED_AGGREGATORS.get(self.class_aggregator):
+            ufunc, normalize = aggregator
+            aggregated = ufunc.reduceat(distances, offsets[:-1], axis=-1)
+            return aggregated / np.diff(offsets) if normalize else aggregated
+        # fall back to applying the aggregator on the distances of every label separately
+        segments = np.split(distances, offsets[1:-1], axis=-1)
+        return np.stack([self.class_aggregator(segment, axis=-1) for segment in segments], axis=-1)
 
     def update_embeddings(self, meta_data: Mapping[str, Mapping[str, np.ndarray]]):
         """
-        Load the embeddings from the meta_data and store it in the cache of this model class.
+        Load the embeddings from the meta_data and store them as a single reference matrix in this model class.
         """
-        ref_embeddings = defaultdict()
+        labels, embeddings = [], []
         for category, category_data in meta_data.items():
             for label, label_data in category_data.items():
-                ref_embeddings[(category, label)] = label_data['embeddings']
-        self.reference_embeddings = ref_embeddings
+                if len(label_data['embeddings']) == 0:
+                    raise ValueError(f"No reference embeddings available for '{category}/{label}'")
+                labels.append((category, label))
+                embeddings.append(label_data['embeddings'])
+
+        self.labels = tuple(labels)
+        self.label_offsets = np.cumsum([0] + [len(e) for e in embeddings])
+        self.reference_matrix = _as_reference_matrix(embeddings)
+        self.reference_norms = np.linalg.norm(self.reference_matrix, axis=-1)
+        self.row_labels = np.repeat(np.arange(len(self.labels)), np.diff(self.label_offsets))
+        self.index = self._get_index() if self.n_lists else None
+        if self.index is not None:
+            sums = np.add.reduceat(self.reference_matrix, self.label_offsets[:-1], axis=0, dtype=np.float32)
+            self.label_means = sums / np.diff(self.label_offsets)[:, None].astype(np.float32)
+            self.label_mean_norms = np.linalg.norm(self.label_means, axis=-1)
+
+    def _get_index(self) -> IVFIndex:
+        """Load the approximate nearest-neighbour index from `index_dir` if it is still valid, otherwise rebuild it."""
+        key = get_index_key(self.reference_matrix, self.label_offsets, self.n_lists)
+        path = os.path.join(self.index_dir, ANN_INDEX_FILENAME) if self.index_dir else None
+        if path and (index := IVFIndex.load(path, key=key)):
+            return index
+
+        index = IVFIndex.build(self.reference_matrix, n_lists=self.n_lists, key=key)
+        if path:
+            index.save(path)
+        return index
+
+
+def _as_reference_matrix(embeddings: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Concatenate the embeddings of all labels into one contiguous float32 matrix. When the embeddings already are
+    consecutive views covering an entire float32 matrix (e.g. the memory-mapped embedding store), that matrix is used
+    as is, so that it is not copied into the private memory of the process.
+    """
+    base = getattr(embeddings[0], 'base', None) if embeddings else None
+    if isinstance(base, np.ndarray) and base.dtype == np.float32 and base.flags.c_contiguous:
+        position, end = _address(base), _address(base) + base.nbytes
+        for label_embeddings in embeddings:
+            if getattr(label_embeddings, 'base', None) is not base or _address(label_embeddings) != position:
+                break
+            position += label_embeddings.nbytes
+        else:
+            if position == end:
+                return base
+    return np.ascontiguousarray(np.concatenate([np.asarray(e, dtype=np.float32) for e in embeddings]))
+
+
+def _address(array: np.ndarray) -> int:
+    return array.__array_interface__['data'][0]
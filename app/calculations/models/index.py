@@ -0,0 +1,112 @@
+import hashlib
+import os
+import zipfile
+
+import numpy as np
+
+from app.embedding_store import write_atomic
+
+ANN_INDEX_FILENAME = 'ann_index.npz'
+
+
+class IVFIndex:
+    """
+    Inverted file (IVF) index for approximate nearest-neighbour search over the reference embeddings. The
+    (L2-normalized) reference embeddings are clustered with spherical k-means, and every cluster ("list") holds the
+    rows of the reference matrix assigned to it. A query only needs to be compared with the rows in the lists whose
+    centroids are closest to the query.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, key: str):
+        """
+        Create an instance of IVFIndex.
+
+        :param centroids: the (L2-normalized) cluster centroids with shape (n_lists, embedding_size)
+        :param assignments: the list of every row in the reference matrix with shape (n_rows,)
+        :param key: identifier of the reference embeddings and parameters the index was built for
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.key = key
+        # store the rows of each list contiguously, where the rows of list `i` are `rows[offsets[i]:offsets[i + 1]]`
+        self.rows = np.argsort(self.assignments, kind='stable').astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assignments, minlength=self.n_lists))])
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int, key: str, n_iter: int = 10, seed: int = 0) -> 'IVFIndex':
+        """Cluster the `vectors` into `n_lists` lists with spherical k-means and build the index."""
+        vectors = _normalize(vectors)
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignments = _assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            # re-initialize empty lists with random vectors
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        return cls(centroids=centroids, assignments=_assign(vectors, centroids), key=key)
+
+    @classmethod
+    def load(cls, path: str, key: str) -> 'IVFIndex | None':
+        """
+        Load the index stored at `path`, or return None if it is missing, unreadable (e.g. truncated) or was built for
+        other embeddings, so that it is rebuilt.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data['key']) != key:
+                    return None
+                return cls(centroids=data['centroids'], assignments=data['assignments'], key=key)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return None
+
+    def save(self, path: str):
+        """
+        Store the index at `path` (in numpy's `.npz` format). The file is replaced atomically, so that processes
+        loading the index concurrently do not read a partially written file.
+        """
+        write_atomic(path, lambda f: np.savez(f, centroids=self.centroids, assignments=self.assignments, key=self.key))
+
+    def probe(self, centroid_distances: np.ndarray, n_probe: int) -> np.ndarray:
+        """
+        Get the (sorted) rows in the `n_probe` lists closest to a query.
+
+        :param centroid_distances: the distances between the query and the centroids with shape (n_lists,)
+        :param n_probe: the number of lists to search
+        """
+        if n_probe < self.n_lists:
+            lists = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        else:
+            lists = np.arange(self.n_lists)
+        rows = np.concatenate([self.rows[self.offsets[i] : self.offsets[i + 1]] for i in lists])
+        return np.sort(rows)
+
+
+def get_index_key(reference_matrix: np.ndarray, label_offsets: np.ndarray, n_lists: int) -> str:
+    """Get an identifier for an index with `n_lists` lists over the given reference embeddings."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(reference_matrix).data)
+    digest.update(np.asarray(label_offsets, dtype=np.int64).data)
+    digest.update(str(n_lists).encode())
+    return digest.hexdigest()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), np.finfo(np.float32).tiny)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Assign every vector to its closest centroid, in chunks to bound the memory usage."""
+    return np.concatenate(
+        [np.argmax(vectors[i : i + chunk_size] @ centroids.T, axis=-1) for i in range(0, len(vectors), chunk_size)]
+    )
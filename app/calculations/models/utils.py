@@ -5,14 +5,38 @@ from PIL import Image
 from transformers import ViTConfig
 
 
-def convert_bytes_to_pil_image(image: bytes) -> Image:
+def convert_bytes_to_pil_image(image: bytes, size: int | None = None) -> Image:
     """
-    Convert the raw binary image data to a PIL Image in RGB format.
+    Convert the raw binary image data to a PIL Image in RGB format (see `decode_pil_image`).
 
     :param image: raw binary image data
+    :param size: optional size of the (square) model input
     :returns: a PIL Image in RGB format
     """
-    return Image.open(io.BytesIO(image)).convert('RGB')
+    return decode_pil_image(Image.open(io.BytesIO(image)), size=size)
+
+
+def decode_pil_image(pil_image: Image, size: int | None = None) -> Image:
+    """
+    Decode an opened (but not yet loaded) PIL Image into RGB format. When the size of the model input is given, large
+    images are downscaled to between 2 and 4 times this size (in both dimensions), since the model input is resized to
+    `size` x `size` anyway. JPEG images are downscaled while decoding (see `Image.draft`), so that the full resolution
+    image is never decoded.
+
+    :param pil_image: the PIL Image as returned by `Image.open`
+    :param size: optional size of the (square) model input
+    :returns: a PIL Image in RGB format
+    """
+    if not size:
+        return pil_image.convert('RGB')
+
+    if pil_image.format == 'JPEG':
+        # let the decoder scale by 1/2, 1/4 or 1/8, as long as both dimensions stay at least twice the input size
+        pil_image.draft('RGB', (2 * size, 2 * size))
+    pil_image = pil_image.convert('RGB')
+    # reduce the remaining excess resolution with fast box downscaling by integer factors
+    factors = tuple(max(dimension // (2 * size), 1) for dimension in pil_image.size)
+    return pil_image.reduce(factors) if factors != (1, 1) else pil_image
 
 
 def convert_pil_image_to_numpy(image: Image, resize: tuple[int, int] | None = None) -> np.ndarray:
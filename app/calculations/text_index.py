@@ -0,0 +1,115 @@
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any
+
+import numpy as np
+
+# the characters that can occur in texts cleaned by `app.requests.validate.clean_text`
+ALPHABET = ' abcdefghijklmnopqrstuvwxyz0123456789'
+_SEPARATOR, _OTHER = 0, len(ALPHABET) + 1
+_BASE = len(ALPHABET) + 2
+_CHAR_IDS = np.full(256, _OTHER, dtype=np.int64)
+_CHAR_IDS[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(1, len(ALPHABET) + 1)
+
+
+class TextIndex:
+    """
+    Inverted n-gram index over the cleaned wrapper texts, for resolving (multi-token) substring filters as
+    intersections of the postings of the n-grams of the query tokens. For tokens longer than `max_n` characters, the
+    n-grams only select candidates, which are verified with a substring check, so that the results are the same as
+    those of `token in text`.
+    """
+
+    def __init__(self, texts: Sequence[str], labels: Sequence[Any] | None = None, max_n: int = 3):
+        """
+        Create an instance of TextIndex.
+
+        :param texts: the cleaned texts to index
+        :param labels: the labels of the texts, defaults to the positions of the texts
+        :param max_n: the maximum length of the indexed n-grams (all n-grams of length 1 up to `max_n` are indexed)
+        """
+        self.texts = tuple(texts)
+        self.labels = tuple(labels) if labels is not None else tuple(range(len(self.texts)))
+        self.positions = {label: i for i, label in enumerate(self.labels)}
+        self.max_n = max_n
+
+        # encode all texts as one sequence of character ids, separated by `_SEPARATOR`
+        corpus = np.frombuffer('\0'.join(self.texts).encode('ascii', errors='replace'), dtype=np.uint8)
+        chars = _CHAR_IDS[corpus]
+        chars[corpus == 0] = _SEPARATOR
+        doc_ids = np.repeat(np.arange(len(self.texts)), [len(text) + 1 for text in self.texts])[: len(chars)]
+
+        # collect the unique (n-gram, text) pairs for all n-grams that do not cross the boundary of a text
+        pairs = []
+        for n in range(1, max_n + 1):
+            windows = np.lib.stride_tricks.sliding_window_view(chars, n) if len(chars) >= n else np.empty((0, n))
+            valid = (windows != _SEPARATOR).all(axis=-1)
+            codes = _encode_windows(windows[valid])
+            pairs.append(np.unique(codes * len(self.texts) + doc_ids[: len(windows)][valid]))
+        pairs = np.concatenate(pairs) if pairs else np.empty(0, dtype=np.int64)
+
+        # store the postings contiguously, where the texts containing n-gram `grams[i]` are
+        # `postings[offsets[i]:offsets[i + 1]]`
+        grams = pairs // max(len(self.texts), 1)
+        self.grams, starts = np.unique(grams, return_index=True)
+        self.offsets = np.append(starts, len(grams))
+        self.postings = (pairs % max(len(self.texts), 1)).astype(np.int32)
+
+    @classmethod
+    def from_meta_data(cls, meta_data: Mapping[str, Mapping[str, Any]], max_n: int = 3) -> 'TextIndex':
+        """Build the index over the wrapper texts of all (category, label) in the meta-data."""
+        labels = [(category, label) for category, articles in meta_data.items() for label in articles]
+        texts = [meta_data[category][label]['wrappers']['text'] for category, label in labels]
+        return cls(texts, labels=labels, max_n=max_n)
+
+    def contains(self, substring: str) -> np.ndarray:
+        """Get a boolean mask of the texts that contain `substring`."""
+        return self.contains_all([substring])
+
+    def contains_all(self, tokens: Iterable[str]) -> np.ndarray:
+        """Get a boolean mask of the texts that contain all `tokens`."""
+        tokens = [token for token in set(tokens) if token]
+        candidates = None
+        for token in tokens:
+            postings = self._candidates(token)
+            candidates = postings if candidates is None else np.intersect1d(candidates, postings, assume_unique=True)
+            if not len(candidates):
+                break
+
+        mask = np.zeros(len(self.texts), dtype=bool)
+        if candidates is None:
+            mask[:] = True
+        else:
+            # verify the candidates for the tokens that are not fully resolved by their n-grams
+            unresolved = [token for token in tokens if len(token) > self.max_n or not _is_encodable(token)]
+            mask[[i for i in candidates if all(token in self.texts[i] for token in unresolved)]] = True
+        return mask
+
+    def _candidates(self, token: str) -> np.ndarray:
+        """Get the (sorted) texts containing all n-grams of the token, or all texts if it cannot be encoded."""
+        if not _is_encodable(token):
+            return np.arange(len(self.texts), dtype=np.int32)
+
+        chars = _CHAR_IDS[np.frombuffer(token.encode('ascii'), dtype=np.uint8)]
+        n = min(self.max_n, len(chars))
+        codes = np.unique(_encode_windows(np.lib.stride_tricks.sliding_window_view(chars, n)))
+        positions = np.searchsorted(self.grams, codes)
+        if (positions >= len(self.grams)).any() or (self.grams[positions] != codes).any():
+            return np.empty(0, dtype=np.int32)
+
+        # intersect the postings, starting with the shortest ones
+        postings = sorted((self.postings[self.offsets[i] : self.offsets[i + 1]] for i in positions), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return candidates
+
+
+def _is_encodable(token: str) -> bool:
+    return all(char in ALPHABET for char in token)
+
+
+def _encode_windows(windows: np.ndarray) -> np.ndarray:
+    """Encode n-grams of character ids (with shape (n_windows, n)) as unique integers across all lengths n."""
+    n = windows.shape[-1]
+    offset = sum(_BASE**m for m in range(1, n))  # make the codes unique across n-grams of different lengths
+    return windows.astype(np.int64) @ (_BASE ** np.arange(n - 1, -1, -1, dtype=np.int64)) + offset
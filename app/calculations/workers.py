@@ -0,0 +1,359 @@
+import logging
+import multiprocessing
+import os
+import secrets
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from itertools import count
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener, answer_challenge, deliver_challenge, wait
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from app.calculations.models.base import ClassificationModel, Prediction
+from app.metrics import collect_timings, get_timings
+
+# the maximum time (in seconds) a client may take to authenticate, after which it is disconnected
+AUTHENTICATION_TIMEOUT = 10.0
+
+
+class InferenceInfo(NamedTuple):
+    """What the clients of an `InferenceServer` need to know of its model, sent once when they connect."""
+
+    labels: tuple
+    input_size: int | None
+    preprocessor: Callable[[np.ndarray], Any]
+
+
+class InferenceServer:
+    """
+    Server running the predictions of a model in `n_workers` dedicated worker processes, for the clients (e.g. the
+    gunicorn worker processes of the application, see `RemoteClassifier`) connecting to the Unix socket at `address`,
+    which are authenticated with the shared `authkey` (see `get_authkey`) before their (pickled) requests are read.
+    The clients send batches of preprocessed instances, which are predicted by the first idle worker, and get back the
+    scores of every instance. This way, the number of processes loading the model does not depend on the number of
+    processes handling the HTTP requests. The worker processes are spawned (rather than forked), and each load the
+    model with `load_model`, which should share the reference embeddings between the processes (e.g. with the
+    memory-mapped embedding store), since these are the largest part of the model.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        load_model: Callable[[], ClassificationModel],
+        n_workers: int = 1,
+        load_timeout: float = 600.0,
+    ):
+        """
+        Create an instance of InferenceServer.
+
+        :param address: the path of the Unix socket, which is only accessible to the current user
+        :param authkey: the secret key the clients authenticate with
+        :param load_model: picklable function loading the model in a worker process
+        :param n_workers: the number of worker processes
+        :param load_timeout: the maximum time (in seconds) to wait for the worker processes to load the model
+        """
+        if n_workers < 1:
+            raise ValueError('`n_workers` must be at least 1')
+
+        self.address = address
+        self.authkey = authkey
+        self.load_model = load_model
+        self.n_workers = n_workers
+        self.load_timeout = load_timeout
+        self.info = None
+        self._context = multiprocessing.get_context('spawn')
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._workers = []
+        self._connections = {}
+        self._listener = None
+
+    def start(self):
+        """
+        Start the worker processes and wait until they have loaded the model, after which clients can connect.
+
+        :raises RuntimeError: if a worker process exits before it has loaded the model (e.g. when loading fails), or
+            the workers do not load the model within `load_timeout` seconds, in which case all workers are terminated
+        """
+        # every worker reports on its own pipe when it has loaded the model
+        loading = {}
+        for _ in range(self.n_workers):
+            reader, writer = self._context.Pipe(duplex=False)
+            worker = self._context.Process(
+                target=_work, args=(self.load_model, writer, self._tasks, self._results), daemon=True
+            )
+            worker.start()
+            writer.close()
+            self._workers.append(worker)
+            loading[reader] = worker
+        deadline = time.monotonic() + self.load_timeout
+        while loading:
+            ready = wait(
+                [*loading, *(worker.sentinel for worker in loading.values())],
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+            if not ready:
+                self._terminate()
+                raise RuntimeError(f'the inference worker processes did not load the model within {self.load_timeout}s')
+            exited = any(worker.sentinel in ready for worker in loading.values())
+            for reader in [reader for reader in loading if reader in ready]:
+                try:
+                    self.info = reader.recv()
+                except EOFError:  # the worker exited without reporting
+                    exited = True
+                    continue
+                reader.close()
+                del loading[reader]
+            if exited:
+                self._terminate()
+                raise RuntimeError('an inference worker process exited while loading the model')
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # left behind by a server which did not shut down
+        umask = os.umask(0o177)  # create the socket accessible to the current user only
+        try:
+            # the clients are authenticated by the thread reading their requests (see `_authenticate`), so that a client
+            # stalling the authentication does not keep the other clients from connecting
+            self._listener = Listener(self.address, family='AF_UNIX')
+        finally:
+            os.umask(umask)
+        threading.Thread(target=self._dispatch, daemon=True).start()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def serve_forever(self):
+        """
+        Serve the clients until a worker process exits, e.g. when it runs out of memory, after which the server shuts
+        down (to be restarted by the process manager), since the predictions of that worker would never be returned.
+        """
+        if self._listener is None:
+            self.start()
+        try:
+            wait([worker.sentinel for worker in self._workers])
+        finally:
+            self.close()
+        raise RuntimeError('an inference worker process exited unexpectedly')
+
+    def close(self):
+        """Stop the worker processes, and stop listening for clients."""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _terminate(self):
+        """Terminate the worker processes, e.g. when they are still loading the model."""
+        for worker in self._workers:
+            worker.terminate()
+        for worker in self._workers:
+            worker.join()
+
+    def _accept(self):
+        """Accept new clients, which are authenticated and of which the requests are read by a thread per client."""
+        for client_id in count():
+            try:
+                connection = self._listener.accept()
+            except OSError:  # the listener is closed
+                return
+            threading.Thread(target=self._receive, args=(client_id, connection), daemon=True).start()
+
+    def _authenticate(self, connection: Connection):
+        """
+        Authenticate a client with the shared `authkey`, like `Listener` does for a listener with an authkey, but
+        failing if the client does not respond within `AUTHENTICATION_TIMEOUT` seconds.
+
+        :raises AuthenticationError: if the client does not know the authkey
+        :raises OSError: if the client does not respond in time
+        """
+        _set_receive_timeout(connection, AUTHENTICATION_TIMEOUT)
+        deliver_challenge(connection, self.authkey)
+        answer_challenge(connection, self.authkey)
+        _set_receive_timeout(connection, 0)
+
+    def _receive(self, client_id: int, connection: Connection):
+        """Authenticate a client and hand its requests to the worker processes, until the client disconnects."""
+        try:
+            self._authenticate(connection)
+        except (AuthenticationError, EOFError, OSError):
+            logging.warning('Rejected an inference client which failed to authenticate')
+            connection.close()
+            return
+        self._connections[client_id] = connection
+        try:
+            connection.send(self.info)
+            while True:
+                request_id, instances = connection.recv()
+                self._tasks.put((client_id, request_id, instances))
+        except (EOFError, OSError):
+            self._connections.pop(client_id, None)
+            connection.close()
+
+    def _dispatch(self):
+        """Send the results of the worker processes back to the clients which requested them."""
+        while True:
+            client_id, request_id, response = self._results.get()
+            if (connection := self._connections.get(client_id)) is None:
+                continue  # the client disconnected
+            try:
+                connection.send((request_id, response))
+            except OSError:
+                logging.warning(f'Failed to send the predictions to inference client {client_id}')
+
+
+def _work(
+    load_model: Callable[[], ClassificationModel],
+    ready: Connection,
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+):
+    """
+    Load the model in a worker process, send the information on the model on `ready`, and predict the batches of
+    instances of the clients, returning the scores (and embeddings) of the instances with the stage timings of the
+    predictions, or the exception raised by the model.
+    """
+    model = load_model()
+    ready.send(InferenceInfo(tuple(model.labels), model.input_size, model.get_preprocessor()))
+    ready.close()
+    while (task := tasks.get()) is not None:
+        client_id, request_id, instances = task
+        timings = []
+        try:
+            with collect_timings(timings):
+                predictions = model.predict_batch(instances)
+            response = ([(prediction.scores, prediction.embedding) for prediction in predictions], timings)
+        except Exception as ex:
+            response = ex
+        results.put((client_id, request_id, response))
+
+
+class RemoteClassifier(ClassificationModel):
+    """
+    Classification model of which the predictions are made by an `InferenceServer`. The instances are preprocessed
+    in the calling process, and the predictions of the labels of the model of the server are returned, with the stage
+    timings of the worker process added to the timings of the current request. Every process has its own connection,
+    which is (re)connected on first use, e.g. after forking a gunicorn worker or restarting the server.
+    """
+
+    def __init__(self, address: str, authkey: bytes, timeout: float = 60.0):
+        """
+        Create an instance of RemoteClassifier.
+
+        :param address: the path of the Unix socket of the `InferenceServer`
+        :param authkey: the secret key of the server
+        :param timeout: the maximum time (in seconds) to wait for the predictions of a batch
+        """
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._connection = None
+        self._info = None
+        self._pid = None
+        self._request_ids = count()
+        self._lock = threading.Lock()
+
+    @property
+    def info(self) -> InferenceInfo:
+        with self._lock:
+            return self._connect()[1]
+
+    @property
+    def labels(self) -> tuple:
+        return self.info.labels
+
+    @property
+    def input_size(self) -> int | None:
+        return self.info.input_size
+
+    def preprocess(self, instance: np.ndarray) -> Any:
+        return self.info.preprocessor(instance)
+
+    def get_preprocessor(self) -> Callable[[np.ndarray], Any]:
+        return self.info.preprocessor
+
+    def predict(self, instance: np.ndarray) -> dict[tuple[str, str], float]:
+        """Predict the labels for a single instance."""
+        return self.predict_batch([self.preprocess(instance)])[0].as_dict()
+
+    def predict_batch(self, instances: Sequence[Any]) -> list[Prediction]:
+        """Predict the labels for a batch of preprocessed instances in a worker process of the server."""
+        with self._lock:
+            connection, info = self._connect()
+            request_id = next(self._request_ids)
+            try:
+                connection.send((request_id, list(instances)))
+                while connection.poll(self.timeout):
+                    response_id, response = connection.recv()
+                    if response_id == request_id:
+                        break  # skip the responses of earlier requests which timed out
+                else:
+                    raise TimeoutError(f'No predictions received from the inference server within {self.timeout}s')
+            except (EOFError, OSError, TimeoutError):
+                self._disconnect()
+                raise
+
+        if isinstance(response, Exception):
+            raise response
+        predictions, timings = response
+        if (request_timings := get_timings()) is not None:
+            request_timings.extend(timings)
+        return [Prediction(labels=info.labels, scores=scores, embedding=embedding) for scores, embedding in predictions]
+
+    def _connect(self) -> tuple[Connection, InferenceInfo]:
+        """Connect to the server, if this process is not connected yet, and get the information on its model."""
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._info = self._connection.recv()
+            self._pid = os.getpid()
+        return self._connection, self._info
+
+    def _disconnect(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+
+def _set_receive_timeout(connection: Connection, timeout: float):
+    """Let the reads of a (socket) connection fail after `timeout` seconds, or block indefinitely for a timeout of 0."""
+    with socket.socket(fileno=os.dup(connection.fileno())) as sock:
+        seconds, fraction = divmod(timeout, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack('ll', int(seconds), int(fraction * 1e6)))
+
+
+def get_authkey(filename: str) -> bytes:
+    """
+    Get the secret key shared by an `InferenceServer` and its clients from `filename`, which is created with a random
+    key (readable by the current user only) if it does not exist yet. The file is created atomically, so that the
+    server and the application processes starting concurrently all get the same key.
+    """
+    if not os.path.exists(filename):
+        # mkstemp creates the file with permissions 0600
+        fd, temporary_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_bytes(32))
+            os.link(temporary_filename, filename)
+        except FileExistsError:
+            pass  # created concurrently by another process
+        finally:
+            os.unlink(temporary_filename)
+    with open(filename, 'rb') as f:
+        authkey = f.read()
+    if not authkey:
+        raise ValueError(f'The inference key file {filename} is empty')
+    return authkey
+
+
+def get_authkey_from_config(app_config: Mapping[str, Any]) -> bytes:
+    """Get the secret key of the inference server from `INFERENCE_AUTHKEY_FILE`, or the `.key` file of the socket."""
+    return get_authkey(app_config.get('INFERENCE_AUTHKEY_FILE') or f"{app_config['INFERENCE_SOCKET']}.key")
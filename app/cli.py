@@ -0,0 +1,170 @@
+import copy
+import functools
+import os
+
+import click
+import torch
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.calculations.models import EmbeddingClassifier
+from app.calculations.models.backends import INFERENCE_BACKENDS, apply_inference_backend, compare_backends
+from app.calculations.models.utils import convert_bytes_to_pil_image, convert_pil_image_to_numpy
+from app.calculations.workers import InferenceServer, get_authkey_from_config
+from app.snapshots import sync_snapshot
+from app.thumbnails import generate_thumbnails
+from app.torch_threads import (
+    calibrate_threads,
+    get_available_cpus,
+    get_candidate_thread_counts,
+    get_model_processes,
+    write_config_values,
+)
+
+
+@click.command('check-inference-backend')
+@click.option('--backend', type=click.Choice(INFERENCE_BACKENDS), default='int8-dynamic', show_default=True)
+@click.option('--images', type=click.Path(exists=True, dir_okay=False), multiple=True, help='Additional images.')
+@click.option('--max-images', type=int, default=64, show_default=True, help='Maximum number of reference images.')
+@click.option('--top-k', type=int, default=10, show_default=True)
+@click.option('--min-similarity', type=float, default=0.98, show_default=True)
+@click.option('--min-agreement', type=float, default=0.9, show_default=True)
+@with_appcontext
+def check_inference_backend(
+    backend: str, images: tuple[str, ...], max_images: int, top_k: int, min_similarity: float, min_agreement: float
+):
+    """
+    Compare the embeddings and top-k rankings of an inference backend with those of the float32 model on the wrapper
+    images of the reference data, and fail if they differ too much.
+    """
+    # imported here, since `app.app` registers this command
+    from app.app import load_embedding_model
+
+    reference_data_dir = current_app.config['REFERENCE_DATA_DIR']
+    filenames = [
+        filename
+        for articles in current_app.meta_data.values()
+        for article in articles.values()
+        if os.path.isfile(filename := os.path.join(reference_data_dir, article['wrappers']['image']))
+    ][:max_images] + list(images)
+    if not filenames:
+        raise click.ClickException('No reference images found to compare the inference backends on')
+
+    reference = load_embedding_model(current_app.config['MODEL_DIR'], inference_backend='float32')
+    # rank with a local classifier, since the model of the application may run in the inference workers
+    classifier = EmbeddingClassifier(model=reference)
+    classifier.update_embeddings(current_app.meta_data)
+    inputs = []
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            image = convert_pil_image_to_numpy(convert_bytes_to_pil_image(f.read(), size=classifier.input_size))
+        inputs.append(classifier.preprocess(image))
+
+    candidate = apply_inference_backend(copy.deepcopy(reference), backend)
+    comparison = compare_backends(reference, candidate, torch.cat(inputs), classifier.score, top_k=top_k)
+
+    click.echo(f'compared {backend} with float32 on {len(filenames)} images')
+    click.echo(f'embedding similarity: min {comparison.min_similarity:.4f}, mean {comparison.mean_similarity:.4f}')
+    click.echo(f'top-{top_k} agreement: {comparison.top_k_agreement:.3f}')
+    click.echo(f'latency: {comparison.latency:.1f} ms ({comparison.reference_latency:.1f} ms for float32)')
+    if comparison.min_similarity < min_similarity or comparison.top_k_agreement < min_agreement:
+        raise click.ClickException(f'the {backend} backend deviates too much from the float32 model')
+
+
+@click.command('generate-thumbnails')
+@with_appcontext
+def generate_thumbnails_command():
+    """Generate the thumbnails of all images in the reference data which are missing or out of date."""
+    config = current_app.config
+    if not config.get('THUMBNAIL_WIDTHS'):
+        raise click.ClickException('No thumbnail widths configured in `THUMBNAIL_WIDTHS`')
+    n_generated = generate_thumbnails(
+        config['REFERENCE_DATA_DIR'],
+        config['THUMBNAIL_DIR'],
+        config['THUMBNAIL_WIDTHS'],
+        config['ALLOWED_EXTENSIONS'],
+        quality=config.get('THUMBNAIL_QUALITY', 80),
+    )
+    click.echo(f'generated {n_generated} thumbnails in {config["THUMBNAIL_DIR"]}')
+
+
+@click.command('serve-inference')
+@click.option('--workers', type=int, help='Number of worker processes, defaults to `INFERENCE_WORKERS`.')
+@with_appcontext
+def serve_inference(workers: int | None):
+    """
+    Run the model in dedicated worker processes, serving the predictions to the application processes over the Unix
+    socket `INFERENCE_SOCKET`, which authenticate with the key in `INFERENCE_AUTHKEY_FILE`.
+    """
+    # imported here, since `app.app` registers this command
+    from app.app import load_inference_worker_classifier
+
+    config = current_app.config
+    if not config.get('INFERENCE_SOCKET'):
+        raise click.ClickException('No socket configured in `INFERENCE_SOCKET`')
+    # download the model once, after which the worker processes load it without any requests
+    if config.get('MODEL_HF'):
+        sync_snapshot(repo_id=config['MODEL_HF'], local_dir=config['MODEL_DIR'], offline=config.get('OFFLINE', False))
+    server = InferenceServer(
+        config['INFERENCE_SOCKET'],
+        get_authkey_from_config(config),
+        functools.partial(load_inference_worker_classifier, dict(config)),
+        n_workers=workers or config.get('INFERENCE_WORKERS', 1),
+    )
+    server.start()
+    click.echo(f'serving the predictions of {server.n_workers} worker processes at {server.address}')
+    server.serve_forever()
+
+
+@click.command('calibrate-threads')
+@click.option('--processes', type=int, help='Number of processes running the model, defaults to the configured one.')
+@click.option('--inter-op', type=int, multiple=True, default=(1, 2), show_default=True, help='Inter-op threads.')
+@click.option('--batch-size', type=int, default=1, show_default=True)
+@click.option('--iterations', type=int, default=10, show_default=True, help='Forward passes per process.')
+@click.option(
+    '--config-file',
+    type=click.Path(exists=True, dir_okay=False),
+    help='Configuration file to write the best thread counts to, defaults to the setup.cfg of the application.',
+)
+@click.option('--dry-run', is_flag=True, help='Only report the measurements.')
+@with_appcontext
+def calibrate_threads_command(
+    processes: int | None,
+    inter_op: tuple[int, ...],
+    batch_size: int,
+    iterations: int,
+    config_file: str | None,
+    dry_run: bool,
+):
+    """
+    Measure the forward-pass throughput of the embedding model of `MODEL_DIR` for several numbers of torch threads,
+    in as many concurrent processes as the processes running the model, and write the numbers of threads with the
+    highest throughput to `TORCH_THREADS` and `TORCH_INTEROP_THREADS`.
+    """
+    # imported here, since `app.app` registers this command
+    from app.app import load_embedding_model
+
+    processes = processes or get_model_processes(current_app.config)
+    cpus = get_available_cpus()
+    candidates = get_candidate_thread_counts(processes, cpus, inter_op=inter_op)
+    click.echo(f'calibrating {len(candidates)} thread counts for {processes} processes on {cpus} CPUs')
+    calibrations = calibrate_threads(
+        functools.partial(
+            load_embedding_model, current_app.config['MODEL_DIR'], current_app.config.get('INFERENCE_BACKEND')
+        ),
+        candidates,
+        n_processes=processes,
+        batch_size=batch_size,
+        n_iterations=iterations,
+    )
+
+    click.echo(f"{'intra-op':>8} {'inter-op':>8} {'images/s':>9} {'latency (ms)':>13}")
+    for calibration in calibrations:
+        intra, inter = calibration.threads
+        click.echo(f'{intra:>8} {inter:>8} {calibration.throughput:>9.1f} {calibration.latency:>13.1f}')
+    best = max(calibrations, key=lambda calibration: calibration.throughput).threads
+    click.echo(f'best: {best.intra_op} intra-op and {best.inter_op} inter-op threads')
+    if not dry_run:
+        config_file = config_file or os.path.join(current_app.root_path, 'setup.cfg')
+        write_config_values(config_file, {'TORCH_THREADS': best.intra_op, 'TORCH_INTEROP_THREADS': best.inter_op})
+        click.echo(f'written to {config_file}')
@@ -0,0 +1,78 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+from typing import Any
+
+import numpy as np
+
+EMBEDDINGS_FILENAME = 'embeddings.npy'
+EMBEDDINGS_INDEX_FILENAME = 'embeddings_index.json'
+
+
+def get_file_digest(filename: str) -> str:
+    """Get the hex digest of the contents of a file, which is only computed again when the file is modified."""
+    stat = os.stat(filename)
+    return _get_file_digest(filename, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_file_digest(filename: str, size: int, mtime_ns: int, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_embedding_store(store_dir: str, key: str) -> tuple[np.ndarray, Mapping[tuple[str, str], slice]] | None:
+    """
+    Memory-map the embedding store in `store_dir` read-only, so that all processes loading it share the same pages of
+    the page cache.
+
+    :param store_dir: the directory of the embedding store
+    :param key: identifier of the meta-data the store should have been generated from
+    :returns: the float32 embedding matrix and the rows for every (category, label), or None if the store is missing
+        or was generated from other meta-data
+    """
+    try:
+        with open(os.path.join(store_dir, EMBEDDINGS_INDEX_FILENAME)) as f:
+            index = json.load(f)
+        if index['key'] != key:
+            return None
+        matrix = np.load(os.path.join(store_dir, EMBEDDINGS_FILENAME), mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    return matrix, {(category, label): slice(start, end) for category, label, start, end in index['labels']}
+
+
+def write_embedding_store(store_dir: str, key: str, meta_data: Mapping[str, Mapping[str, Any]]):
+    """
+    Convert the embeddings in the parsed meta-data to an embedding store in `store_dir`: a float32 `.npy` file with
+    the embeddings of all labels and a json index with the rows of every label. Both files are replaced atomically,
+    so that processes generating the store concurrently do not read partially written files.
+    """
+    labels, embeddings, start = [], [], 0
+    for category, articles in meta_data.items():
+        for label, article in articles.items():
+            label_embeddings = np.asarray(article['embeddings'], dtype=np.float32)
+            labels.append((category, label, start, start + len(label_embeddings)))
+            embeddings.extend([label_embeddings] if len(label_embeddings) else [])
+            start += len(label_embeddings)
+
+    os.makedirs(store_dir, exist_ok=True)
+    write_atomic(os.path.join(store_dir, EMBEDDINGS_FILENAME), lambda f: np.save(f, np.concatenate(embeddings)))
+    # the index is written last, since it marks the store as valid for the given key
+    write_atomic(
+        os.path.join(store_dir, EMBEDDINGS_INDEX_FILENAME),
+        lambda f: f.write(json.dumps({'key': key, 'labels': labels}).encode()),
+    )
+
+
+def write_atomic(filename: str, write):
+    """Write a file with `write(f)` and replace `filename` by it atomically."""
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), delete=False) as f:
+        write(f)
+    os.replace(f.name, filename)
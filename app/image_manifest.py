@@ -0,0 +1,60 @@
+import json
+import os
+from collections.abc import Mapping, Sequence
+from typing import NamedTuple
+
+from PIL import Image
+
+from app.embedding_store import get_file_digest, write_atomic
+from app.thumbnails import iter_reference_images
+
+IMAGE_MANIFEST_FILENAME = 'image_manifest.json'
+
+
+class ImageInfo(NamedTuple):
+    size: int
+    mtime_ns: int
+    digest: str
+    width: int
+    height: int
+
+
+def build_image_manifest(
+    reference_data_dir: str, extensions: Sequence[str], previous: Mapping[str, ImageInfo] | None = None
+) -> dict[str, ImageInfo]:
+    """
+    Build the manifest of all images in the reference data: their size, content digest and dimensions by their path
+    relative to `reference_data_dir`. Images of which the size and modification time are unchanged since the
+    `previous` manifest are not read again.
+    """
+    previous = previous or {}
+    manifest = {}
+    for filename in iter_reference_images(reference_data_dir, extensions):
+        path = os.path.join(reference_data_dir, filename)
+        stat = os.stat(path)
+        info = previous.get(filename)
+        if info is None or (info.size, info.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            with Image.open(path) as image:
+                width, height = image.size
+            info = ImageInfo(stat.st_size, stat.st_mtime_ns, get_file_digest(path), width, height)
+        manifest[filename] = info
+    return manifest
+
+
+def load_image_manifest(reference_data_dir: str, manifest_dir: str, extensions: Sequence[str]) -> dict[str, ImageInfo]:
+    """
+    Load the manifest of the images in the reference data (see `build_image_manifest`) from `manifest_dir`, updated
+    for the images which were added, removed or modified since it was written.
+    """
+    filename = os.path.join(manifest_dir, IMAGE_MANIFEST_FILENAME)
+    try:
+        with open(filename) as f:
+            previous = {path: ImageInfo(*info) for path, info in json.load(f).items()}
+    except (OSError, ValueError, TypeError):
+        previous = None
+
+    manifest = build_image_manifest(reference_data_dir, extensions, previous)
+    if manifest != previous:
+        os.makedirs(manifest_dir, exist_ok=True)
+        write_atomic(filename, lambda f: f.write(json.dumps(manifest).encode()))
+    return manifest
@@ -0,0 +1,89 @@
+import hashlib
+import inspect
+import json
+import os
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any
+
+from app.embedding_store import get_file_digest, write_atomic
+
+META_DATA_ARTIFACT_FILENAME = 'meta_data.json'
+
+
+def get_code_digest(*objects: Any) -> str:
+    """
+    Get a digest of the source files of the `objects` (modules, classes or functions), which changes with their code,
+    e.g. to identify the code that generated an artifact.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for filename in sorted({inspect.getfile(obj) for obj in objects}):
+        digest.update(f'{os.path.basename(filename)}:{get_file_digest(filename)}\0'.encode())
+    return digest.hexdigest()
+
+
+def get_directory_signature(reference_data_dir: str, exclude: Iterable[str] = ()) -> str:
+    """
+    Get a digest of the category/label folders of the reference data and their modification times, which change when
+    images are added to, removed from or renamed in a folder. The `exclude` folders (e.g. of the thumbnails or other
+    files generated from the reference data) are skipped, since they change without the reference data changing.
+    """
+    exclude = {os.path.realpath(directory) for directory in exclude}
+    digest = hashlib.blake2b(digest_size=16)
+    for category in sorted(os.scandir(reference_data_dir), key=lambda entry: entry.name):
+        if category.is_dir() and os.path.realpath(category.path) not in exclude:
+            for label in sorted(os.scandir(category.path), key=lambda entry: entry.name):
+                if label.is_dir() and os.path.realpath(label.path) not in exclude:
+                    digest.update(f'{category.name}/{label.name}:{label.stat().st_mtime_ns}\0'.encode())
+    return digest.hexdigest()
+
+
+def get_meta_data_artifact_key(
+    meta_data_digest: str, reference_data_dir: str, parts: Sequence[str] = (), exclude: Iterable[str] = ()
+) -> str:
+    """
+    Get the key of the meta-data artifact for the current meta-data file, the folders of the reference data (except
+    the `exclude` folders, see `get_directory_signature`), the code of this module, and the configuration and code
+    `parts` the processing depends on (see `get_code_digest`).
+    """
+    signature = get_directory_signature(reference_data_dir, exclude=exclude)
+    return '-'.join((get_code_digest(write_meta_data_artifact), meta_data_digest, signature, *parts))
+
+
+def load_meta_data_artifact(artifact_dir: str, key: str) -> dict[str, Any] | None:
+    """
+    Load the processed meta-data (without the embeddings) from the artifact in `artifact_dir`. The lists in the
+    artifact are loaded as tuples, which is what the processed meta-data holds.
+
+    :returns: the processed meta-data, or None if the artifact is missing, unreadable or was generated from other
+        meta-data
+    """
+    try:
+        with open(os.path.join(artifact_dir, META_DATA_ARTIFACT_FILENAME), 'rb') as f:
+            artifact = json.load(
+                f, object_hook=lambda obj: {name: tuple(v) if isinstance(v, list) else v for name, v in obj.items()}
+            )
+    except (OSError, ValueError):
+        return None
+    if not isinstance(artifact, dict) or artifact.get('key') != key:
+        return None
+    return artifact.get('meta_data')
+
+
+def write_meta_data_artifact(artifact_dir: str, key: str, meta_data: Mapping[str, Mapping[str, Any]]):
+    """
+    Write the processed meta-data, without the embeddings (see `write_embedding_store`), as artifact. It is stored as
+    JSON, so that loading it cannot run any code, also when others can write to the `artifact_dir`.
+    """
+    meta_data = {
+        category: {
+            label: {name: value for name, value in article.items() if name != 'embeddings'}
+            for label, article in articles.items()
+        }
+        for category, articles in meta_data.items()
+    }
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    write_atomic(
+        os.path.join(artifact_dir, META_DATA_ARTIFACT_FILENAME),
+        lambda f: f.write(json.dumps({'key': key, 'meta_data': meta_data}, ensure_ascii=False).encode()),
+    )
@@ -0,0 +1,38 @@
+import re
+from collections.abc import Mapping
+
+from flask_babel import get_locale
+from speaklater import make_lazy_string
+
+
+class MetaDataValueTranslator:
+    """
+    Translate meta-data values: first the parts of the value in the string mapping, then the words in the word mapping.
+    The patterns are compiled once, and every distinct value is translated once per locale.
+    """
+
+    def __init__(self, string_mapping: Mapping[str, str], word_mapping: Mapping[str, str]):
+        # the mappings are matched case-insensitively
+        self._string_mapping = {key.lower(): value for key, value in string_mapping.items()}
+        self._word_mapping = {key.lower(): value for key, value in word_mapping.items()}
+        self._string_pattern = re.compile(
+            "|".join(map(re.escape, sorted(self._string_mapping, key=len, reverse=True))), re.IGNORECASE
+        )
+        self._word_pattern = re.compile(
+            rf"(?<![A-Za-z0-9])({'|'.join(map(re.escape, self._word_mapping))})(?![A-Za-z0-9])", re.IGNORECASE
+        )
+        self._translations: dict[tuple[str, str], str] = {}
+
+    def translate(self, value: str, locale: str) -> str:
+        """Translate `value` to `locale`, which must be the current locale of the (lazy) translations."""
+        key = (locale, value)
+        translation = self._translations.get(key)
+        if translation is None:
+            translation = self._string_pattern.sub(lambda m: str(self._string_mapping[m.group(0).lower()]), value)
+            translation = self._word_pattern.sub(lambda m: str(self._word_mapping[m.group(0).lower()]), translation)
+            translation = self._translations[key] = translation.capitalize()
+        return translation
+
+    def __call__(self, value: str) -> str:
+        """Translate `value` to the locale of the request when the returned (lazy) string is rendered."""
+        return make_lazy_string(lambda: self.translate(value, str(get_locale())))
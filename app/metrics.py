@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Flask, Response, before_render_template, current_app, g, request, template_rendered
+
+# the upper bounds (in seconds) of the buckets of the histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# the endpoints running the searches, which are counted as in flight while being handled
+SEARCH_ENDPOINTS = ('results.run_model', 'results.run_model_batch')
+
+# the (stage, seconds) timings of the request handled in the current context, or None when not timing
+_timings: ContextVar[list[tuple[str, float]] | None] = ContextVar('timings', default=None)
+
+
+def get_timings() -> list[tuple[str, float]] | None:
+    """Get the list the stage timings of the current request are collected in, or None when not timing."""
+    return _timings.get()
+
+
+@contextmanager
+def collect_timings(timings: list[tuple[str, float]] | None) -> Iterator[None]:
+    """Collect the stage timings in the context into `timings`, e.g. for the requests of a batch in another thread."""
+    token = _timings.set(timings)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time a stage of handling the current request, when the request is timed (i.e. when `METRICS` is enabled)."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((stage, time.perf_counter() - start))
+
+
+class Histogram:
+    """Cumulative histogram of durations, as a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> Iterator[str]:
+        """Render the samples of the histogram, where `labels` are the other labels of its series."""
+        cumulative = 0
+        for bound, count in zip((*map(str, self.buckets), '+Inf'), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+class Metrics:
+    """
+    Metrics of the requests handled by a (worker) process: histograms of the durations of the requests by endpoint and
+    of their stages (see `timed`), and the number of searches in flight.
+    """
+
+    def __init__(self):
+        self.requests = defaultdict(Histogram)
+        self.stages = defaultdict(Histogram)
+        self.searches_in_flight = 0
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint: str, duration: float, stages: Mapping[str, float]):
+        with self._lock:
+            self.requests[endpoint].observe(duration)
+            for stage, stage_duration in stages.items():
+                self.stages[stage].observe(stage_duration)
+
+    def add_search_in_flight(self, n: int):
+        with self._lock:
+            self.searches_in_flight += n
+
+    def render(self, caches: Mapping[str, Mapping[str, int]]) -> str:
+        """
+        Render the metrics, and the statistics of the `caches` (see `QueryCache.stats`), in the Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            for name, description, histograms, label in (
+                ('vuurwerkverkenner_request_duration_seconds', 'Duration of the requests.', self.requests, 'endpoint'),
+                ('vuurwerkverkenner_stage_duration_seconds', 'Duration of the request stages.', self.stages, 'stage'),
+            ):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for value, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, f'{label}="{value}"'))
+            lines += [
+                '# HELP vuurwerkverkenner_searches_in_flight Number of searches being handled.',
+                '# TYPE vuurwerkverkenner_searches_in_flight gauge',
+                f'vuurwerkverkenner_searches_in_flight {self.searches_in_flight}',
+            ]
+        for name, description, kind in (
+            ('hits', 'Number of cache hits.', 'counter'),
+            ('misses', 'Number of cache misses.', 'counter'),
+            ('shared', 'Number of requests that waited for the in-flight computation of another.', 'counter'),
+            ('hit_ratio', 'Ratio of cache hits to cache lookups.', 'gauge'),
+        ):
+            suffix = '_total' if kind == 'counter' else ''
+            lines += [
+                f'# HELP vuurwerkverkenner_cache_{name}{suffix} {description}',
+                f'# TYPE vuurwerkverkenner_cache_{name}{suffix} {kind}',
+            ]
+            for cache, stats in caches.items():
+                lookups = stats['hits'] + stats['misses'] + stats['shared']
+                value = (stats['hits'] / lookups if lookups else 0.0) if name == 'hit_ratio' else stats[name]
+                lines.append(f'vuurwerkverkenner_cache_{name}{suffix}{{cache="{cache}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app: Flask):
+    """
+    Time the stages of every request, which are returned in the `Server-Timing` header and aggregated in
+    `app.metrics`, which are exposed in the Prometheus text format at `/metrics`.
+    """
+    app.metrics = Metrics()
+
+    @app.before_request
+    def start_timing():
+        g.request_start = time.perf_counter()
+        _timings.set([])
+        if request.endpoint in SEARCH_ENDPOINTS:
+            app.metrics.add_search_in_flight(1)
+            g.search_in_flight = True
+
+    @app.after_request
+    def add_server_timing(response: Response) -> Response:
+        if (timings := _timings.get()) is None:
+            return response
+        duration = time.perf_counter() - g.request_start
+        stages = defaultdict(float)
+        for stage, stage_duration in timings:
+            stages[stage] += stage_duration
+        app.metrics.observe_request(request.endpoint or 'unknown', duration, stages)
+        stages['total'] = duration
+        response.headers['Server-Timing'] = ', '.join(f'{stage};dur={d * 1000:.1f}' for stage, d in stages.items())
+        return response
+
+    @app.teardown_request
+    def stop_timing(_: BaseException | None):
+        _timings.set(None)
+        if g.pop('search_in_flight', False):
+            app.metrics.add_search_in_flight(-1)
+
+    def start_rendering(*_, **__):
+        g.render_start = time.perf_counter()
+
+    def stop_rendering(*_, **__):
+        if (timings := _timings.get()) is not None and 'render_start' in g:
+            timings.append(('render', time.perf_counter() - g.pop('render_start')))
+
+    before_render_template.connect(start_rendering, app, weak=False)
+    template_rendered.connect(stop_rendering, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        caches = {'query': current_app.query_cache.stats, 'page': current_app.page_cache.stats}
+        return Response(current_app.metrics.render(caches), mimetype='text/plain; version=0.0.4')
@@ -17,3 +17,5 @@ RESULTS_NOT_AVAILABLE = lazy_gettext("Resultaten niet (meer) beschikbaar, verken
 RESULTS_NOT_AVAILABLE_FOR_PAGE = lazy_gettext("Geen resultaten beschikbaar voor dit paginanummer")
 NO_MATCH_FOUND = lazy_gettext("Geen resultaten gevonden in de database. Klopt de ingevoerde tekst?")
 TOO_MANY_CHARACTERS = lazy_gettext("Teveel tekens in ingevoerde tekst")
+IMAGE_TOO_LARGE = lazy_gettext("Afbeelding heeft te veel pixels")
+TOO_MANY_IMAGES = lazy_gettext("Te veel foto's")
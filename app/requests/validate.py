@@ -10,12 +10,15 @@ from werkzeug.datastructures import FileStorage
 from app.requests.messages import (
     EMPTY_FILE,
     FILE_READ_FAILURE,
+    IMAGE_TOO_LARGE,
     INVALID_FILE_FORMAT,
     MISSING_CATEGORY,
+    MISSING_IMAGE_FILE,
     MISSING_LABEL,
     MISSING_PAGE_NUMBER,
     MISSING_RESULTS_ID,
     TOO_MANY_CHARACTERS,
+    TOO_MANY_IMAGES,
     WRONG_CATEGORY,
     WRONG_FORMAT_PAGE_NUMBER,
     WRONG_LABEL,
@@ -27,14 +30,28 @@ FILTER_PATTERN = re.compile('[^a-z ]')
 FILTER_PATTERN_INCLUDING_DIGITS = re.compile('[^a-z0-9 ]')
 
 
+class QueryImage(NamedTuple):
+    data: bytes  # the raw image data, which identifies the image
+    image: Image.Image  # the image opened from `data`, of which only the header has been parsed
+
+
 class ProcessedPostRequest(NamedTuple):
-    image_data: bytes | None
+    query_image: QueryImage | None
     query_text: str | None
     text_filter: bool
     include_digits: bool
     errors: list
 
 
+class ProcessedBatchPostRequest(NamedTuple):
+    query_images: list[QueryImage]
+    query_texts: list[str | None]
+    text_filter: bool
+    include_digits: bool
+    fuse: bool
+    errors: list
+
+
 class ProcessedGetRequest(NamedTuple):
     page: int | None = None
     errors: list | None = None
@@ -55,13 +72,26 @@ def clean_text(text: str, include_digits: bool = True) -> str:
     return " ".join(filtered.split())
 
 
-def _validate_image_data(image_data: bytes | None) -> bool:
-    """Check if the image data is valid."""
+def _open_image(image_data: bytes | None) -> Image.Image | None:
+    """
+    Open the image data by parsing its header, and check if it is a valid image. The image itself is decoded later on,
+    when needed.
+
+    :returns: the opened image, or None if the image data is invalid
+    """
     try:
         image = Image.open(io.BytesIO(image_data))
-        return image.format is not None and '.' + image.format.lower() in current_app.config['ALLOWED_EXTENSIONS']
-    except OSError:
-        return False
+    except (OSError, Image.DecompressionBombError):
+        return None
+    if image.format is None or '.' + image.format.lower() not in current_app.config['ALLOWED_EXTENSIONS']:
+        return None
+    return image
+
+
+def _check_image_pixels(image: Image.Image) -> bool:
+    """Check if the number of pixels of the (opened) image is within the limit."""
+    width, height = image.size
+    return width * height <= current_app.config.get('MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
 
 
 def _check_text_length(text: str) -> str:
@@ -69,22 +99,26 @@ def _check_text_length(text: str) -> str:
     return len(text) <= current_app.config['MAX_CHARS_TEXT_FILTER']
 
 
-def _process_uploaded_file(file: FileStorage) -> tuple[bytes | None, list[str]]:
+def _process_uploaded_file(file: FileStorage) -> tuple[QueryImage | None, list[str]]:
     """Process the uploaded file from the form supplied by the user."""
     errors = []
-    image_data = None
+    query_image = None
 
     try:
         # otherwise, try to parse the binary image data
         image_data = file.read()
         if not image_data:
             errors.append(EMPTY_FILE)
-        elif not _validate_image_data(image_data):
+        elif (image := _open_image(image_data)) is None:
             errors.append(INVALID_FILE_FORMAT)
+        elif not _check_image_pixels(image):
+            errors.append(IMAGE_TOO_LARGE)
+        else:
+            query_image = QueryImage(data=image_data, image=image)
     except Exception:
         errors.append(FILE_READ_FAILURE)
 
-    return image_data, errors
+    return query_image, errors
 
 
 def _get_page_number_from_request(r: Request) -> tuple[int | None, list[str]]:
@@ -106,7 +140,7 @@ def _get_page_number_from_request(r: Request) -> tuple[int | None, list[str]]:
 def process_post_request(post_request: Request) -> ProcessedPostRequest:
     """Process POST-request."""
     errors = []
-    image_data = None
+    query_image = None
 
     if post_request.files:
         file = post_request.files.get('file')
@@ -116,10 +150,10 @@ def process_post_request(post_request: Request) -> ProcessedPostRequest:
             # an empty file without a filename.
             errors.append(EMPTY_FILE)
         if file:
-            image_data, errors_file = _process_uploaded_file(file)
+            query_image, errors_file = _process_uploaded_file(file)
             errors.extend(errors_file)
     return ProcessedPostRequest(
-        image_data=image_data,
+        query_image=query_image,
         query_text=post_request.form.get('query_text'),
         text_filter=post_request.form.get('text_filter', '').lower() == 'true',
         include_digits=post_request.form.get('include_digits', '').lower() == 'true',
@@ -127,6 +161,37 @@ def process_post_request(post_request: Request) -> ProcessedPostRequest:
     )
 
 
+def process_batch_post_request(post_request: Request) -> ProcessedBatchPostRequest:
+    """Process POST-request with several images (`file`), and optionally a query text for every image (`query_text`)."""
+    errors = []
+    query_images = []
+
+    files = post_request.files.getlist('file')
+    if not files:
+        errors.append(MISSING_IMAGE_FILE)
+    elif len(files) > current_app.config.get('SEARCH_BATCH_MAX_IMAGES', 16):
+        errors.append(TOO_MANY_IMAGES)
+    else:
+        for file in files:
+            if file.filename == '':
+                errors.append(EMPTY_FILE)
+                continue
+            query_image, errors_file = _process_uploaded_file(file)
+            errors.extend(errors_file)
+            query_images.append(query_image)
+
+    # the query texts are matched to the images by their order, images without a query text get None
+    query_texts = post_request.form.getlist('query_text')[: len(query_images)]
+    return ProcessedBatchPostRequest(
+        query_images=query_images,
+        query_texts=query_texts + [None] * (len(query_images) - len(query_texts)),
+        text_filter=post_request.form.get('text_filter', '').lower() == 'true',
+        include_digits=post_request.form.get('include_digits', '').lower() == 'true',
+        fuse=post_request.form.get('fuse', '').lower() == 'true',
+        errors=errors,
+    )
+
+
 def process_query_text(query_text, include_digits) -> tuple[str | None, list[str]]:
     errors = []
     if query_text:
@@ -0,0 +1,87 @@
+import json
+import os
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+from huggingface_hub import snapshot_download
+from huggingface_hub.hf_api import HfApi
+
+from app.embedding_store import get_file_digest, write_atomic
+
+SNAPSHOT_MANIFEST_FILENAME = '.snapshot_manifest.json'
+
+
+def read_snapshot_manifest(local_dir: str) -> Mapping[str, Any] | None:
+    """Read the manifest written by `sync_snapshot`, or return None if there is no (valid) manifest."""
+    try:
+        with open(os.path.join(local_dir, SNAPSHOT_MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+        return manifest if {'repo_id', 'revision', 'files'} <= manifest.keys() else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_snapshot_revision(local_dir: str) -> str | None:
+    """Get the revision (commit sha) of the snapshot in `local_dir` recorded at download time, without any requests."""
+    manifest = read_snapshot_manifest(local_dir)
+    return manifest['revision'] if manifest else None
+
+
+def write_snapshot_manifest(local_dir: str, repo_id: str, revision: str, filenames: Iterable[str]):
+    """Record the revision of a downloaded snapshot, and the size, modification time and digest of its files."""
+    files = {}
+    for filename in filenames:
+        path = os.path.join(local_dir, filename)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            files[filename] = [stat.st_size, stat.st_mtime_ns, get_file_digest(path)]
+    manifest = {'repo_id': repo_id, 'revision': revision, 'files': files}
+    write_atomic(os.path.join(local_dir, SNAPSHOT_MANIFEST_FILENAME), lambda f: f.write(json.dumps(manifest).encode()))
+
+
+def verify_snapshot(local_dir: str, repo_id: str) -> str:
+    """
+    Verify the files of the snapshot of `repo_id` in `local_dir` against its manifest. The digest of a file is only
+    computed again when its size or modification time differs from the recorded one.
+
+    :returns: the recorded revision of the snapshot
+    :raises ValueError: if there is no manifest for `repo_id`, or a file is missing or modified
+    """
+    manifest = read_snapshot_manifest(local_dir)
+    if manifest is None or manifest['repo_id'] != repo_id:
+        raise ValueError(f'No snapshot of {repo_id} found in {local_dir}, download it without `OFFLINE` first')
+    for filename, (size, mtime_ns, digest) in manifest['files'].items():
+        path = os.path.join(local_dir, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise ValueError(f'{filename} of the snapshot of {repo_id} is missing in {local_dir}') from None
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns) and get_file_digest(path) != digest:
+            raise ValueError(f'{filename} of the snapshot of {repo_id} in {local_dir} is modified')
+    return manifest['revision']
+
+
+def sync_snapshot(repo_id: str, local_dir: str, repo_type: str = 'model', offline: bool = False) -> str:
+    """
+    Make sure `local_dir` holds the latest snapshot of a HuggingFace repository. Online, the latest revision is looked
+    up and only downloaded when the local snapshot is of another revision, or its files do not match the manifest.
+    Offline, the local snapshot is only verified against its manifest, without any requests.
+
+    :param repo_id: the id of the HuggingFace repository
+    :param local_dir: the directory of the snapshot
+    :param repo_type: the type of the repository, 'model' or 'dataset'
+    :param offline: whether to use the local snapshot without any requests
+    :returns: the revision (commit sha) of the snapshot
+    """
+    if offline:
+        return verify_snapshot(local_dir, repo_id)
+
+    info = HfApi().repo_info(repo_id=repo_id, repo_type=repo_type, revision='main')
+    try:
+        if verify_snapshot(local_dir, repo_id) == info.sha:
+            return info.sha
+    except ValueError:
+        pass
+    snapshot_download(repo_id=repo_id, repo_type=repo_type, local_dir=local_dir, revision=info.sha)
+    write_snapshot_manifest(local_dir, repo_id, info.sha, (sibling.rfilename for sibling in info.siblings or ()))
+    return info.sha
@@ -0,0 +1,94 @@
+import os
+import tempfile
+from collections.abc import Iterator, Sequence
+
+from PIL import Image
+
+THUMBNAILS_DIRNAME = 'thumbnails'
+
+
+def select_thumbnail_width(widths: Sequence[int], width: int) -> int:
+    """Select the smallest thumbnail width of at least `width`, or the largest thumbnail width if there is none."""
+    return min((w for w in widths if w >= width), default=max(widths))
+
+
+def get_thumbnail_path(thumbnail_dir: str, filename: str, width: int) -> str:
+    """Get the path of the WebP thumbnail of `width` pixels wide of the reference image `filename`."""
+    return os.path.join(thumbnail_dir, str(width), f'{filename}.webp')
+
+
+def is_thumbnail_valid(image_path: str, thumbnail_path: str) -> bool:
+    """Check whether the thumbnail was generated from the current version of the image (see `generate_thumbnail`)."""
+    try:
+        return os.stat(thumbnail_path).st_mtime_ns == os.stat(image_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def generate_thumbnail(image_path: str, thumbnail_path: str, width: int, quality: int = 80):
+    """
+    Generate a WebP thumbnail of (at most) `width` pixels wide of an image. The thumbnail gets the modification time of
+    the image, so that it is generated again when the image is modified, and is replaced atomically, so that processes
+    generating the thumbnail concurrently do not read partially written files.
+    """
+    with Image.open(image_path) as source:
+        source.draft('RGB', (width, width * source.height // source.width))
+        image = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    if image.width > width:
+        image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.Resampling.LANCZOS)
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(thumbnail_path), suffix='.webp', delete=False) as f:
+        image.save(f, format='WEBP', quality=quality, method=4)
+    stat = os.stat(image_path)
+    os.utime(f.name, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(f.name, thumbnail_path)
+
+
+def get_thumbnail(reference_data_dir: str, thumbnail_dir: str, filename: str, width: int) -> str | None:
+    """
+    Get the path of the thumbnail of a reference image, if it has been generated (see `generate_thumbnails`) and is up
+    to date. Thumbnails are only generated with `generate_thumbnails`, so that requests never decode and resize images.
+
+    :param reference_data_dir: the directory of the reference images
+    :param thumbnail_dir: the directory of the thumbnails
+    :param filename: the path of the image relative to `reference_data_dir`
+    :param width: the width of the thumbnail
+    :returns: the path of the thumbnail, or None if there is no up-to-date thumbnail
+    """
+    thumbnail_path = get_thumbnail_path(thumbnail_dir, filename, width)
+    if not is_thumbnail_valid(os.path.join(reference_data_dir, filename), thumbnail_path):
+        return None
+    return thumbnail_path
+
+
+def has_image_extension(filename: str, extensions: Sequence[str]) -> bool:
+    """Check whether `filename` has one of the (lower case) image `extensions`, regardless of its case."""
+    return os.path.splitext(filename)[1].lower() in extensions
+
+
+def iter_reference_images(reference_data_dir: str, extensions: Sequence[str]) -> Iterator[str]:
+    """Iterate over the paths of all images in the reference data, relative to `reference_data_dir`."""
+    for directory, _, filenames in os.walk(reference_data_dir):
+        for filename in sorted(filenames):
+            if has_image_extension(filename, extensions):
+                yield os.path.relpath(os.path.join(directory, filename), reference_data_dir)
+
+
+def generate_thumbnails(
+    reference_data_dir: str, thumbnail_dir: str, widths: Sequence[int], extensions: Sequence[str], quality: int = 80
+) -> int:
+    """
+    Generate the thumbnails of all widths for all images in the reference data, skipping the thumbnails which are up to
+    date.
+
+    :returns: the number of generated thumbnails
+    """
+    n_generated = 0
+    for filename in iter_reference_images(reference_data_dir, extensions):
+        image_path = os.path.join(reference_data_dir, filename)
+        for width in widths:
+            thumbnail_path = get_thumbnail_path(thumbnail_dir, filename, width)
+            if not is_thumbnail_valid(image_path, thumbnail_path):
+                generate_thumbnail(image_path, thumbnail_path, width, quality)
+                n_generated += 1
+    return n_generated
@@ -0,0 +1,230 @@
+import logging
+import math
+import os
+import queue
+import re
+import time
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Barrier
+from typing import Any, NamedTuple
+
+import torch
+
+from app.calculations.models.base import EmbeddingModel
+
+CGROUP_DIR = '/sys/fs/cgroup'
+
+
+class ThreadCounts(NamedTuple):
+    intra_op: int
+    inter_op: int
+
+
+class Calibration(NamedTuple):
+    threads: ThreadCounts
+    throughput: float  # images per second of all processes together
+    latency: float  # mean latency of a forward pass in milliseconds
+
+
+def get_available_cpus(cgroup_dir: str = CGROUP_DIR) -> int:
+    """
+    Get the number of CPUs this process can use: the CPUs it may run on, limited by the CPU quota of its cgroup (e.g.
+    the CPU limit of its container), of which a fraction counts as a CPU.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    if quota := _get_cgroup_cpu_quota(cgroup_dir):
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def _get_cgroup_cpu_quota(cgroup_dir: str) -> float | None:
+    """Get the CPU quota (in CPUs) of cgroup v2 (`cpu.max`) or v1 (`cpu.cfs_quota_us`), or None if it is unlimited."""
+    try:
+        with open(os.path.join(cgroup_dir, 'cpu.max')) as f:
+            quota, period = f.read().split()
+        return int(quota) / int(period) if quota != 'max' else None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(cgroup_dir, 'cpu', 'cpu.cfs_quota_us')) as f:
+            quota = int(f.read())
+        with open(os.path.join(cgroup_dir, 'cpu', 'cpu.cfs_period_us')) as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def get_model_processes(app_config: Mapping[str, Any]) -> int:
+    """
+    Get the number of processes running the model next to each other: the inference workers (see
+    `INFERENCE_SOCKET`), or the application processes, which default to `WEB_CONCURRENCY` (as for gunicorn).
+    """
+    if app_config.get('INFERENCE_SOCKET'):
+        return app_config.get('INFERENCE_WORKERS', 1)
+    return app_config.get('APP_PROCESSES') or int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+
+def get_thread_counts(
+    n_processes: int, available_cpus: int, intra_op: int | None = None, inter_op: int | None = None
+) -> ThreadCounts:
+    """
+    Divide the available CPUs over the processes running the model, so that their torch runtimes do not oversubscribe
+    the CPUs under load. Every process runs a single forward pass at a time (see `BatchScheduler`), which is
+    parallelized over its intra-op threads, so a single inter-op thread suffices.
+
+    :param n_processes: the number of processes running the model
+    :param available_cpus: the number of CPUs available to all processes together, see `get_available_cpus`
+    :param intra_op: the number of intra-op threads per process, which overrides the computed number
+    :param inter_op: the number of inter-op threads per process, which overrides the computed number
+    :returns: the numbers of intra-op and inter-op threads per process
+    """
+    return ThreadCounts(intra_op or max(available_cpus // max(n_processes, 1), 1), inter_op or 1)
+
+
+def configure_torch_threads(threads: ThreadCounts):
+    """
+    Set the numbers of torch threads of this process. The number of inter-op threads can only be set before torch
+    runs any inter-op work, so it is kept (with a warning) when it cannot be changed anymore.
+    """
+    torch.set_num_threads(threads.intra_op)
+    if torch.get_num_interop_threads() != threads.inter_op:
+        try:
+            torch.set_num_interop_threads(threads.inter_op)
+        except RuntimeError:
+            logging.warning(
+                f'Cannot change the number of inter-op threads to {threads.inter_op} anymore, '
+                f'keeping {torch.get_num_interop_threads()}'
+            )
+
+
+def configure_torch_threads_from_config(app_config: Mapping[str, Any]) -> ThreadCounts:
+    """Configure the torch threads of a process running the model, from `TORCH_THREADS` and `TORCH_INTEROP_THREADS`."""
+    threads = get_thread_counts(
+        get_model_processes(app_config),
+        get_available_cpus(),
+        intra_op=app_config.get('TORCH_THREADS'),
+        inter_op=app_config.get('TORCH_INTEROP_THREADS'),
+    )
+    configure_torch_threads(threads)
+    return threads
+
+
+def get_candidate_thread_counts(
+    n_processes: int, available_cpus: int, inter_op: Iterable[int] = (1, 2)
+) -> list[ThreadCounts]:
+    """
+    Get the thread counts to calibrate: powers of two intra-op threads up to the CPUs per process, and the even share
+    of the CPUs per process (see `get_thread_counts`), combined with every number of inter-op threads.
+    """
+    share = get_thread_counts(n_processes, available_cpus).intra_op
+    intra_op = sorted({2**i for i in range(share.bit_length()) if 2**i <= share} | {share})
+    return [ThreadCounts(intra, inter) for inter in inter_op for intra in intra_op]
+
+
+def calibrate_threads(
+    load_model: Callable[[], EmbeddingModel],
+    candidates: Sequence[ThreadCounts],
+    n_processes: int,
+    batch_size: int = 1,
+    n_iterations: int = 10,
+) -> list[Calibration]:
+    """
+    Measure the forward-pass throughput of the embedding model for every candidate thread count, with `n_processes`
+    processes running forward passes concurrently (as the processes running the model would run them), so that the
+    oversubscription of the CPUs by their torch threads is measured as well. For every candidate, new (spawned)
+    processes are started, since the number of inter-op threads cannot be changed once it is used.
+
+    :param load_model: picklable function loading the embedding model
+    :param candidates: the thread counts to measure
+    :param n_processes: the number of processes running the model concurrently
+    :param batch_size: the number of images per forward pass
+    :param n_iterations: the number of forward passes of every concurrent process
+    :returns: the throughput and mean latency for every candidate
+    :raises RuntimeError: if a process exits without reporting its measurements (e.g. when loading the model fails)
+    """
+    context = get_context('spawn')
+    calibrations = []
+    for threads in candidates:
+        # the processes load the model and run a warm-up pass, after which they start measuring together
+        barrier, results = context.Barrier(n_processes), context.Queue()
+        processes = [
+            context.Process(
+                target=_measure_forward_passes,
+                args=(load_model, threads, batch_size, n_iterations, barrier, results),
+                daemon=True,
+            )
+            for _ in range(n_processes)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            measurements = [_get_result(results, processes) for _ in processes]
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        # the processes run concurrently, so all images are processed within the time of the slowest process
+        elapsed = max(elapsed for elapsed, _ in measurements)
+        latencies = [latency for _, process_latencies in measurements for latency in process_latencies]
+        throughput = n_processes * n_iterations * batch_size / elapsed
+        calibrations.append(Calibration(threads, throughput, sum(latencies) / len(latencies) * 1000))
+    return calibrations
+
+
+def _get_result(results: Queue, processes: Sequence[BaseProcess]) -> Any:
+    """Get the next result of the `processes`, failing when one of them has exited on an error."""
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if any(process.exitcode for process in processes):
+                raise RuntimeError('a process measuring the throughput of the model exited unexpectedly') from None
+
+
+def _measure_forward_passes(
+    load_model: Callable[[], EmbeddingModel],
+    threads: ThreadCounts,
+    batch_size: int,
+    n_iterations: int,
+    barrier: Barrier,
+    results: Queue,
+):
+    """
+    Run `n_iterations` forward passes with the given thread counts, starting together with the other processes at the
+    `barrier`, and report the elapsed time and the latencies of the forward passes (in seconds) on `results`.
+    """
+    configure_torch_threads(threads)
+    model = load_model().eval()
+    inputs = torch.rand(batch_size, 3, model.input_size, model.input_size)
+    latencies = []
+    with torch.no_grad():
+        model.embed(inputs)  # warm-up
+        barrier.wait(timeout=600)
+        start = time.perf_counter()
+        for _ in range(n_iterations):
+            iteration_start = time.perf_counter()
+            model.embed(inputs)
+            latencies.append(time.perf_counter() - iteration_start)
+        elapsed = time.perf_counter() - start
+    results.put((elapsed, latencies))
+
+
+def write_config_values(filename: str, values: Mapping[str, Any]):
+    """
+    Set configuration values in a Python configuration file (e.g. `setup.cfg`), replacing their assignments if they
+    are in the file already, and adding them at the end otherwise.
+    """
+    with open(filename) as f:
+        text = f.read()
+    for key, value in values.items():
+        assignment = f'{key} = {value!r}'
+        text, n = re.subn(rf'^{re.escape(key)}\s*=.*$', lambda _: assignment, text, flags=re.MULTILINE)
+        if not n:
+            text = text.rstrip('\n') + f'\n{assignment}\n'
+    with open(filename, 'w') as f:
+        f.write(text)
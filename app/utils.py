@@ -1,5 +1,6 @@
+import hashlib
+
 from flask import Response, current_app, redirect, request, url_for
-from huggingface_hub.hf_api import HfApi
 
 
 def redirect_to(page: str) -> Response:
@@ -18,13 +19,26 @@ def get_locale() -> str:
     return lang_code
 
 
-def get_commit_hash_model(repo_id: str) -> str:
-    """Get the commit hash of the main branch of the model in `repo_id`."""
-    api = HfApi()
-    return api.repo_info(repo_id=repo_id, repo_type='model', revision='main').sha[:7]
+def get_etag(*parts: str) -> str:
+    """Build the ETag of a response from everything the content of the response depends on."""
+    return hashlib.blake2b('\0'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def is_not_modified(etag: str) -> bool:
+    """Check whether the client already has the version `etag` of the requested resource."""
+    return request.if_none_match.contains(etag)
 
 
-def get_commit_hash_data(repo_id: str) -> str:
-    """Get the commit hash of the main branch of the dataset in `repo_id`."""
-    api = HfApi()
-    return api.repo_info(repo_id=repo_id, repo_type='dataset', revision='main').sha[:7]
+def add_cache_headers(response: Response, etag: str, private: bool = False) -> Response:
+    """
+    Let clients cache a response for `HTTP_CACHE_MAX_AGE` seconds, after which they revalidate it with its ETag.
+    Private responses depend on the locale cookie, and are only cached by the browser.
+    """
+    response.set_etag(etag)
+    response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 24 * 60 * 60)
+    if private:
+        response.cache_control.private = True
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.public = True
+    return response
@@ -0,0 +1,82 @@
+"""
+Report the recall and latency of the approximate nearest-neighbour index of `EmbeddingClassifier` compared to exact
+scoring, on the demo data and on synthetic reference databases. The recall is the fraction of the exact top-k labels
+that is also found in the approximate top-k labels, using perturbed reference embeddings as queries.
+
+Run with `python -m benchmarks.ann_recall`.
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel
+from benchmarks.utils import TINY_VIT_CONFIG, measure, synthetic_embeddings
+
+DEMO_META_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tests/resources/demo_data/reference_data/meta.json.gz'
+)
+
+
+def load_demo_embeddings() -> dict:
+    with gzip.open(DEMO_META_DATA) as f:
+        meta_data = json.load(f)
+    return {
+        category: {label: {'embeddings': np.asarray(article['embeddings'])} for label, article in articles.items()}
+        for category, articles in meta_data.items()
+    }
+
+
+def sample_queries(classifier: EmbeddingClassifier, n_queries: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = classifier.reference_matrix[rng.choice(len(classifier.reference_matrix), size=n_queries)]
+    return queries + noise * rng.standard_normal(queries.shape).astype(np.float32)
+
+
+def top_labels(scores: np.ndarray, k: int) -> set[int]:
+    return set(np.argsort(-scores, kind='stable')[:k].tolist())
+
+
+def report(name: str, meta_data: dict, n_lists: int, n_probes: list[int], top_k: int, k: int, n_queries: int):
+    model = ViTEmbeddingModel(config=TINY_VIT_CONFIG)
+    exact = EmbeddingClassifier(model=model)
+    exact.update_embeddings(meta_data)
+    queries = sample_queries(exact, n_queries=n_queries)
+    exact_scores = exact.score(queries)
+    exact_latency = measure(lambda: [exact.score(query[None]) for query in queries], repeat=3) / n_queries
+    k = min(k, len(exact.labels))
+
+    print(f"\n{name}: {len(exact.labels)} labels, {len(exact.reference_matrix)} embeddings, {n_lists} lists")
+    print(f"{'n_probe':>8} {'recall@1':>9} {f'recall@{k}':>10} {'latency (ms)':>13} {'exact (ms)':>11}")
+    for n_probe in n_probes:
+        approximate = EmbeddingClassifier(model=model, n_lists=n_lists, n_probe=n_probe, top_k=top_k)
+        approximate.update_embeddings(meta_data)
+        approximate_scores = approximate.score(queries)
+        recall_1, recall_k = (
+            np.mean([len(top_labels(e, n) & top_labels(a, n)) / n for e, a in zip(exact_scores, approximate_scores)])
+            for n in (1, k)
+        )
+        latency = measure(lambda: [approximate.score(query[None]) for query in queries], repeat=3) / n_queries
+        print(f"{n_probe:>8} {recall_1:>9.3f} {recall_k:>10.3f} {latency:>13.3f} {exact_latency:>11.3f}")
+
+
+def main(sizes: list[int], n_probes: list[int], top_k: int, k: int, n_queries: int):
+    report('demo data', load_demo_embeddings(), n_lists=4, n_probes=[1, 2, 4], top_k=2, k=2, n_queries=n_queries)
+    for n_labels in sizes:
+        meta_data = synthetic_embeddings(n_labels=n_labels)
+        n_lists = int(np.sqrt(n_labels * 35))
+        report('synthetic', meta_data, n_lists=n_lists, n_probes=n_probes, top_k=top_k, k=k, n_queries=n_queries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--n-probes', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--top-k', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-queries', type=int, default=50)
+    args = parser.parse_args()
+    main(sizes=args.sizes, n_probes=args.n_probes, top_k=args.top_k, k=args.k, n_queries=args.n_queries)
@@ -0,0 +1,50 @@
+"""
+Compare searching N photos with a single request to `/search/batch`, which decodes them in parallel and embeds and
+scores them in a single batch, to N requests to `/search`, on the demo data with the tiny test model.
+
+Run with `python -m benchmarks.batch_search`.
+"""
+
+import argparse
+import io
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.utils import create_demo_app, measure
+
+
+def main(n_images: list[int], image_size: int, repeat: int):
+    # without the query cache, so that every search runs the model again
+    client = create_demo_app(QUERY_CACHE_SIZE=0).test_client()
+    rng = np.random.default_rng(0)
+    photos = []
+    for _ in range(max(n_images)):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (image_size, image_size, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+        photos.append(buffer.getvalue())
+
+    def search(n: int):
+        for data in photos[:n]:
+            if 'results_id' not in client.post('/search', data={'file': (io.BytesIO(data), 'photo.jpg')}).get_json():
+                raise RuntimeError('the search failed')
+
+    def batch_search(n: int):
+        files = [(io.BytesIO(data), 'photo.jpg') for data in photos[:n]]
+        if 'results_ids' not in client.post('/search/batch', data={'file': files}).get_json():
+            raise RuntimeError('the batch search failed')
+
+    print(f"{'photos':>7} {'/search (ms)':>13} {'/search/batch (ms)':>19} {'speed-up':>9}")
+    for n in n_images:
+        sequential = measure(lambda: search(n), repeat=repeat)
+        batched = measure(lambda: batch_search(n), repeat=repeat)
+        print(f"{n:>7} {sequential:>13.1f} {batched:>19.1f} {sequential / batched:>8.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-images', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(n_images=args.n_images, image_size=args.image_size, repeat=args.repeat)
@@ -0,0 +1,46 @@
+"""
+Benchmark the scoring step of `EmbeddingClassifier.predict` against the size of the reference database, comparing the
+single-matmul implementation with the former loop of one `cdist` call per label.
+
+Run with `python -m benchmarks.embedding_classifier`.
+"""
+
+import argparse
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel
+from benchmarks.utils import TINY_VIT_CONFIG, measure, synthetic_embeddings
+
+
+def score_per_label(classifier: EmbeddingClassifier, embeddings: np.ndarray) -> np.ndarray:
+    """Score the embeddings as the former implementation did, with one `cdist` call per label."""
+    scores = []
+    for start, end in zip(classifier.label_offsets[:-1], classifier.label_offsets[1:]):
+        dists = cdist(embeddings, classifier.reference_matrix[start:end], metric=classifier.metric)
+        scores.extend(classifier.class_aggregator(dists, axis=-1))
+    return 1 - np.asarray(scores) / 2.0
+
+
+def main(sizes: list[int], repeat: int):
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=TINY_VIT_CONFIG))
+    query = synthetic_embeddings(n_labels=1, n_embeddings=1, seed=1)['category 0']['label 0']['embeddings']
+
+    print(f"{'labels':>8} {'embeddings':>11} {'per label (ms)':>15} {'matmul (ms)':>12} {'speedup':>8}")
+    for n_labels in sizes:
+        classifier.update_embeddings(synthetic_embeddings(n_labels=n_labels))
+        baseline = measure(lambda: score_per_label(classifier, query), repeat=repeat)
+        vectorized = measure(lambda: classifier.score(query), repeat=repeat)
+        print(
+            f"{n_labels:>8} {len(classifier.reference_matrix):>11} {baseline:>15.2f} {vectorized:>12.2f} "
+            f"{baseline / vectorized:>7.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    main(sizes=args.sizes, repeat=args.repeat)
@@ -0,0 +1,69 @@
+"""
+Report the startup time and memory usage of worker processes loading the reference embeddings, with and without the
+memory-mapped embedding store. All workers load the meta-data and reference matrix of the same synthetic database
+concurrently, like gunicorn workers do. With the embedding store, the workers share the pages of the reference matrix
+(the PSS, in which shared pages are divided over the processes using them, drops), while without it every worker holds
+a private copy.
+
+Run with `python -m benchmarks.embedding_store` (Linux only).
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+import time
+
+from benchmarks.utils import get_memory_usage, write_synthetic_reference_data
+
+
+def load_worker(app_config: dict, barrier, results):
+    # imported in the worker, so that the import time and memory are part of the baseline of each worker
+    from app.app import get_meta_data
+    from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel
+    from benchmarks.utils import TINY_VIT_CONFIG
+
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=TINY_VIT_CONFIG))
+    before = get_memory_usage()
+    start = time.perf_counter()
+    classifier.update_embeddings(get_meta_data(app_config=app_config))
+    duration = time.perf_counter() - start
+    barrier.wait(timeout=600)  # measure while all workers hold the reference matrix
+    after = get_memory_usage()
+    results.put((duration, after['Rss'] - before['Rss'], after['Pss'] - before['Pss']))
+    barrier.wait(timeout=600)
+
+
+def run_workers(app_config: dict, n_workers: int) -> list[tuple[float, float, float]]:
+    context = multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(n_workers), context.Queue()
+    workers = [context.Process(target=load_worker, args=(app_config, barrier, results)) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    measurements = [results.get(timeout=600) for _ in workers]
+    for worker in workers:
+        worker.join()
+    return measurements
+
+
+def main(n_labels: int, n_workers: int):
+    with tempfile.TemporaryDirectory() as meta_data_dir, tempfile.TemporaryDirectory() as artifact_dir:
+        app_config = write_synthetic_reference_data(meta_data_dir, n_labels=n_labels) | {'ARTIFACT_DIR': artifact_dir}
+        print(f"{n_labels} labels, {n_workers} workers (memory added by loading the reference data, per worker)")
+        print(f"{'mode':>18} {'startup (s)':>12} {'RSS (MiB)':>10} {'PSS (MiB)':>10}")
+        modes = {
+            'private copies': app_config | {'EMBEDDING_STORE': False},
+            'store (first run)': app_config,
+            'store': app_config,
+        }
+        for mode, config in modes.items():
+            measurements = run_workers(config, n_workers=1 if mode == 'store (first run)' else n_workers)
+            duration, rss, pss = (sum(values) / len(values) for values in zip(*measurements))
+            print(f"{mode:>18} {duration:>12.2f} {rss:>10.1f} {pss:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, default=2_000)
+    parser.add_argument('--n-workers', type=int, default=3)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, n_workers=args.n_workers)
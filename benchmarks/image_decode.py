@@ -0,0 +1,66 @@
+"""
+Compare the latency and peak memory of decoding and preprocessing uploaded images at full resolution to decoding them
+at a reduced resolution (with decoder-level downscaling for JPEG), for synthetic photos of increasing size.
+
+Run with `python -m benchmarks.image_decode`.
+"""
+
+import argparse
+import io
+import multiprocessing
+
+import numpy as np
+from PIL import Image
+
+from app.calculations.models import ViTEmbeddingModel
+from app.calculations.models.utils import convert_bytes_to_pil_image, convert_pil_image_to_numpy
+from benchmarks.utils import TINY_VIT_CONFIG, measure, measure_peak_memory
+
+
+def synthetic_photo(megapixels: float, image_format: str, seed: int = 0) -> bytes:
+    """Encode a smooth image with some noise, which compresses roughly like a photo."""
+    width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(height // 64 + 1, width // 64 + 1, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), resample=Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def measure_preprocessing(image: bytes, image_size: int, size: int | None, repeat: int) -> tuple[float, float]:
+    """
+    Measure the peak memory and latency of decoding and preprocessing an image. This is run in a fresh process, since
+    memory freed by earlier measurements stays resident and would hide the peak memory usage.
+    """
+    model = ViTEmbeddingModel(config=TINY_VIT_CONFIG.model_copy(update={'image_size': image_size}))
+
+    def preprocess():
+        return model.preprocess(convert_pil_image_to_numpy(convert_bytes_to_pil_image(image, size=size)))
+
+    return measure_peak_memory(preprocess), measure(preprocess, repeat=repeat)
+
+
+def main(megapixels: list[float], image_formats: list[str], image_size: int, repeat: int):
+    print(f"{'format':>6} {'MP':>5} {'MiB':>6} {'mode':>8} {'latency (ms)':>13} {'peak memory (MiB)':>18}")
+    context = multiprocessing.get_context('spawn')
+    for image_format in image_formats:
+        for mp in megapixels:
+            image = synthetic_photo(mp, image_format)
+            for mode, size in (('full', None), ('reduced', image_size)):
+                with context.Pool(1) as pool:
+                    peak, latency = pool.apply(measure_preprocessing, (image, image_size, size, repeat))
+                print(
+                    f"{image_format:>6} {mp:>5.0f} {len(image) / 2**20:>6.1f} {mode:>8} {latency:>13.1f} {peak:>18.1f}"
+                )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[1, 4, 12, 24])
+    parser.add_argument('--formats', type=str, nargs='+', default=['JPEG', 'PNG'])
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main(megapixels=args.megapixels, image_formats=args.formats, image_size=args.image_size, repeat=args.repeat)
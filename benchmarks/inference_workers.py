@@ -0,0 +1,130 @@
+"""
+Compare running the model in every application process to running it in dedicated inference worker processes (see
+`InferenceServer`), which the application processes send their preprocessed images to. Reports the memory the model
+takes in an application process, the memory of an application process with the model and of all inference worker
+processes together (where the reference embeddings in the memory-mapped embedding store are shared by the workers),
+and the throughput of `--clients` concurrent clients (as the application processes would be) for every number of
+workers.
+
+Run with `python -m benchmarks.inference_workers`.
+"""
+
+import argparse
+import functools
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+
+import numpy as np
+import torch
+
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel
+from app.calculations.workers import InferenceServer, RemoteClassifier
+from app.embedding_store import load_embedding_store, write_embedding_store
+from benchmarks.utils import TINY_VIT_CONFIG, get_memory_usage, synthetic_embeddings
+
+STORE_KEY = 'benchmark'
+
+
+def load_classifier(store_dir: str, image_size: int, patch_size: int) -> EmbeddingClassifier:
+    """Load a randomly initialized classifier, with the memory-mapped reference embeddings of the store."""
+    torch.manual_seed(0)
+    config = TINY_VIT_CONFIG.model_copy(update={'image_size': image_size, 'patch_size': patch_size})
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=config))
+    matrix, rows = load_embedding_store(store_dir, STORE_KEY)
+    meta_data = {}
+    for (category, label), label_rows in rows.items():
+        meta_data.setdefault(category, {})[label] = {'embeddings': matrix[label_rows]}
+    classifier.update_embeddings(meta_data)
+    return classifier
+
+
+def throughput(connect: Callable[[], Callable], instance: torch.Tensor, n_clients: int, n_requests: int) -> float:
+    """
+    Return the number of predictions per second of `n_clients` threads making `n_requests` predictions each, with the
+    `predict_batch` function returned by `connect` for every client.
+    """
+
+    def client(predict_batch: Callable):
+        for _ in range(n_requests):
+            predict_batch([instance])
+
+    threads = [threading.Thread(target=client, args=(connect(),)) for _ in range(n_clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return n_clients * n_requests / (time.perf_counter() - start)
+
+
+def main(
+    n_labels: int,
+    n_embeddings: int,
+    workers: list[int],
+    n_clients: int,
+    n_requests: int,
+    image_size: int,
+    patch_size: int,
+):
+    with tempfile.TemporaryDirectory() as store_dir:
+        write_embedding_store(store_dir, STORE_KEY, synthetic_embeddings(n_labels=n_labels, n_embeddings=n_embeddings))
+        load_model = functools.partial(load_classifier, store_dir, image_size, patch_size)
+        image = np.random.default_rng(0).integers(0, 256, size=(image_size, image_size, 3), dtype=np.uint8)
+
+        before = get_memory_usage()
+        model = load_model()
+        instance = model.preprocess(image)
+        model.predict_batch([instance])
+        after = get_memory_usage()
+        lock = threading.Lock()
+
+        def predict_batch(instances):
+            # a single model in the process, as in every application process without inference workers
+            with lock:
+                return model.predict_batch(instances)
+
+        local = throughput(lambda: predict_batch, instance, n_clients, n_requests)
+        print(f"model in an application process: {after['Rss'] - before['Rss']:.0f} MiB RSS")
+        print(f"{'processes':>12} {'RSS (MiB)':>10} {'PSS (MiB)':>10} {'predictions/s':>14}")
+        print(f"{'application':>12} {after['Rss']:>10.0f} {after['Pss']:>10.0f} {local:>14.1f}")
+
+        for n_workers in workers:
+            with tempfile.TemporaryDirectory() as socket_dir:
+                authkey = secrets.token_bytes(32)
+                server = InferenceServer(
+                    os.path.join(socket_dir, 'inference.sock'), authkey, load_model, n_workers=n_workers
+                )
+                server.start()
+                try:
+                    connect = lambda: RemoteClassifier(server.address, authkey).predict_batch  # noqa: E731
+                    remote = throughput(connect, instance, n_clients, n_requests)
+                    usage = [get_memory_usage(worker.pid) for worker in server._workers]
+                finally:
+                    server.close()
+            rss, pss = (sum(u[key] for u in usage) for key in ('Rss', 'Pss'))
+            print(f"{f'{n_workers} workers':>12} {rss:>10.0f} {pss:>10.0f} {remote:>14.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, default=10_000)
+    parser.add_argument('--n-embeddings', type=int, default=35, help='reference embeddings per label')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='numbers of inference workers')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=20, help='predictions per client')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--patch-size', type=int, default=16)
+    args = parser.parse_args()
+    main(
+        n_labels=args.n_labels,
+        n_embeddings=args.n_embeddings,
+        workers=args.workers,
+        n_clients=args.clients,
+        n_requests=args.requests,
+        image_size=args.image_size,
+        patch_size=args.patch_size,
+    )
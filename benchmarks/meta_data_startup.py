@@ -0,0 +1,57 @@
+"""
+Compare the time a (worker) process needs to load the meta-data of a synthetic reference database on a cold start
+(parsing `meta.json.gz` and processing every article, which also generates the embedding store and the meta-data
+artifact), a warm start (loading the artifact and memory-mapping the embedding store), and without any artifacts. Every
+start is measured in a fresh process, like a newly started gunicorn worker.
+
+Run with `python -m benchmarks.meta_data_startup`.
+"""
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from benchmarks.utils import write_synthetic_reference_data
+
+
+def load_meta_data(app_config: dict, results):
+    # imported in the process, so that the import time is not part of the measurement
+    from app.app import get_meta_data
+
+    start = time.perf_counter()
+    get_meta_data(app_config=app_config)
+    results.put(time.perf_counter() - start)
+
+
+def measure_start(app_config: dict) -> float:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=load_meta_data, args=(app_config, results))
+    process.start()
+    duration = results.get(timeout=600)
+    process.join()
+    return duration
+
+
+def main(n_labels: list[int], repeat: int):
+    print(f"{'labels':>8} {'no artifacts (s)':>17} {'cold (s)':>9} {'warm (s)':>9} {'speed-up':>9}")
+    for n in n_labels:
+        with tempfile.TemporaryDirectory() as meta_data_dir, tempfile.TemporaryDirectory() as artifact_dir:
+            app_config = write_synthetic_reference_data(meta_data_dir, n_labels=n) | {'ARTIFACT_DIR': artifact_dir}
+            without = min(measure_start(app_config | {'EMBEDDING_STORE': False}) for _ in range(repeat))
+            cold = []
+            for _ in range(repeat):
+                shutil.rmtree(artifact_dir)
+                cold.append(measure_start(app_config))
+            warm = min(measure_start(app_config) for _ in range(repeat))
+            print(f"{n:>8} {without:>17.2f} {min(cold):>9.2f} {warm:>9.2f} {without / warm:>8.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, repeat=args.repeat)
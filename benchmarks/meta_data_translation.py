@@ -0,0 +1,71 @@
+"""
+Compare rendering the article pages of the demo data with the meta-data values translated by the
+`MetaDataValueTranslator`, which compiles its patterns once and translates every distinct value once per locale, to
+building the mappings and compiling the patterns again for every value, as before. Also reports the time to translate
+all meta-data values of an article by itself.
+
+Run with `python -m benchmarks.meta_data_translation`.
+"""
+
+import argparse
+import re
+
+from flask_babel import refresh
+from speaklater import make_lazy_string
+
+from benchmarks.utils import create_demo_app, measure
+from config.render.meta_data_mapping import META_DATA_VALUE_MAPPING_STRING, META_DATA_VALUE_MAPPING_WORDS
+
+
+def translate_meta_data_values(input: str):
+    """Translate a meta-data value, as before the `MetaDataValueTranslator`."""
+    smap = {k.lower(): v for k, v in META_DATA_VALUE_MAPPING_STRING.items()}
+    wmap = {k.lower(): v for k, v in META_DATA_VALUE_MAPPING_WORDS.items()}
+    sub_pat = re.compile("|".join(map(re.escape, sorted(smap, key=len, reverse=True))), re.IGNORECASE)
+    word_pat = re.compile(rf"(?<![A-Za-z0-9])({'|'.join(map(re.escape, wmap))})(?![A-Za-z0-9])", re.IGNORECASE)
+
+    def apply_subs(string: str) -> str:
+        string = sub_pat.sub(lambda m: str(smap[m.group(0).lower()]), string)
+        string = word_pat.sub(lambda m: str(wmap[m.group(0).lower()]), string)
+        return string
+
+    return make_lazy_string(lambda t: apply_subs(t).capitalize(), input)
+
+
+def main(repeat: int):
+    app = create_demo_app()
+    translator = app.jinja_env.filters['translate_meta_data_values']
+    client = app.test_client()
+    articles = [(category, label) for category, labels in app.meta_data.items() for label in labels]
+    values = []
+    for category, label in articles:
+        for value in app.meta_data[category][label]['wrappers'].values():
+            values.extend(value.values() if isinstance(value, dict) else [value] if isinstance(value, str) else [])
+    print(f'{len(articles)} articles, {len(values)} meta-data values')
+
+    def render_articles():
+        for category, label in articles:
+            if client.get(f'/categories/{category}/articles/{label}').status_code != 200:
+                raise RuntimeError(f'failed to render the article page of {category}/{label}')
+
+    print(f"{'locale':>6} {'':>9} {'before (ms)':>12} {'after (ms)':>11} {'speed-up':>9}")
+    for locale in ('nl', 'en'):
+        client.set_cookie('locale', locale)
+        with app.test_request_context(headers={'Cookie': f'locale={locale}'}):
+            refresh()
+            before = measure(lambda: [str(translate_meta_data_values(value)) for value in values], repeat=repeat)
+            after = measure(lambda: [str(translator(value)) for value in values], repeat=repeat)
+        print(f"{locale:>6} {'values':>9} {before:>12.3f} {after:>11.3f} {before / after:>8.1f}x")
+
+        app.jinja_env.filters['translate_meta_data_values'] = translate_meta_data_values
+        before = measure(render_articles, repeat=repeat) / len(articles)
+        app.jinja_env.filters['translate_meta_data_values'] = translator
+        after = measure(render_articles, repeat=repeat) / len(articles)
+        print(f"{locale:>6} {'page':>9} {before:>12.3f} {after:>11.3f} {before / after:>8.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(repeat=args.repeat)
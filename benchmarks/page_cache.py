@@ -0,0 +1,48 @@
+"""
+Compare serving the article and category pages of the demo data from the page cache, which stores the rendered pages
+by page and language, to rendering them on every request. Also reports the one-time cost of pre-rendering the article
+pages of all articles in all languages at startup.
+
+Run with `python -m benchmarks.page_cache`.
+"""
+
+import argparse
+import time
+
+from benchmarks.utils import create_demo_app, measure
+
+
+def main(repeat: int):
+    uncached = create_demo_app(PAGE_CACHE_SIZE=0)
+    start = time.perf_counter()
+    cached = create_demo_app(PAGE_CACHE_SIZE=4096, PAGE_CACHE_PRERENDER=True)
+    articles = [(category, label) for category, labels in cached.meta_data.items() for label in labels]
+    print(f'{len(articles)} articles, startup with pre-rendering {time.perf_counter() - start:.2f} s')
+
+    paths = {
+        'article': [f'/categories/{category}/articles/{label}' for category, label in articles],
+        'category': [f'/categories/{category}?page=1' for category in cached.meta_data],
+    }
+    print(f"{'locale':>6} {'page':>9} {'render (ms)':>12} {'cached (ms)':>12} {'speed-up':>9}")
+    for locale in ('nl', 'en'):
+        for name, page_paths in paths.items():
+            latencies = []
+            for app in (uncached, cached):
+                client = app.test_client()
+                client.set_cookie('locale', locale)
+
+                def get_pages():
+                    for path in page_paths:
+                        if client.get(path).status_code != 200:
+                            raise RuntimeError(f'failed to get {path}')
+
+                latencies.append(measure(get_pages, repeat=repeat) / len(page_paths))
+            render, cache = latencies
+            print(f"{locale:>6} {name:>9} {render:>12.3f} {cache:>12.3f} {render / cache:>8.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(repeat=args.repeat)
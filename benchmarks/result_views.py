@@ -0,0 +1,80 @@
+"""
+Compare showing a page of cached search results with the views precomputed by `ResultViews` (a slice of the size of
+the page) to computing the grouping by category, the counts per category and the ranking within a category from the
+cached `Results` on every request, for 1k to 100k labels. Also reports the one-time cost of computing the views when
+the results are cached.
+
+Run with `python -m benchmarks.result_views`.
+"""
+
+import argparse
+
+import numpy as np
+
+from app.calculations.core import LabelTable, Results, ResultViews
+from benchmarks.utils import measure
+
+PAGE_SIZE = 5
+
+
+def results_page(results: Results, labels: LabelTable, page: int) -> list:
+    """Get a page of the results page from the cached results, as without the precomputed views."""
+    categories = labels.categories[results.indices]
+    counts = np.bincount(categories, minlength=len(labels.category_codes))
+    _, first = np.unique(categories, return_index=True)
+    grouped = results[np.sort(first)][page * PAGE_SIZE : (page + 1) * PAGE_SIZE]
+    return list(zip(labels.materialize(grouped), counts[labels.categories[grouped.indices]]))
+
+
+def category_page(results: Results, labels: LabelTable, category_code: int, page: int) -> list:
+    """Get a page of a category page from the cached results, as without the precomputed views."""
+    indices = results.indices[labels.categories[results.indices] == category_code]
+    return [labels.labels[i][1] for i in indices.tolist()][page * PAGE_SIZE : (page + 1) * PAGE_SIZE]
+
+
+def views_results_page(views: ResultViews, labels: LabelTable, page: int) -> list:
+    results = labels.materialize(views.grouped(page * PAGE_SIZE, (page + 1) * PAGE_SIZE))
+    return [(r, views.count(labels.category_codes[r.category])) for r in results]
+
+
+def views_category_page(views: ResultViews, labels: LabelTable, category_code: int, page: int) -> list:
+    results = views.in_category(category_code, page * PAGE_SIZE, (page + 1) * PAGE_SIZE)
+    return [r.label for r in labels.materialize(results)]
+
+
+def main(n_labels: list[int], repeat: int):
+    print(f"{'labels':>8} {'views (ms)':>11} {'page':>9} {'recompute (ms)':>15} {'views (ms)':>11} {'speed-up':>9}")
+    for n in n_labels:
+        rng = np.random.default_rng(n)
+        labels = LabelTable([(str(3000 + i // 20), f'article {i}') for i in range(n)])
+        results = Results(np.arange(n), rng.random(n)).sorted()
+        build = measure(lambda: ResultViews.from_results(results, labels), repeat=repeat)
+        views = ResultViews.from_results(results, labels)
+        category_code = labels.category_codes['3000']
+        if category_page(results, labels, category_code, 1) != views_category_page(views, labels, category_code, 1):
+            raise RuntimeError('the views differ from the recomputed pages')
+
+        pages = {
+            'results': (
+                lambda: results_page(results, labels, 1),
+                lambda: views_results_page(views, labels, 1),
+            ),
+            'category': (
+                lambda: category_page(results, labels, category_code, 1),
+                lambda: views_category_page(views, labels, category_code, 1),
+            ),
+        }
+        for name, (recompute, view) in pages.items():
+            recompute_latency, view_latency = measure(recompute, repeat=repeat), measure(view, repeat=repeat)
+            print(
+                f"{n:>8} {build:>11.2f} {name:>9} {recompute_latency:>15.3f} {view_latency:>11.3f} "
+                f"{recompute_latency / view_latency:>8.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, repeat=args.repeat)
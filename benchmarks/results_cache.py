@@ -0,0 +1,49 @@
+"""
+Compare the in-memory results cache of a single worker process to the SQLite results cache shared by all worker
+processes: the latency of storing and retrieving the search results of a query, and the size of the stored results (the
+arrays of `Results` in memory, compared to the label indices and scores stored by `ResultsSerializer`), for 1k to 100k
+labels.
+
+Run with `python -m benchmarks.results_cache`.
+"""
+
+import argparse
+import tempfile
+import uuid
+
+import numpy as np
+from lru import LRU
+
+from app.calculations.cache import ResultsSerializer, SQLiteCache
+from app.calculations.core import Results
+from benchmarks.utils import measure
+
+
+def synthetic_results(n_labels: int, seed: int = 0) -> Results:
+    rng = np.random.default_rng(seed)
+    return Results(rng.permutation(n_labels), np.sort(rng.random(n_labels))[::-1])
+
+
+def main(n_labels: list[int], repeat: int):
+    print(f"{'labels':>8} {'backend':>8} {'set (ms)':>9} {'get (ms)':>9} {'size (KiB)':>11}")
+    for n in n_labels:
+        results = synthetic_results(n)
+        serializer = ResultsSerializer('benchmark')
+        with tempfile.TemporaryDirectory() as directory:
+            caches = {
+                'memory': (LRU(100), results.indices.nbytes + results.scores.nbytes),
+                'sqlite': (SQLiteCache(f'{directory}/cache.sqlite', serializer), len(serializer.dumps(results))),
+            }
+            for backend, (cache, size) in caches.items():
+                key = uuid.uuid4().hex
+                set_latency = measure(lambda: cache.__setitem__(key, results), repeat=repeat)
+                get_latency = measure(lambda: cache.get(key), repeat=repeat)
+                print(f"{n:>8} {backend:>8} {set_latency:>9.2f} {get_latency:>9.2f} {size / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, repeat=args.repeat)
@@ -0,0 +1,102 @@
+"""
+Compare the columnar search results (`Results`: label positions and scores in NumPy arrays) to the lists of `Result`
+tuples they replace, for 1k to 100k labels: the latency and peak memory allocation of one search (sorting the scores
+of an image search, filtering on a text mask, grouping by category and creating the `Result` objects of one page), and
+the memory of the cached results.
+
+Run with `python -m benchmarks.search_results`.
+"""
+
+import argparse
+import sys
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from app.calculations.core import LabelTable, Result, Results
+from app.calculations.models import Prediction
+from benchmarks.utils import measure
+
+PAGE_SIZE = 5
+
+
+def list_search(prediction: Prediction, mask: np.ndarray, positions: dict) -> tuple[list[Result], list[Result]]:
+    """Search on lists of `Result` tuples, as before."""
+    results = [
+        Result(category=category, label=label, score=score) for (category, label), score in prediction.as_dict().items()
+    ]
+    results = sorted(results, key=lambda item: item.score, reverse=True)
+    results = [r for r in results if mask[positions[r.category, r.label]]]
+    counts = Counter(r.category for r in results)
+    grouped, seen = [], set()
+    for r in results:
+        if r.category not in seen:
+            grouped.append(r)
+            seen.add(r.category)
+    page = [r._replace(meta={'n_articles': counts[r.category]}) for r in grouped[:PAGE_SIZE]]
+    return results, page
+
+
+def columnar_search(prediction: Prediction, mask: np.ndarray, labels: LabelTable) -> tuple[Results, list[Result]]:
+    """Search on the columnar `Results`."""
+    results = labels.from_prediction(prediction).sorted()
+    results = results[mask[results.indices]]
+    categories = labels.categories[results.indices]
+    counts = np.bincount(categories, minlength=len(labels.category_codes))
+    _, first = np.unique(categories, return_index=True)
+    grouped = results[np.sort(first)][:PAGE_SIZE]
+    page = [
+        r._replace(meta={'n_articles': int(count)})
+        for r, count in zip(labels.materialize(grouped), counts[labels.categories[grouped.indices]])
+    ]
+    return results, page
+
+
+def peak_allocation(fn) -> float:
+    """Return the peak memory allocated by `fn` in MiB."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def list_size(results: list[Result]) -> int:
+    """Get the memory of a list of results, excluding the (shared) label and category strings."""
+    return sys.getsizeof(results) + sum(sys.getsizeof(r) + sys.getsizeof(r.score) for r in results)
+
+
+def main(n_labels: list[int], repeat: int):
+    print(
+        f"{'labels':>8} {'pipeline':>9} {'search (ms)':>12} {'peak (MiB)':>11} {'cached (KiB)':>13}",
+    )
+    for n in n_labels:
+        rng = np.random.default_rng(n)
+        labels = LabelTable([(str(3000 + i // 20), f'article {i}') for i in range(n)])
+        prediction = Prediction(labels=labels.labels, scores=rng.random(n))
+        mask = rng.random(n) < 0.5
+
+        list_results, list_page = list_search(prediction, mask, labels.positions)
+        columnar_results, columnar_page = columnar_search(prediction, mask, labels)
+        if [r.label for r in list_page] != [r.label for r in columnar_page]:
+            raise RuntimeError('the columnar results differ from the list results')
+
+        pipelines = {
+            'list': (lambda: list_search(prediction, mask, labels.positions), list_size(list_results)),
+            'columnar': (
+                lambda: columnar_search(prediction, mask, labels),
+                columnar_results.indices.nbytes + columnar_results.scores.nbytes,
+            ),
+        }
+        for name, (search, size) in pipelines.items():
+            latency = measure(search, repeat=repeat)
+            print(f"{n:>8} {name:>9} {latency:>12.2f} {peak_allocation(search):>11.2f} {size / 1024:>13.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, repeat=args.repeat)
@@ -0,0 +1,191 @@
+"""
+Run the benchmark suite: the latency of the forward pass of the embedding model for several image sizes, cleaning
+texts, `EmbeddingClassifier.predict`, `get_search_results` for an image, a text and a text filter, and rendering the
+results and category pages, against synthetic reference databases of several sizes. The median latencies are written
+as JSON with `--output`, and compared to a baseline written before with `--baseline`, where every benchmark that is
+more than `--threshold` slower than its baseline is reported as a regression (with exit status 1).
+
+Run with `python -m benchmarks.suite`, e.g. `python -m benchmarks.suite --output baseline.json` before and
+`python -m benchmarks.suite --baseline baseline.json` after a change.
+"""
+
+import argparse
+import io
+import json
+import platform
+import sys
+import tempfile
+from collections.abc import Callable, Iterator
+from urllib.parse import quote
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.calculations import get_search_results
+from app.calculations.cache import add_to_cache
+from app.calculations.core import ResultViews
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel
+from app.requests.validate import QueryImage, clean_text
+from benchmarks.utils import (
+    TINY_VIT_CONFIG,
+    create_demo_app,
+    measure,
+    synthetic_embeddings,
+    write_synthetic_reference_data,
+)
+
+IMAGE_SIZES = (64, 128, 224)
+WORDS = ('Cobra', 'Shell', 'Rocket', 'Thunder-King', 'Maroon', 'Salute', 'Gigant', 'Flash', 'XXL', 'Vuurpijl 6"')
+
+
+def model_benchmarks() -> Iterator[tuple[str, Callable[[], object]]]:
+    """Generate the benchmarks which do not depend on the size of the reference database."""
+    image = np.random.default_rng(0).integers(0, 256, size=(300, 300, 3), dtype=np.uint8)
+    for image_size in IMAGE_SIZES:
+        model = ViTEmbeddingModel(config=TINY_VIT_CONFIG.model_copy(update={'image_size': image_size})).eval()
+
+        def forward(model=model):
+            with torch.no_grad():
+                return model(image)
+
+        yield f'vit_forward/image_size={image_size}', forward
+
+    rng = np.random.default_rng(0)
+    texts = [' '.join(rng.choice(WORDS, size=12)) for _ in range(1_000)]
+    yield 'clean_text/1000_texts', lambda: [clean_text(text) for text in texts]
+
+
+def reference_data_benchmarks(
+    directory: str, n_labels: int, n_embeddings: int
+) -> Iterator[tuple[str, Callable[[], object]]]:
+    """Generate the benchmarks against a synthetic reference database of `n_labels` labels."""
+    # the meta-data file only holds a single embedding per label (which keeps writing and parsing it fast), the
+    # classifier gets the embeddings of the same labels from `synthetic_embeddings` directly
+    config = write_synthetic_reference_data(directory, n_labels=n_labels, n_embeddings=1)
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=TINY_VIT_CONFIG))
+    classifier.update_embeddings(synthetic_embeddings(n_labels=n_labels, n_embeddings=n_embeddings))
+    # disable the caches of the query predictions and rendered pages, so that every run computes them again
+    app = create_demo_app(model=classifier, **config, QUERY_CACHE_SIZE=0, PAGE_CACHE_SIZE=0, CACHE_SIZE=8)
+    client = app.test_client()
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 300, 3), dtype=np.uint8)).save(buffer, 'PNG')
+    data = buffer.getvalue()
+
+    def in_app_context(fn: Callable[[], object]) -> Callable[[], object]:
+        def run():
+            with app.app_context():
+                return fn()
+
+        return run
+
+    def search_image():
+        return get_search_results(QueryImage(data, Image.open(io.BytesIO(data))), query_text=None)
+
+    yield f'predict/{n_labels}', lambda: classifier.predict(np.asarray(Image.open(io.BytesIO(data))))
+    yield f'search_image/{n_labels}', in_app_context(search_image)
+    yield f'search_text/{n_labels}', in_app_context(lambda: get_search_results(None, query_text='thunder king'))
+    yield (
+        f'search_text_filter/{n_labels}',
+        in_app_context(lambda: get_search_results(None, query_text='cobra shell', text_filter=True)),
+    )
+
+    with app.app_context():
+        results_id = add_to_cache(ResultViews.from_results(search_image()[0], app.labels))
+    category = quote(next(iter(app.meta_data)))
+
+    def get_page(path: str):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f'failed to get {path}')
+
+    yield f'page_results/{n_labels}', lambda: get_page(f'/search/results?resultsId={results_id}&page=1')
+    yield f'page_category/{n_labels}', lambda: get_page(f'/categories/{category}?page=1')
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """
+    Print the latencies of `results` relative to `baseline`.
+
+    :returns: the names of the benchmarks which are more than `threshold` (a fraction) slower than their baseline
+    """
+    regressions = []
+    print(f"{'benchmark':<36} {'baseline (ms)':>14} {'latency (ms)':>13} {'change':>8}")
+    for name, latency in results.items():
+        if name not in baseline:
+            print(f"{name:<36} {'-':>14} {latency:>13.3f} {'-':>8}")
+            continue
+        change = latency / baseline[name] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<36} {baseline[name]:>14.3f} {latency:>13.3f} {change:>+7.0%}{' REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main(
+    scales: list[int],
+    n_embeddings: int,
+    repeat: int,
+    output: str | None,
+    baseline: str | None,
+    threshold: float,
+):
+    results = {}
+
+    def run(benchmarks: Iterator[tuple[str, Callable[[], object]]]):
+        for name, benchmark in benchmarks:
+            results[name] = measure(benchmark, repeat=repeat)
+            print(f'{name:<36} {results[name]:>10.3f} ms', file=sys.stderr)
+
+    run(model_benchmarks())
+    for n_labels in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            run(reference_data_benchmarks(directory, n_labels=n_labels, n_embeddings=n_embeddings))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(
+                {
+                    'environment': {
+                        'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'torch': torch.__version__,
+                        'machine': platform.machine(),
+                        'threads': torch.get_num_threads(),
+                    },
+                    'n_embeddings': n_embeddings,
+                    'repeat': repeat,
+                    'results': results,
+                },
+                f,
+                indent=2,
+            )
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)['results'], threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) of more than {threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1_000, 10_000], help='numbers of labels')
+    parser.add_argument('--n-embeddings', type=int, default=35, help='reference embeddings per label')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write the latencies to this JSON file')
+    parser.add_argument('--baseline', help='compare the latencies to this JSON file written with --output')
+    parser.add_argument('--threshold', type=float, default=0.2, help='the relative slowdown reported as regression')
+    args = parser.parse_args()
+    main(
+        scales=args.scales,
+        n_embeddings=args.n_embeddings,
+        repeat=args.repeat,
+        output=args.output,
+        baseline=args.baseline,
+        threshold=args.threshold,
+    )
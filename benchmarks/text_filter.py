@@ -0,0 +1,76 @@
+"""
+Compare the latency of filtering the wrapper texts with the inverted n-gram index of `TextIndex` to the linear scan of
+substring checks it replaces, on the wrapper texts of the demo data replicated to 1, 10 and 100 times its size.
+
+Run with `python -m benchmarks.text_filter`.
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from app.calculations.text_index import TextIndex
+from app.requests.validate import clean_text
+from benchmarks.utils import measure
+
+DEMO_META_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tests/resources/demo_data/reference_data/meta.json.gz'
+)
+
+
+def load_demo_texts() -> list[str]:
+    with gzip.open(DEMO_META_DATA) as f:
+        meta_data = json.load(f)
+    return [
+        clean_text(article.get('wrappers', {}).get('text', ''))
+        for articles in meta_data.values()
+        for article in articles.values()
+    ]
+
+
+def replicate_texts(texts: list[str], factor: int, seed: int = 0) -> list[str]:
+    """Generate `factor` times as many texts, by shuffling the words of the demo texts."""
+    rng = np.random.default_rng(seed)
+    words = [word for text in texts for word in text.split(' ') if word]
+    lengths = [len(text.split(' ')) for text in texts]
+    return [' '.join(rng.choice(words, size=lengths[i % len(texts)])) for i in range(len(texts) * factor)]
+
+
+def scan(texts: list[str], tokens: list[str]) -> list[bool]:
+    return [all(token in text for token in tokens) for text in texts]
+
+
+def main(factors: list[int], n_queries: int, repeat: int):
+    demo_texts = load_demo_texts()
+    print(f"{'texts':>8} {'build (ms)':>11} {'scan (ms)':>10} {'index (ms)':>11} {'speed-up':>9}")
+    for factor in factors:
+        texts = replicate_texts(demo_texts, factor)
+        rng = np.random.default_rng(factor)
+        words = [word for text in texts for word in text.split(' ') if word]
+        # queries of one to three (partial) words, as typed in the text filter
+        queries = [
+            [word[: rng.integers(1, len(word) + 1)] for word in rng.choice(words, size=rng.integers(1, 4))]
+            for _ in range(n_queries)
+        ]
+        build = measure(lambda: TextIndex(texts), repeat=1)
+        index = TextIndex(texts)
+        if not all(index.contains_all(query).tolist() == scan(texts, query) for query in queries):
+            raise RuntimeError('the index gives other results than the linear scan')
+        scan_latency = measure(lambda: [scan(texts, query) for query in queries], repeat=repeat) / n_queries
+        index_latency = measure(lambda: [index.contains_all(query) for query in queries], repeat=repeat) / n_queries
+        print(
+            f"{len(texts):>8} {build:>11.1f} {scan_latency:>10.3f} {index_latency:>11.3f} "
+            f"{scan_latency / index_latency:>8.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--factors', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--n-queries', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(factors=args.factors, n_queries=args.n_queries, repeat=args.repeat)
@@ -0,0 +1,51 @@
+"""
+Compare the bytes sent for the images of a page of results (the wrapper images of five articles) as original images to
+those sent as WebP thumbnails of the configured widths, on the reference images of the demo data, together with the
+transfer time at a given bandwidth and the one-time cost of generating the thumbnails.
+
+Run with `python -m benchmarks.thumbnails`.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.thumbnails import generate_thumbnails, get_thumbnail_path, iter_reference_images
+
+DEMO_REFERENCE_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'tests/resources/demo_data/reference_data'
+)
+PAGE_SIZE = 5
+
+
+def main(reference_data_dir: str, widths: list[int], bandwidth: float):
+    filenames = list(iter_reference_images(reference_data_dir, ('.png', '.jpg', '.jpeg', '.gif')))
+    wrappers = [filename for filename in filenames if os.path.basename(filename) == 'wrapper.png'] or filenames
+    with tempfile.TemporaryDirectory() as thumbnail_dir:
+        start = time.perf_counter()
+        generate_thumbnails(reference_data_dir, thumbnail_dir, widths, ('.png', '.jpg', '.jpeg', '.gif'))
+        generation = (time.perf_counter() - start) * 1000 / len(filenames)
+        print(f'generated thumbnails of {len(filenames)} images in {generation:.1f} ms per image')
+
+        sizes = {'original': [os.path.getsize(os.path.join(reference_data_dir, f)) for f in wrappers]}
+        for width in widths:
+            sizes[f'{width}w webp'] = [os.path.getsize(get_thumbnail_path(thumbnail_dir, f, width)) for f in wrappers]
+
+    print(f"{'variant':>10} {'page (KiB)':>11} {'transfer (ms)':>14} {'saved':>7}")
+    original = np.mean(sizes['original']) * PAGE_SIZE
+    for variant, variant_sizes in sizes.items():
+        page = np.mean(variant_sizes) * PAGE_SIZE
+        transfer = page * 8 / (bandwidth * 1e6) * 1000
+        print(f'{variant:>10} {page / 1024:>11.1f} {transfer:>14.1f} {1 - page / original:>7.1%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reference-data-dir', default=DEMO_REFERENCE_DATA)
+    parser.add_argument('--widths', type=int, nargs='+', default=[400, 800])
+    parser.add_argument('--bandwidth', type=float, default=10, help='Bandwidth in Mbit/s.')
+    args = parser.parse_args()
+    main(reference_data_dir=args.reference_data_dir, widths=args.widths, bandwidth=args.bandwidth)
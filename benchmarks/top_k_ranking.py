@@ -0,0 +1,69 @@
+"""
+Compare ranking only the first `RESULTS_TOP_K` search results of an image search (`Results.sorted(top_k=...)`, a
+partition of the scores followed by a sort of the first results) to sorting all results, for 10k to 1M labels: the
+latency and peak memory of ranking the results and computing their views when the results are cached, and the latency
+of the first and a deep page of a category, which ranks the rest of the results of the category on demand.
+
+Run with `python -m benchmarks.top_k_ranking`.
+"""
+
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from app.calculations.core import LabelTable, Results, ResultViews
+from benchmarks.utils import measure
+
+PAGE_SIZE = 5
+# a page of a category beyond its ranked results (with 100 articles per category)
+DEEP_PAGE = 19
+
+
+def peak_allocation(fn) -> float:
+    """Return the peak memory allocated by `fn` in MiB."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def main(n_labels: list[int], top_k: int, repeat: int):
+    print(
+        f"{'labels':>8} {'ranking':>9} {'sort (ms)':>10} {'views (ms)':>11} {'peak (MiB)':>11} "
+        f"{'page 1 (ms)':>12} {'page 20 (ms)':>15}"
+    )
+    for n in n_labels:
+        rng = np.random.default_rng(n)
+        labels = LabelTable([(str(3000 + i // 100), f'article {i}') for i in range(n)])
+        results = Results(np.arange(n), rng.random(n, dtype=np.float32))
+        category_code = labels.category_codes['3000']
+        expected = ResultViews.from_results(results.sorted(), labels)
+        for name, k in (('full', None), (f'top {top_k}', top_k)):
+            sort = measure(lambda k=k: results.sorted(top_k=k), repeat=repeat)
+            ranked = results.sorted(top_k=k)
+            build = measure(lambda ranked=ranked: ResultViews.from_results(ranked, labels), repeat=repeat)
+            peak = peak_allocation(lambda k=k: ResultViews.from_results(results.sorted(top_k=k), labels))
+            views = ResultViews.from_results(ranked, labels)
+
+            def category_page(page: int, views=views) -> Results:
+                # the rest of a category is ranked once per cached results, so measure the first time
+                views._tail_rows.clear()
+                return views.in_category(category_code, page * PAGE_SIZE, (page + 1) * PAGE_SIZE)
+
+            for page in (0, DEEP_PAGE):
+                expected_page = expected.in_category(category_code, page * PAGE_SIZE, (page + 1) * PAGE_SIZE)
+                if not np.array_equal(category_page(page).indices, expected_page.indices):
+                    raise RuntimeError('the partially ranked results differ from the sorted results')
+            first, deep = (measure(lambda page=page: category_page(page), repeat=repeat) for page in (0, DEEP_PAGE))
+            print(f"{n:>8} {name:>9} {sort:>10.2f} {build:>11.2f} {peak:>11.1f} {first:>12.3f} {deep:>15.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n-labels', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--top-k', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(n_labels=args.n_labels, top_k=args.top_k, repeat=args.repeat)
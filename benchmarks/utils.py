@@ -0,0 +1,152 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+from unittest import mock
+
+import numpy as np
+from flask import Flask
+
+from app import create_app
+from app.app import get_meta_data
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
+
+DEMO_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests', 'resources', 'demo_data')
+
+# the same tiny ViT configuration as used in the tests, so that the benchmarks do not depend on downloaded weights
+TINY_VIT_CONFIG = ViTModelConfig(
+    model_size="base",
+    embedding_size=128,
+    image_size=64,
+    patch_size=32,
+    add_pooling_layer=False,
+    mean_pooling=False,
+    device="cpu",
+    force_download=False,
+)
+
+
+def synthetic_embeddings(
+    n_labels: int, n_embeddings: int = 35, embedding_size: int = 128, seed: int = 0
+) -> dict[str, dict[str, dict[str, np.ndarray]]]:
+    """
+    Generate a synthetic reference database of `n_labels` labels with `n_embeddings` L2-normalized embeddings each, in
+    the same nested category -> label -> data structure as the parsed meta-data. Like real reference embeddings, the
+    embeddings are clustered: every label is scattered around a label-specific direction, which in turn is close to
+    the directions of the other labels in the same category.
+    """
+    rng = np.random.default_rng(seed)
+    meta_data = {}
+    for i in range(n_labels):
+        if i % 3 == 0:
+            category_center = rng.standard_normal(embedding_size)
+        center = category_center + 0.5 * rng.standard_normal(embedding_size)
+        embeddings = (center + 0.3 * rng.standard_normal((n_embeddings, embedding_size))).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        meta_data.setdefault(f'category {i // 3}', {})[f'label {i}'] = {'embeddings': embeddings}
+    return meta_data
+
+
+def measure(fn: Callable[[], object], repeat: int = 10) -> float:
+    """Return the median wall-clock time of `fn` in milliseconds over `repeat` runs (after one warm-up run)."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def write_synthetic_reference_data(
+    meta_data_dir: str, n_labels: int, n_embeddings: int = 35, wrapper_filename: str = 'wrapper.png', seed: int = 0
+) -> dict[str, Any]:
+    """
+    Write a synthetic reference database of `n_labels` labels to `<meta_data_dir>/reference_data`, consisting of a
+    `meta.json.gz` file and an (empty) folder for every label, and return a matching app configuration.
+    """
+    reference_data_dir = os.path.join(meta_data_dir, 'reference_data')
+    meta_data = synthetic_embeddings(n_labels=n_labels, n_embeddings=n_embeddings, seed=seed)
+    rng = np.random.default_rng(seed)
+    words = np.asarray(['cobra', 'shell', 'rocket', 'thunder', 'king', 'maroon', 'salute', 'gigant', 'flash', 'xxl'])
+    for category, articles in meta_data.items():
+        for label, article in articles.items():
+            os.makedirs(os.path.join(reference_data_dir, category, label), exist_ok=True)
+            article['embeddings'] = article['embeddings'].tolist()
+            article['wrappers'] = {
+                'article_name': label,
+                'text': ' '.join(rng.choice(words, size=8)),
+                'firework_type': 'Vuurpijl met knallading',
+            }
+    with gzip.open(os.path.join(reference_data_dir, 'meta.json.gz'), 'wt') as f:
+        json.dump(meta_data, f)
+    return {
+        'META_DATA_DIR': meta_data_dir,
+        'META_DATA_HF': None,
+        'REFERENCE_DATA_DIR': reference_data_dir,
+        'WRAPPER_FILENAME': wrapper_filename,
+    }
+
+
+def get_memory_usage(pid: int | str = 'self') -> dict[str, float]:
+    """
+    Get the resident (RSS) and proportional (PSS, shared pages divided by their users) memory in MiB of a process,
+    which defaults to the current process (Linux only).
+    """
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                usage[key] = int(value.split()[0]) / 1024
+    return usage
+
+
+def measure_peak_memory(fn: Callable[[], object]) -> float:
+    """Return the increase of the peak resident memory of the process while running `fn` in MiB (Linux only)."""
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # reset the peak resident memory to the current resident memory
+    before = _get_status_value('VmRSS')
+    fn()
+    return (_get_status_value('VmHWM') - before) / 1024
+
+
+def _get_status_value(key: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(f'{key}:'):
+                return int(line.split()[1])
+    raise KeyError(key)
+
+
+def create_demo_app(model: EmbeddingClassifier | None = None, **config) -> Flask:
+    """
+    Create the application for the demo data of the tests (or the reference data in `config`), with the classifier
+    `model`, which defaults to a tiny randomly initialized model with the embeddings of the reference data.
+    """
+    config = {
+        'TESTING': True,
+        'META_DATA_DIR': DEMO_DATA_DIR,
+        'REFERENCE_DATA_DIR': os.path.join(DEMO_DATA_DIR, 'reference_data'),
+        # keep the embedding store, manifests and other artifacts out of the demo data
+        'ARTIFACT_DIR': tempfile.mkdtemp(prefix='benchmark-artifacts-'),
+        'META_DATA_HF': None,
+        'MODEL_DIR': 'data/model',
+        'ALLOWED_EXTENSIONS': ['.png', '.jpg', '.jpeg', '.gif'],
+        'WRAPPER_FILENAME': 'wrapper.png',
+        'BABEL_DEFAULT_LOCALE': 'nl',
+        'BABEL_TRANSLATION_DIRECTORIES': '../translations',
+        'LANGUAGES': {"nl": "Nederlands", "en": "English"},
+        'CACHE_SIZE': 2,
+        'RESULTS_PER_PAGE': 5,
+        'MAX_WRAPPERS_PER_PAGE': 5,
+        'MAX_CHARS_TEXT_FILTER': 500,
+    } | config
+    if model is None:
+        model = EmbeddingClassifier(model=ViTEmbeddingModel(config=TINY_VIT_CONFIG))
+        model.update_embeddings(meta_data=get_meta_data(app_config=config))
+    with mock.patch('app.app.get_model', return_value=model):
+        return create_app(config)
@@ -2,6 +2,7 @@ import io
 import os
 import urllib
 
+import numpy as np
 import pytest
 from flask import abort
 from flask.testing import FlaskClient
@@ -10,7 +11,7 @@ from PIL import Image
 from app import create_app
 from app.app import get_meta_data
 from app.calculations.cache import add_to_cache
-from app.calculations.core import Result
+from app.calculations.core import Results, ResultViews
 from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
 
 APP_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
@@ -18,7 +19,7 @@ TEST_RESOURCES_DIR = os.path.join(APP_DIR, 'tests/resources')
 
 
 @pytest.fixture
-def configuration():
+def configuration(tmp_path):
     config = {
         'ALLOWED_EXTENSIONS': ['.png', '.jpg', '.jpeg', '.gif'],
         'TESTING': True,
@@ -34,6 +35,7 @@ def configuration():
         'MODEL_DIR': 'data/model',
         'META_DATA_HF': None,
         'REFERENCE_DATA_DIR': os.path.join(APP_DIR, 'tests/resources/demo_data', 'reference_data'),
+        'ARTIFACT_DIR': str(tmp_path),
     }
     return config
 
@@ -58,8 +60,6 @@ def app(mocker, configuration, vit_model_test_config: ViTModelConfig):
     fake_model = EmbeddingClassifier(model=ViTEmbeddingModel(config=vit_model_test_config))
     fake_model.update_embeddings(meta_data=get_meta_data(app_config=configuration))
     mocker.patch('app.app.get_model', return_value=fake_model)
-    mocker.patch('app.blueprints.help.resources.help.get_commit_hash_model', return_value='test_hash')
-    mocker.patch('app.blueprints.help.resources.help.get_commit_hash_data', return_value='test_hash')
     app = create_app(configuration)
 
     app.route('/generate_non_http_exception')(test_generate_non_http_exception)
@@ -104,10 +104,9 @@ def snippet_overview() -> Image:
 @pytest.fixture
 def results_id(client: FlaskClient) -> str:
     # Create a result_id with all entries of the reference data as a result
-    all_results = []
-    for category, category_data in client.application.meta_data.items():
-        all_results.extend(Result(category=category, label=label, score=1) for label in category_data)
-    all_results = tuple(all_results)
+    all_results = ResultViews.from_results(
+        Results(np.arange(len(client.application.labels))), client.application.labels
+    )
 
     return add_to_cache(all_results)
 
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.calculations.models import EmbeddingClassifier, IVFIndex, ViTEmbeddingModel, ViTModelConfig
+from app.calculations.models.index import ANN_INDEX_FILENAME
+
+
+@pytest.fixture
+def embedding_model(vit_model_test_config: ViTModelConfig) -> ViTEmbeddingModel:
+    return ViTEmbeddingModel(config=vit_model_test_config)
+
+
+@pytest.fixture
+def reference_meta_data() -> dict:
+    rng = np.random.default_rng(42)
+    meta_data = {}
+    for i in range(60):
+        embeddings = rng.standard_normal(128) + 0.3 * rng.standard_normal((10, 128))
+        meta_data.setdefault(f'category {i // 3}', {})[f'label {i}'] = {
+            'embeddings': embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        }
+    return meta_data
+
+
+def _classifiers(embedding_model, reference_meta_data, **index_params) -> tuple[EmbeddingClassifier, ...]:
+    exact = EmbeddingClassifier(model=embedding_model)
+    approximate = EmbeddingClassifier(model=embedding_model, **index_params)
+    for classifier in (exact, approximate):
+        classifier.update_embeddings(reference_meta_data)
+    return exact, approximate
+
+
+def test_probing_all_lists_is_exact(embedding_model, reference_meta_data):
+    exact, approximate = _classifiers(embedding_model, reference_meta_data, n_lists=8, n_probe=8, top_k=60)
+    queries = exact.reference_matrix[[0, 100, 500]]
+    assert np.allclose(approximate.score(queries), exact.score(queries), atol=1e-6)
+
+
+def test_top_k_candidates_are_scored_exactly(embedding_model, reference_meta_data):
+    exact, approximate = _classifiers(embedding_model, reference_meta_data, n_lists=8, n_probe=2, top_k=5)
+    query = exact.reference_matrix[[123]]
+    exact_scores, approximate_scores = exact.score(query)[0], approximate.score(query)[0]
+
+    ranking = np.argsort(-approximate_scores, kind='stable')
+    assert ranking[0] == np.argmax(exact_scores) == 12
+    # the top-k candidates carry their exact scores, and are ranked before all other labels
+    assert np.allclose(approximate_scores[ranking[:5]], exact_scores[ranking[:5]], atol=1e-6)
+    assert approximate_scores[ranking[4]] > approximate_scores[ranking[5:]].max()
+    # the other labels are ranked on their mean reference embeddings, rather than sharing the score of their list
+    assert len(np.unique(approximate_scores)) == len(approximate_scores)
+    assert 0 <= approximate_scores.min()
+
+
+def test_index_is_persisted(mocker, embedding_model, reference_meta_data, tmp_path):
+    classifier = EmbeddingClassifier(model=embedding_model, n_lists=8, index_dir=str(tmp_path))
+    classifier.update_embeddings(reference_meta_data)
+    assert os.path.exists(tmp_path / ANN_INDEX_FILENAME)
+
+    # a valid index is loaded instead of being rebuilt
+    build = mocker.spy(IVFIndex, 'build')
+    classifier.update_embeddings(reference_meta_data)
+    assert build.call_count == 0
+
+    # the index is rebuilt when the reference embeddings change
+    reference_meta_data['category 0']['label 0']['embeddings'] = reference_meta_data['category 0']['label 1'][
+        'embeddings'
+    ]
+    classifier.update_embeddings(reference_meta_data)
+    assert build.call_count == 1
+    assert IVFIndex.load(str(tmp_path / ANN_INDEX_FILENAME), key=classifier.index.key) is not None
+
+
+def test_unreadable_index_is_rebuilt(embedding_model, reference_meta_data, tmp_path):
+    classifier = EmbeddingClassifier(model=embedding_model, n_lists=8, index_dir=str(tmp_path))
+    classifier.update_embeddings(reference_meta_data)
+    path = tmp_path / ANN_INDEX_FILENAME
+    # e.g. a file that was partially written by another process
+    path.write_bytes(path.read_bytes()[:100])
+    assert IVFIndex.load(str(path), key=classifier.index.key) is None
+
+    classifier.update_embeddings(reference_meta_data)
+    assert IVFIndex.load(str(path), key=classifier.index.key) is not None
+    assert [p.name for p in tmp_path.iterdir()] == [ANN_INDEX_FILENAME]
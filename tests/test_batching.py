@@ -0,0 +1,101 @@
+import gc
+import threading
+import weakref
+
+import numpy as np
+import pytest
+
+from app.calculations.batching import BatchScheduler
+
+
+def test_concurrent_requests_are_batched():
+    batches = []
+
+    def predict_batch(instances):
+        batches.append(instances)
+        return [instance * 2 for instance in instances]
+
+    scheduler = BatchScheduler(predict_batch=predict_batch, max_batch_size=3, max_wait=0.5)
+    futures = [scheduler.submit(i) for i in range(5)]
+
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6, 8]
+    assert [len(batch) for batch in batches] == [3, 2]
+
+
+def test_instances_submitted_together_are_predicted_in_one_batch():
+    batches = []
+
+    def predict_batch(instances):
+        batches.append(instances)
+        return [instance * 2 for instance in instances]
+
+    scheduler = BatchScheduler(predict_batch=predict_batch, max_batch_size=3, max_wait=0.5)
+    single = scheduler.submit(0)
+    many = scheduler.submit_many(range(1, 6))
+
+    assert single.result(timeout=5) == 0
+    assert many.result(timeout=5) == [2, 4, 6, 8, 10]
+    assert [len(batch) for batch in batches] == [6]
+
+
+def test_exceptions_are_handed_back_to_every_request():
+    def predict_batch(instances):
+        raise RuntimeError('prediction failed')
+
+    scheduler = BatchScheduler(predict_batch=predict_batch, max_batch_size=2, max_wait=0.5)
+    futures = [scheduler.submit(i) for i in range(2)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_missing_results_are_handed_back_as_exceptions():
+    scheduler = BatchScheduler(predict_batch=lambda instances: list(instances)[:1], max_batch_size=2, max_wait=0.5)
+    futures = [scheduler.submit(i) for i in range(2)]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    # the scheduler keeps handling requests
+    scheduler.predict_batch = lambda instances: list(instances)
+    assert scheduler.predict(1) == 1
+
+
+def test_queued_jobs_are_kept_when_the_thread_is_restarted():
+    scheduler = BatchScheduler(predict_batch=lambda instances: list(instances), max_wait=0)
+    assert scheduler.predict(1) == 1
+    pending = scheduler._queue
+    # as if the thread stopped, with a job still in the queue
+    scheduler._thread = threading.Thread(target=lambda: None)
+    future = scheduler.submit(2)
+    assert scheduler._queue is pending
+    assert future.result(timeout=5) == 2
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        BatchScheduler(predict_batch=list, max_batch_size=0)
+
+
+def test_batched_predictions_match_single_predictions(app, snippet_overview, test_color_image):
+    model = app.model
+    images = [np.asarray(snippet_overview), np.asarray(test_color_image)]
+
+    batched = app.scheduler.predict_batch([model.preprocess(image) for image in images])
+    for image, prediction in zip(images, batched):
+        single = model.predict(image)
+        assert prediction.labels == tuple(single)
+        assert np.allclose(prediction.scores, list(single.values()), atol=1e-5)
+
+
+def test_scheduler_can_be_garbage_collected():
+    scheduler = BatchScheduler(predict_batch=lambda instances: list(instances), max_wait=0)
+    assert scheduler.predict(1) == 1
+    thread, scheduler_ref = scheduler._thread, weakref.ref(scheduler)
+
+    del scheduler
+    gc.collect()
+    assert scheduler_ref() is None
+    thread.join(timeout=5)
+    assert not thread.is_alive()
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
+
+
+@pytest.fixture
+def reference_meta_data() -> dict:
+    rng = np.random.default_rng(42)
+    return {
+        f'category {i}': {
+            f'label {i}.{j}': {'embeddings': rng.standard_normal((rng.integers(1, 10), 128))} for j in range(3)
+        }
+        for i in range(4)
+    }
+
+
+def _score_per_label(meta_data: dict, embeddings: np.ndarray, metric: str, class_aggregator) -> np.ndarray:
+    return np.asarray(
+        [
+            1 - class_aggregator(cdist(embeddings, label_data['embeddings'], metric=metric), axis=-1) / 2.0
+            for category_data in meta_data.values()
+            for label_data in category_data.values()
+        ]
+    ).T
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'euclidean'])
+@pytest.mark.parametrize('class_aggregator', [np.min, np.mean, np.median])
+def test_score_matches_per_label_distances(
+    vit_model_test_config: ViTModelConfig, reference_meta_data, metric, class_aggregator
+):
+    classifier = EmbeddingClassifier(
+        model=ViTEmbeddingModel(config=vit_model_test_config), metric=metric, class_aggregator=class_aggregator
+    )
+    classifier.update_embeddings(reference_meta_data)
+    embeddings = np.random.default_rng(0).standard_normal((2, 128))
+
+    scores = classifier.score(embeddings)
+    assert scores.shape == (2, len(classifier.labels))
+    assert np.allclose(scores, _score_per_label(reference_meta_data, embeddings, metric, class_aggregator), atol=1e-5)
+
+
+def test_predict(app, snippet_overview):
+    classifier = app.model
+    predictions = classifier.predict(np.asarray(snippet_overview))
+
+    assert tuple(predictions) == classifier.labels
+    assert list(predictions) == [
+        (category, label) for category, articles in app.meta_data.items() for label in articles
+    ]
+    assert all(0.0 <= score <= 1.0 for score in predictions.values())
+
+
+def test_predict_without_reference_embeddings(vit_model_test_config: ViTModelConfig, snippet_overview):
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=vit_model_test_config))
+    with pytest.raises(ValueError):
+        classifier.predict(np.asarray(snippet_overview))
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from app.app import get_meta_data, process_meta_data
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
+from app.embedding_store import EMBEDDINGS_FILENAME, EMBEDDINGS_INDEX_FILENAME, write_embedding_store
+from app.meta_data_store import META_DATA_ARTIFACT_FILENAME
+
+
+def test_embeddings_are_memory_mapped(configuration):
+    meta_data = get_meta_data(app_config=configuration)
+    assert os.path.exists(os.path.join(configuration['ARTIFACT_DIR'], EMBEDDINGS_FILENAME))
+    assert os.path.exists(os.path.join(configuration['ARTIFACT_DIR'], EMBEDDINGS_INDEX_FILENAME))
+
+    embeddings = meta_data['3040']['3040 vlinder xxl']['embeddings']
+    assert isinstance(embeddings, np.memmap)
+    assert embeddings.dtype == np.float32
+    assert not embeddings.flags.writeable
+
+    # the values are the same as the ones parsed from the meta-data
+    parsed_meta_data = get_meta_data(app_config=configuration | {'EMBEDDING_STORE': False})
+    for category, articles in parsed_meta_data.items():
+        for label, article in articles.items():
+            assert np.allclose(meta_data[category][label]['embeddings'], article['embeddings'])
+
+
+def test_embedding_store_is_reused(mocker, configuration):
+    write = mocker.patch('app.app.write_embedding_store', wraps=write_embedding_store)
+    get_meta_data(app_config=configuration)
+    get_meta_data(app_config=configuration)
+    assert write.call_count == 1
+
+    # the store is regenerated when it does not belong to the meta-data anymore
+    mocker.patch('app.app.get_file_digest', return_value='other meta-data')
+    meta_data = get_meta_data(app_config=configuration)
+    assert write.call_count == 2
+    assert meta_data['3040']['3040 vlinder xxl']['embeddings'].shape == (35, 128)
+
+
+def test_reference_matrix_is_not_copied(configuration, vit_model_test_config: ViTModelConfig):
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=vit_model_test_config))
+    classifier.update_embeddings(get_meta_data(app_config=configuration))
+    assert isinstance(classifier.reference_matrix, np.memmap)
+    assert classifier.reference_matrix.shape == (5 * 35, 128)
+
+    classifier.update_embeddings(get_meta_data(app_config=configuration | {'EMBEDDING_STORE': False}))
+    assert not isinstance(classifier.reference_matrix, np.memmap)
+    assert classifier.reference_matrix.dtype == np.float32
+
+
+def test_processed_meta_data_is_reused(mocker, configuration, tmp_path):
+    reference_data_dir = shutil.copytree(configuration['REFERENCE_DATA_DIR'], tmp_path / 'reference_data')
+    configuration = configuration | {'REFERENCE_DATA_DIR': str(reference_data_dir)}
+    meta_data = get_meta_data(app_config=configuration)
+    assert os.path.exists(os.path.join(configuration['ARTIFACT_DIR'], META_DATA_ARTIFACT_FILENAME))
+
+    process = mocker.patch('app.app.process_meta_data', wraps=process_meta_data)
+    reused_meta_data = get_meta_data(app_config=configuration)
+    process.assert_not_called()
+    for category, articles in meta_data.items():
+        for label, article in articles.items():
+            assert reused_meta_data[category][label]['wrappers'] == article['wrappers']
+            assert np.array_equal(reused_meta_data[category][label]['embeddings'], article['embeddings'])
+
+    # but not when thumbnails are generated in the reference data
+    configuration = configuration | {'THUMBNAIL_DIR': str(reference_data_dir / 'thumbnails')}
+    (reference_data_dir / 'thumbnails' / '400' / 'shell1').mkdir(parents=True)
+    get_meta_data(app_config=configuration)
+    process.assert_not_called()
+
+    # the meta-data is processed again when images are added
+    (reference_data_dir / 'shell1' / '3 inch report shell' / 'new.png').write_bytes(b'')
+    meta_data = get_meta_data(app_config=configuration)
+    assert process.call_count == 1
+    assert 'shell1/3 inch report shell/new.png' in meta_data['shell1']['3 inch report shell']['wrappers']['meta_images']
+
+    # the artifact is plain JSON, which is not used by other versions of the processing code
+    with open(os.path.join(configuration['ARTIFACT_DIR'], META_DATA_ARTIFACT_FILENAME)) as f:
+        assert set(json.load(f)) == {'key', 'meta_data'}
+    mocker.patch('app.app.get_code_digest', return_value='other code')
+    get_meta_data(app_config=configuration)
+    assert process.call_count == 2
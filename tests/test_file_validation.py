@@ -1,7 +1,13 @@
+import io
+
+import pytest
 from PIL import Image
 
-from app.requests.validate import _validate_image_data as validate_image_data
-from tests.conftest import TEST_RESOURCES_DIR, large_image_request_data
+from app.calculations.models.utils import convert_bytes_to_pil_image
+from app.requests.messages import IMAGE_TOO_LARGE
+from app.requests.validate import _open_image as open_image
+from tests.conftest import TEST_RESOURCES_DIR, image_post_request_data, large_image_request_data
+from tests.utils import assert_texts_in_response
 
 
 # Sanity check (even though we don't use the file name)
@@ -12,26 +18,26 @@ def test_format_from_content_not_from_file_name(app):
 
 def test_jpeg(app):
     with open(f'{TEST_RESOURCES_DIR}/snippet_shark_3.jpg', 'rb') as f:
-        assert validate_image_data(f.read()) is True
+        assert open_image(f.read()) is not None
 
 
 def test_gif(app):
     with open(f'{TEST_RESOURCES_DIR}/snippet_gigant_maroon.gif', 'rb') as f:
-        assert validate_image_data(f.read()) is True
+        assert open_image(f.read()) is not None
 
 
 def test_png(app):
     with open(f'{TEST_RESOURCES_DIR}/snippet_cobra.png', 'rb') as f:
-        assert validate_image_data(f.read()) is True
+        assert open_image(f.read()) is not None
 
 
 def test_txt(app):
     with open(f'{TEST_RESOURCES_DIR}/test.txt', 'rb') as f:
-        assert validate_image_data(f.read()) is False
+        assert open_image(f.read()) is None
 
 
 def test_non_existent(app):
-    assert validate_image_data(None) is False
+    assert open_image(None) is None
 
 
 # test large files
@@ -46,3 +52,25 @@ def test_request_run_model(client, app):
             "/search", data=large_image_request_data(file_size=app.config["MAX_CONTENT_LENGTH"] - 1000)
         )
         assert response.status_code == 200  # OK
+
+
+def test_image_with_too_many_pixels(client, app):
+    app.config['MAX_IMAGE_PIXELS'] = 100 * 100
+    with client:
+        response = client.post("/search", data=image_post_request_data())
+        assert_texts_in_response(response, [IMAGE_TOO_LARGE])
+
+
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG'])
+@pytest.mark.parametrize('image_size', [(3000, 2000), (500, 4000), (300, 200)])
+def test_convert_large_image_to_reduced_resolution(image_format, image_size):
+    buffer = io.BytesIO()
+    Image.new('RGB', image_size, color=(0, 150, 255)).save(buffer, format=image_format)
+
+    image = convert_bytes_to_pil_image(buffer.getvalue(), size=224)
+    assert image.mode == 'RGB'
+    # every dimension is at least twice the input size (unless the original image is smaller), and at most 4 times
+    assert all(
+        min(2 * 224, original) <= size <= max(4 * 224, original) for size, original in zip(image.size, image_size)
+    )
+    assert convert_bytes_to_pil_image(buffer.getvalue()).size == image_size
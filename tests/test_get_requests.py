@@ -1,6 +1,7 @@
 import json
 import os
 
+from app.app import get_app_version
 from app.requests.messages import (
     MISSING_PAGE_NUMBER,
     MISSING_RESULTS_ID,
@@ -11,7 +12,7 @@ from app.requests.messages import (
     WRONG_LABEL,
 )
 from config.render.meta_data_mapping import META_DATA_KEY_MAPPING
-from tests.conftest import image_post_request_data
+from tests.conftest import get_request_data, image_post_request_data
 from tests.utils import SpyModel, assert_texts_in_response, assert_texts_not_in_response
 
 
@@ -147,6 +148,54 @@ def test_show_image(client, app):
     assert response.status_code == 200
 
 
+def test_image_is_revalidated_without_reading_it(client, mocker):
+    test_filename = "ghost1/9705 zylinderrakete ghost/wrapper.png"
+    response = client.get(f"/images/{test_filename}")
+    assert response.status_code == 200
+    assert response.cache_control.public
+    etag = response.get_etag()[0]
+
+    send_from_directory = mocker.patch('app.blueprints.results.results.send_from_directory')
+    response = client.get(f"/images/{test_filename}", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    send_from_directory.assert_not_called()
+
+
+def test_article_and_category_pages_are_revalidated(client, app):
+    for path in ("/categories/shell1?page=1", "/categories/shell1/articles/3 inch report shell"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.cache_control.private
+        etag = response.get_etag()[0]
+
+        assert client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+        # the pages are translated, so they change with the language
+        client.set_cookie("locale", "en")
+        assert client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code == 200
+        client.delete_cookie("locale")
+
+        # and with the app (e.g. its templates) after a deploy
+        app_version, app.app_version = app.app_version, 'other'
+        assert client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code == 200
+        app.app_version = app_version
+
+
+def test_category_page_changes_when_its_results_expire(client, app, results_id):
+    path = f"/categories/shell1?{get_request_data(results_id)}"
+    etag = client.get(path).get_etag()[0]
+    assert client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+    # without the results, the page is no longer ordered by them
+    del app.cache[results_id]
+    assert client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code == 200
+
+
+def test_app_version(tmp_path):
+    (tmp_path / 'pyproject.toml').write_text('[project]\nname = "app"\nversion = "1.2.3"\n')
+    assert get_app_version(str(tmp_path)) == '1.2.3'
+    assert get_app_version(str(tmp_path / 'missing')) == 'unknown'
+
+
 def test_get_request_no_result_id_used(client):
     with client:
         response = client.get("/search/results?")
@@ -1,9 +1,115 @@
+import io
+import os
+
 import numpy as np
+import pytest
 from PIL import Image
 
+from app.app import get_thumbnail_dir
 from app.calculations.models.utils import convert_pil_image_to_numpy
+from app.image_manifest import load_image_manifest
+from app.thumbnails import generate_thumbnails, get_thumbnail, has_image_extension, select_thumbnail_width
 
 
 def test_image_to_numpy_conversion(test_color_image: Image):
     data = convert_pil_image_to_numpy(test_color_image)
     assert np.array_equal(data[0, 0, :], list(test_color_image.getdata())[0])
+
+
+@pytest.fixture
+def configuration(configuration):
+    return configuration | {'THUMBNAIL_WIDTHS': [100, 400]}
+
+
+def test_select_thumbnail_width():
+    assert select_thumbnail_width([100, 400], 50) == 100
+    assert select_thumbnail_width([100, 400], 101) == 400
+    assert select_thumbnail_width([100, 400], 800) == 400
+
+
+def test_image_extensions_are_case_insensitive():
+    assert has_image_extension('ghost1/wrapper.PNG', ['.png', '.jpg'])
+    assert has_image_extension('ghost1/wrapper.jpg', ['.png', '.jpg'])
+    assert not has_image_extension('ghost1/wrapper.txt', ['.png', '.jpg'])
+
+
+def test_thumbnails_are_generated_again_for_modified_images(tmp_path, test_color_image: Image):
+    (tmp_path / 'images').mkdir()
+    test_color_image.resize((300, 200)).save(tmp_path / 'images' / 'image.png')
+    thumbnail_dir = str(tmp_path / 'thumbnails')
+
+    assert get_thumbnail(str(tmp_path), thumbnail_dir, 'images/image.png', 100) is None
+    assert generate_thumbnails(str(tmp_path), thumbnail_dir, [100, 400], ['.png']) == 2
+    assert generate_thumbnails(str(tmp_path), thumbnail_dir, [100, 400], ['.png']) == 0
+    with Image.open(get_thumbnail(str(tmp_path), thumbnail_dir, 'images/image.png', 100)) as thumbnail:
+        assert (thumbnail.format, thumbnail.size) == ('WEBP', (100, 67))
+    # images are not upscaled
+    with Image.open(get_thumbnail(str(tmp_path), thumbnail_dir, 'images/image.png', 400)) as thumbnail:
+        assert thumbnail.size == (300, 200)
+
+    stat = os.stat(tmp_path / 'images' / 'image.png')
+    os.utime(tmp_path / 'images' / 'image.png', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    # outdated thumbnails are not used
+    assert get_thumbnail(str(tmp_path), thumbnail_dir, 'images/image.png', 100) is None
+    assert generate_thumbnails(str(tmp_path), thumbnail_dir, [100, 400], ['.png']) == 2
+
+
+def test_show_thumbnail(client, app):
+    filename = 'ghost1/9705 zylinderrakete ghost/wrapper.png'
+    # the image itself is shown until its thumbnails are generated, which is never done by the requests
+    response = client.get(f'/images/{filename}?width=90')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert not os.path.exists(os.path.join(app.config['THUMBNAIL_DIR'], '100'))
+
+    generate_thumbnails(
+        app.config['REFERENCE_DATA_DIR'],
+        app.config['THUMBNAIL_DIR'],
+        app.config['THUMBNAIL_WIDTHS'],
+        app.config['ALLOWED_EXTENSIONS'],
+    )
+    response = client.get(f'/images/{filename}?width=90')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    with Image.open(io.BytesIO(response.data)) as thumbnail:
+        assert thumbnail.width <= 100
+    assert len(response.data) < os.path.getsize(os.path.join(app.config['REFERENCE_DATA_DIR'], filename))
+
+    # the thumbnail changes with the configured quality
+    etag = response.get_etag()[0]
+    app.config['THUMBNAIL_QUALITY'] = 50
+    assert client.get(f'/images/{filename}?width=90', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
+
+    # like other requests for missing pages, requests for missing images are redirected to the index page
+    response = client.get('/images/ghost1/missing.png?width=90')
+    assert response.status_code == 302
+    assert not os.path.exists(os.path.join(app.config['THUMBNAIL_DIR'], '100', 'ghost1', 'missing.png.webp'))
+
+
+def test_thumbnails_are_stored_outside_the_reference_data(configuration):
+    assert get_thumbnail_dir(configuration) == os.path.join(configuration['ARTIFACT_DIR'], 'thumbnails')
+    # also when the artifacts are stored in the reference data
+    configuration = configuration | {'ARTIFACT_DIR': None}
+    assert get_thumbnail_dir(configuration) == os.path.join(configuration['META_DATA_DIR'], 'thumbnails')
+    assert get_thumbnail_dir(configuration | {'THUMBNAIL_DIR': '/thumbnails'}) == '/thumbnails'
+
+
+def test_image_manifest_is_only_updated_for_modified_images(tmp_path, test_color_image: Image, mocker):
+    reference_data_dir, manifest_dir = tmp_path / 'reference_data', str(tmp_path / 'artifacts')
+    reference_data_dir.mkdir()
+    test_color_image.save(reference_data_dir / 'first.png')
+    test_color_image.resize((30, 20)).save(reference_data_dir / 'second.png')
+
+    manifest = load_image_manifest(str(reference_data_dir), manifest_dir, ['.png'])
+    assert (manifest['second.png'].width, manifest['second.png'].height) == (30, 20)
+    assert manifest['first.png'].size == os.path.getsize(reference_data_dir / 'first.png')
+
+    spy = mocker.spy(Image, 'open')
+    assert load_image_manifest(str(reference_data_dir), manifest_dir, ['.png']) == manifest
+    spy.assert_not_called()
+
+    test_color_image.resize((10, 10)).save(reference_data_dir / 'first.png')
+    updated = load_image_manifest(str(reference_data_dir), manifest_dir, ['.png'])
+    assert spy.call_count == 1
+    assert updated['first.png'].digest != manifest['first.png'].digest
+    assert updated['second.png'] == manifest['second.png']
@@ -0,0 +1,45 @@
+import copy
+import os
+
+import pytest
+import torch
+
+from app.calculations.models import ViTEmbeddingModel, ViTModelConfig
+from app.calculations.models.backends import apply_inference_backend, compare_backends
+from app.calculations.workers import RemoteClassifier
+from tests.conftest import TEST_RESOURCES_DIR
+
+
+def test_int8_dynamic_backend_quantizes_linear_layers(vit_model_test_config: ViTModelConfig):
+    model = ViTEmbeddingModel(config=vit_model_test_config).eval()
+    quantized = apply_inference_backend(copy.deepcopy(model), 'int8-dynamic')
+
+    assert isinstance(quantized.projector, torch.ao.nn.quantized.dynamic.Linear)
+    assert isinstance(quantized.vit.encoder.layer[0].attention.attention.query, torch.ao.nn.quantized.dynamic.Linear)
+    inputs = torch.rand(4, 3, vit_model_test_config.image_size, vit_model_test_config.image_size)
+    comparison = compare_backends(model, quantized, inputs, score=lambda embeddings: embeddings, top_k=3)
+    assert 0.9 < comparison.min_similarity <= comparison.mean_similarity <= 1.0 + 1e-6
+
+
+def test_float32_backend_is_unchanged(vit_model_test_config: ViTModelConfig):
+    model = ViTEmbeddingModel(config=vit_model_test_config)
+    assert apply_inference_backend(model, 'float32') is model
+    with pytest.raises(ValueError):
+        apply_inference_backend(model, 'float8')
+
+
+def test_check_inference_backend_command(mocker, app, vit_model_test_config: ViTModelConfig):
+    mocker.patch('app.app.load_embedding_model', return_value=ViTEmbeddingModel(config=vit_model_test_config))
+    # the model of the application may run in the inference workers, which is not used for the comparison
+    mocker.patch.object(app, 'model', RemoteClassifier('inference.sock', b'key'))
+    images = [os.path.join(TEST_RESOURCES_DIR, name) for name in ('snippet_cobra.png', 'snippet_shark_3.jpg')]
+    args = ['check-inference-backend', '--top-k', '2', *(arg for image in images for arg in ('--images', image))]
+
+    result = app.test_cli_runner().invoke(args=args + ['--min-similarity', '0', '--min-agreement', '0'])
+    assert result.exit_code == 0, result.output
+    assert 'compared int8-dynamic with float32' in result.output
+    assert 'top-2 agreement' in result.output
+
+    # fail when the required similarity cannot be met
+    result = app.test_cli_runner().invoke(args=args + ['--min-similarity', '1.1'])
+    assert result.exit_code != 0
@@ -0,0 +1,145 @@
+import functools
+import os
+import socket
+import stat
+import time
+from multiprocessing import AuthenticationError
+
+import numpy as np
+import pytest
+import torch
+
+from app.app import get_meta_data
+from app.calculations.models import EmbeddingClassifier, ViTEmbeddingModel, ViTModelConfig
+from app.calculations.workers import InferenceServer, RemoteClassifier, get_authkey
+from tests.conftest import TEST_RESOURCES_DIR, image_post_request_data
+
+
+def _load_classifier(configuration: dict) -> EmbeddingClassifier:
+    """Load the same randomly initialized classifier in every process."""
+    torch.manual_seed(0)
+    config = ViTModelConfig(
+        model_size="base",
+        embedding_size=128,
+        image_size=64,
+        patch_size=32,
+        add_pooling_layer=False,
+        mean_pooling=False,
+        device="cpu",
+        force_download=False,
+    )
+    classifier = EmbeddingClassifier(model=ViTEmbeddingModel(config=config))
+    classifier.update_embeddings(meta_data=get_meta_data(app_config=configuration))
+    return classifier
+
+
+@pytest.fixture(scope='module')
+def inference_server(tmp_path_factory):
+    # the worker processes take a while to start, so they are shared by the tests of the module
+    directory = tmp_path_factory.mktemp('inference')
+    configuration = {
+        'REFERENCE_DATA_DIR': os.path.join(TEST_RESOURCES_DIR, 'demo_data', 'reference_data'),
+        'ARTIFACT_DIR': str(directory),
+        'WRAPPER_FILENAME': 'wrapper.png',
+    }
+    server = InferenceServer(
+        str(directory / 'inference.sock'),
+        get_authkey(str(directory / 'inference.key')),
+        functools.partial(_load_classifier, configuration),
+        n_workers=2,
+    )
+    server.start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def configuration(configuration, inference_server):
+    return configuration | {
+        'INFERENCE_SOCKET': inference_server.address,
+        'INFERENCE_AUTHKEY_FILE': os.path.join(os.path.dirname(inference_server.address), 'inference.key'),
+    }
+
+
+def test_remote_predictions_match_local_predictions(inference_server, snippet_overview, test_color_image):
+    remote = RemoteClassifier(inference_server.address, inference_server.authkey)
+    local = _load_classifier(inference_server.load_model.args[0])
+    assert remote.labels == local.labels
+    assert remote.input_size == local.input_size
+
+    images = [np.asarray(snippet_overview), np.asarray(test_color_image)]
+    # the images are preprocessed by the client, as by the model itself
+    instances = [remote.preprocess(image) for image in images]
+    torch.testing.assert_close(instances[0], local.preprocess(images[0]))
+    for prediction, expected in zip(remote.predict_batch(instances), local.predict_batch(instances)):
+        assert prediction.labels == expected.labels
+        np.testing.assert_allclose(prediction.scores, expected.scores, atol=1e-5)
+
+    # errors of the model are raised by the client
+    with pytest.raises(ValueError):
+        remote.predict_batch([torch.zeros(1, 3, 8, 8)])
+    assert len(remote.predict_batch(instances[:1])) == 1
+
+
+def test_search_with_inference_workers(inference_server, client):
+    assert isinstance(client.application.model, RemoteClassifier)
+    with client:
+        response = client.post('/search', data=image_post_request_data())
+    assert response.status_code == 200
+    assert 'results_id' in response.json
+
+
+def test_clients_are_authenticated(inference_server):
+    # the socket and the key are only accessible to the current user
+    assert stat.S_IMODE(os.stat(inference_server.address).st_mode) & 0o077 == 0
+    key_file = os.path.join(os.path.dirname(inference_server.address), 'inference.key')
+    assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o600
+    assert get_authkey(key_file) == inference_server.authkey
+
+    with pytest.raises(AuthenticationError):
+        RemoteClassifier(inference_server.address, b'wrong key').labels
+    # the server keeps accepting other clients
+    assert RemoteClassifier(inference_server.address, inference_server.authkey).labels
+
+
+def test_stalled_clients_do_not_block_other_clients(inference_server):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+        # connects, but never answers the authentication challenge
+        stalled.connect(inference_server.address)
+        assert RemoteClassifier(inference_server.address, inference_server.authkey).labels
+
+
+def test_server_fails_to_start_when_a_worker_fails_to_load_the_model(tmp_path):
+    # fails as soon as the worker processes have started, without loading anything
+    load_model = functools.partial(open, str(tmp_path / 'missing_model.pt'), 'rb')
+    server = InferenceServer(str(tmp_path / 'inference.sock'), b'key', load_model, n_workers=2)
+    with pytest.raises(RuntimeError, match='exited while loading'):
+        server.start()
+    assert not any(worker.is_alive() for worker in server._workers)
+    assert not os.path.exists(server.address)
+
+
+def test_server_fails_to_start_when_the_workers_do_not_load_the_model_in_time(tmp_path):
+    load_model = functools.partial(time.sleep, 600)
+    server = InferenceServer(str(tmp_path / 'inference.sock'), b'key', load_model, n_workers=2, load_timeout=1)
+    with pytest.raises(RuntimeError, match='did not load the model within'):
+        server.start()
+    assert not any(worker.is_alive() for worker in server._workers)
+    assert not os.path.exists(server.address)
+
+
+def test_server_shuts_down_when_a_worker_exits(configuration, tmp_path):
+    server = InferenceServer(
+        str(tmp_path / 'inference.sock'), b'key', functools.partial(_load_classifier, configuration), n_workers=1
+    )
+    server.start()
+    server._workers[0].kill()
+    with pytest.raises(RuntimeError):
+        server.serve_forever()
+    with pytest.raises(OSError):
+        RemoteClassifier(server.address, server.authkey).predict(np.zeros((64, 64, 3), dtype=np.uint8))
+
+
+def test_invalid_number_of_workers(tmp_path):
+    with pytest.raises(ValueError):
+        InferenceServer(str(tmp_path / 'inference.sock'), b'key', _load_classifier, n_workers=0)
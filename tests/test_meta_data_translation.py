@@ -0,0 +1,23 @@
+import pytest
+from flask_babel import refresh
+
+from app.meta_data_translation import MetaDataValueTranslator
+from config.render.meta_data_mapping import META_DATA_VALUE_MAPPING_STRING, META_DATA_VALUE_MAPPING_WORDS
+
+
+@pytest.fixture
+def configuration(configuration):
+    return configuration | {'BABEL_TRANSLATION_DIRECTORIES': '../translations'}
+
+
+def test_translate_meta_data_values(app):
+    translator = MetaDataValueTranslator(META_DATA_VALUE_MAPPING_STRING, META_DATA_VALUE_MAPPING_WORDS)
+    value = 'blauw aluminiumpoeder met rasta-traat'
+    with app.test_request_context(headers={'Cookie': 'locale=en'}):
+        refresh()
+        assert str(translator(value)) == 'Blue aluminum powder with rasta-trate'
+    with app.test_request_context():
+        refresh()
+        assert str(translator(value)) == 'Blauw aluminiumpoeder met rasta-traat'
+    # every value is translated once per locale
+    assert translator._translations.keys() == {('en', value), ('nl', value)}
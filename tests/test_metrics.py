@@ -0,0 +1,35 @@
+import pytest
+
+from tests.conftest import image_post_request_data
+
+
+@pytest.fixture
+def configuration(configuration):
+    return configuration | {'METRICS': True, 'PAGE_CACHE_SIZE': 8}
+
+
+def test_search_stages_in_server_timing(client):
+    response = client.post("/search", data=image_post_request_data(query_text='vlinder', text_filter='true'))
+    assert "results_id" in response.get_json()
+
+    stages = dict(timing.split(';dur=') for timing in response.headers['Server-Timing'].split(', '))
+    expected = {'parse', 'decode', 'preprocess', 'queue', 'forward', 'score', 'sort', 'filter', 'views', 'total'}
+    assert stages.keys() == expected
+    assert all(float(duration) >= 0 for duration in stages.values())
+
+    response = client.get("/categories/shell1?page=1")
+    assert 'render' in response.headers['Server-Timing']
+
+
+def test_metrics_endpoint(client):
+    client.post("/search", data=image_post_request_data())
+    client.get("/categories/shell1?page=1")
+    client.get("/categories/shell1?page=1")
+
+    response = client.get("/metrics")
+    assert response.mimetype == 'text/plain'
+    metrics = response.get_data(as_text=True)
+    assert 'vuurwerkverkenner_request_duration_seconds_count{endpoint="results.run_model"} 1' in metrics
+    assert 'vuurwerkverkenner_stage_duration_seconds_count{stage="forward"} 1' in metrics
+    assert 'vuurwerkverkenner_searches_in_flight 0' in metrics
+    assert 'vuurwerkverkenner_cache_hit_ratio{cache="page"} 0.5' in metrics
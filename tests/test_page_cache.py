@@ -0,0 +1,43 @@
+import pytest
+
+from tests.conftest import get_request_data
+from tests.utils import assert_texts_in_response
+
+
+@pytest.fixture
+def configuration(configuration):
+    return configuration | {
+        'PAGE_CACHE_SIZE': 64,
+        'PAGE_CACHE_PRERENDER': True,
+        'BABEL_TRANSLATION_DIRECTORIES': '../translations',
+    }
+
+
+def test_article_pages_are_prerendered(app, client):
+    n_articles = sum(len(articles) for articles in app.meta_data.values())
+    assert app.page_cache.stats['misses'] == n_articles * len(app.config['LANGUAGES'])
+
+    response = client.get("/categories/shell1/articles/3 inch report shell")
+    assert response.status_code == 200
+    assert_texts_in_response(response, "Vuurwerktype")
+    assert app.page_cache.stats['hits'] == 1
+
+    client.set_cookie("locale", "en")
+    response = client.get("/categories/shell1/articles/3 inch report shell")
+    assert response.status_code == 200
+    assert_texts_in_response(response, "Type of fireworks")
+    assert app.page_cache.stats['hits'] == 2
+    assert app.page_cache.stats['misses'] == n_articles * len(app.config['LANGUAGES'])
+
+
+def test_category_pages_are_cached_without_results_ordering(app, client, results_id):
+    misses = app.page_cache.stats['misses']
+    first = client.get("/categories/shell1?page=1")
+    assert client.get("/categories/shell1?page=1").get_data() == first.get_data()
+    assert app.page_cache.stats['misses'] == misses + 1
+    assert app.page_cache.stats['hits'] == 1
+
+    # the pages ordered by the cached search results are rendered on every request
+    response = client.get(f"/categories/shell1?{get_request_data(results_id)}")
+    assert response.status_code == 200
+    assert app.page_cache.stats == {'hits': 1, 'misses': misses + 1, 'shared': 0}
@@ -1,7 +1,17 @@
 import io
 import json
 
-from app.requests.messages import EMPTY_FILE, INVALID_FILE_FORMAT, NO_MATCH_FOUND
+import numpy as np
+from PIL import Image
+
+from app.calculations.cache import get_from_cache
+from app.requests.messages import (
+    EMPTY_FILE,
+    INVALID_FILE_FORMAT,
+    MISSING_IMAGE_FILE,
+    NO_MATCH_FOUND,
+    TOO_MANY_IMAGES,
+)
 from tests.conftest import TEST_RESOURCES_DIR, image_post_request_data, post_request_data
 from tests.utils import SpyModel, assert_texts_in_response
 
@@ -35,6 +45,14 @@ def test_post_request_trigger_model(client):
         assert_texts_in_response(response, ["results_id"])
 
 
+def test_post_request_opens_image_once(mocker, client):
+    open_image = mocker.spy(Image, 'open')
+    with client:
+        response = client.post("/search", data=image_post_request_data())
+        assert_texts_in_response(response, ["results_id"])
+    assert open_image.call_count == 1
+
+
 def test_post_request_empty(client):
     with client:
         response = client.post("/search", data=None)
@@ -94,3 +112,56 @@ def test_post_request_script_injection_text(client, results_id):
             ),
         )
         assert_texts_in_response(response, [NO_MATCH_FOUND])
+
+
+def batch_post_request_data(images: list[Image.Image], query_texts: list[str] = (), fuse: str = 'false'):
+    files = []
+    for image in images:
+        file = io.BytesIO()
+        image.save(file, format='PNG')
+        file.seek(0)
+        files.append((file, 'test.png'))
+    return {"file": files, "query_text": list(query_texts), "text_filter": 'true', "fuse": fuse}
+
+
+def test_post_request_batch(client, snippet_overview, test_color_image):
+    with client:
+        response = client.post(
+            "/search/batch", data=batch_post_request_data([snippet_overview, test_color_image], ['', 'vlinder'])
+        )
+        results_ids = response.get_json()["results_ids"]
+        assert len(results_ids) == 2
+        first, second = (get_from_cache(results_id) for results_id in results_ids)
+
+        # the results of every image are those of a single search with its image and query text
+        for image, query_text, views in ((snippet_overview, '', first), (test_color_image, 'vlinder', second)):
+            file = io.BytesIO()
+            image.save(file, format='PNG')
+            file.seek(0)
+            single = client.post(
+                "/search",
+                data=post_request_data(file=file, filename='test.png', query_text=query_text, text_filter='true'),
+            )
+            expected = get_from_cache(single.get_json()["results_id"])
+            np.testing.assert_array_equal(views.results.indices, expected.results.indices)
+            np.testing.assert_allclose(views.results.scores, expected.results.scores, atol=1e-5)
+        assert len(second) == 1
+
+
+def test_post_request_batch_fused(client, snippet_overview, test_color_image):
+    with client:
+        response = client.post(
+            "/search/batch", data=batch_post_request_data([snippet_overview, test_color_image], fuse='true')
+        )
+        views = get_from_cache(response.get_json()["results_id"])
+        assert len(views) == len(client.application.labels)
+        assert np.all(np.diff(views.results.scores) <= 0)
+
+
+def test_post_request_batch_errors(client, test_color_image):
+    with client:
+        response = client.post("/search/batch", data={"file": []})
+        assert_texts_in_response(response, [MISSING_IMAGE_FILE])
+
+        response = client.post("/search/batch", data=batch_post_request_data([test_color_image] * 17))
+        assert_texts_in_response(response, [TOO_MANY_IMAGES])
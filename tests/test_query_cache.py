@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from app.calculations.cache import QueryCache
+from tests.conftest import image_post_request_data
+from tests.utils import SpyModel, assert_texts_in_response
+
+
+def test_cached_values_are_reused():
+    cache = QueryCache(size=1)
+    assert cache.get_or_compute('a', lambda: 1) == 1
+    assert cache.get_or_compute('a', lambda: 2) == 1
+    assert cache.get_or_compute('b', lambda: 3) == 3
+    # the cache is bounded, so 'a' is evicted
+    assert cache.get_or_compute('a', lambda: 4) == 4
+    assert cache.stats == {'hits': 1, 'misses': 3, 'shared': 0}
+
+
+def test_concurrent_requests_share_a_single_computation():
+    cache = QueryCache(size=0)
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return 'value'
+
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+    owner.start()
+    started.wait(timeout=5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute))) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    deadline = time.monotonic() + 5
+    while cache.stats['shared'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in (owner, *waiters):
+        thread.join(timeout=5)
+
+    assert len(calls) == 1
+    assert results == ['value'] * 4
+    assert cache.stats == {'hits': 0, 'misses': 1, 'shared': 3}
+
+
+def test_failed_computations_are_not_cached():
+    cache = QueryCache(size=2)
+
+    def fail():
+        raise RuntimeError('computation failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('key', fail)
+    assert cache.get_or_compute('key', lambda: 'value') == 'value'
+
+
+def test_batches_only_compute_uncached_keys_once():
+    cache = QueryCache(size=4)
+    cache.get_or_compute('a', lambda: 'cached')
+    calls = []
+
+    def compute(positions):
+        calls.append(positions)
+        return [f'value{i}' for i in positions]
+
+    assert cache.get_or_compute_many(['a', 'b', 'c', 'b'], compute) == ['cached', 'value1', 'value2', 'value1']
+    assert calls == [[1, 2]]
+    assert cache.stats == {'hits': 1, 'misses': 3, 'shared': 1}
+
+
+def test_repeated_uploads_use_cached_predictions(client, app):
+    with client:
+        spy_model = SpyModel()
+        app.model = spy_model
+        app.query_cache = QueryCache(size=2)
+
+        for query_text in ('', 'cobra'):
+            response = client.post("/search", data=image_post_request_data(query_text=query_text))
+            assert_texts_in_response(response, ["results_id"])
+        assert spy_model.prediction_triggers == 1
+        assert app.query_cache.stats == {'hits': 1, 'misses': 1, 'shared': 0}
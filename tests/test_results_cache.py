@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from app.calculations.cache import ResultsSerializer, SQLiteCache
+from app.calculations.core import LabelTable, Results, ResultViews
+from tests.conftest import get_request_data, image_post_request_data
+
+LABELS = LabelTable([('3040', 'a'), ('3040', 'b'), ('3050', 'c')])
+RESULTS = ResultViews.from_results(Results(np.array([2, 0]), np.array([0.75, 0.25])), LABELS)
+
+
+@pytest.fixture
+def configuration(configuration):
+    return configuration | {'CACHE_BACKEND': 'sqlite'}
+
+
+def _write_to_cache(path: str, key: str):
+    SQLiteCache(path, ResultsSerializer('v1'))[key] = RESULTS
+
+
+def assert_results_equal(views: ResultViews, expected: ResultViews):
+    np.testing.assert_array_equal(views.results.indices, expected.results.indices)
+    np.testing.assert_array_equal(views.results.scores, expected.results.scores)
+    assert views.results.ranked == expected.results.ranked
+    for name in ('groups', 'category_rows', 'category_offsets', 'counts', 'tail_categories'):
+        np.testing.assert_array_equal(getattr(views, name), getattr(expected, name))
+
+
+def test_serializer_stores_results_as_label_indices_and_scores():
+    serializer = ResultsSerializer('v1')
+    data = serializer.dumps(RESULTS)
+    assert len(data) == 1 + 34 + 2 + 4 * (2 * len(RESULTS) + 2 + len(RESULTS) + 3 + 2)
+    assert_results_equal(serializer.loads(data), RESULTS)
+    # results refer to the labels of a specific version of the meta-data
+    assert ResultsSerializer('v2').loads(data) is None
+    # partially ranked results are stored with their unranked results
+    views = ResultViews.from_results(Results(np.array([2, 0, 1]), np.array([0.75, 0.25, 0.5])).sorted(top_k=1), LABELS)
+    assert_results_equal(serializer.loads(serializer.dumps(views)), views)
+    # other values are not stored, and nothing else is loaded (e.g. pickled values)
+    with pytest.raises(TypeError):
+        serializer.dumps({'key': 'value'})
+    assert serializer.loads(b'P' + pickle.dumps({'key': 'value'})) is None
+
+
+def test_sqlite_cache_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SQLiteCache(path, ResultsSerializer('v1'))
+    process = multiprocessing.get_context('spawn').Process(target=_write_to_cache, args=(path, 'key'))
+    process.start()
+    process.join(timeout=60)
+    assert process.exitcode == 0
+    assert_results_equal(cache.get('key'), RESULTS)
+    assert cache.get('other key') is None
+
+
+def test_sqlite_cache_expires_entries(tmp_path, mocker):
+    time = mocker.patch('app.calculations.cache.time.time', return_value=1000.0)
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), ResultsSerializer('v1'), ttl=10)
+    cache['key'] = RESULTS
+    time.return_value = 1009.0
+    assert_results_equal(cache.get('key'), RESULTS)
+    time.return_value = 1010.0
+    assert cache.get('key') is None
+
+
+def test_sqlite_cache_removes_oldest_entries_above_byte_budget(tmp_path):
+    serializer = ResultsSerializer('v1')
+    size = len(serializer.dumps(RESULTS))
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), serializer, max_bytes=2 * size)
+    for key in ('first', 'second', 'third'):
+        cache[key] = RESULTS
+    assert cache.get('first') is None
+    assert_results_equal(cache.get('second'), RESULTS)
+    assert_results_equal(cache.get('third'), RESULTS)
+
+
+def test_search_results_are_stored_in_sqlite_cache(client, app):
+    response = client.post('/search', data=image_post_request_data(), content_type='multipart/form-data')
+    results_id = response.json['results_id']
+    response = client.get(f'/search/results?{get_request_data(results_id)}')
+    assert response.status_code == 200
+    assert 'Resultaten niet (meer) beschikbaar' not in response.text
+    # the results are available to other worker processes as well
+    cache = SQLiteCache(
+        os.path.join(app.config['ARTIFACT_DIR'], 'results_cache.sqlite'),
+        ResultsSerializer(app.data_version),
+    )
+    assert len(cache.get(results_id)) == len(app.labels)
@@ -0,0 +1,75 @@
+import numpy as np
+
+from app.calculations.core import LabelTable, Result, Results, ResultViews, get_search_results
+from app.calculations.models import Prediction
+
+LABELS = LabelTable([('3040', 'a'), ('3050', 'b'), ('3040', 'c')])
+
+
+def test_results_are_sorted_on_descending_score():
+    results = Results(np.array([0, 1, 2]), np.array([0.5, 0.9, 0.5])).sorted()
+    assert LABELS.materialize(results) == [
+        Result(category='3050', label='b', score=np.float32(0.9)),
+        Result(category='3040', label='a', score=0.5),
+        Result(category='3040', label='c', score=0.5),
+    ]
+
+
+def test_results_of_prediction_in_other_order():
+    prediction = Prediction(labels=(('3040', 'c'), ('unknown', 'd'), ('3040', 'a')), scores=np.array([0.1, 0.2, 0.3]))
+    results = LABELS.from_prediction(prediction)
+    np.testing.assert_array_equal(results.indices, [2, 0])
+    np.testing.assert_array_equal(results.scores, np.array([0.1, 0.3], dtype=np.float32))
+
+
+def test_result_views():
+    views = ResultViews.from_results(Results(np.array([2, 1, 0]), np.array([0.9, 0.5, 0.1])), LABELS)
+    # the first result of every category
+    assert [r.label for r in LABELS.materialize(views.grouped(0, 5))] == ['c', 'b']
+    assert [r.label for r in LABELS.materialize(views.grouped(1, 2))] == ['b']
+    # the ranked results within a category
+    category_code = LABELS.category_codes['3040']
+    assert views.count(category_code) == 2
+    assert [r.label for r in LABELS.materialize(views.in_category(category_code))] == ['c', 'a']
+    assert [r.label for r in LABELS.materialize(views.in_category(category_code, 1, 5))] == ['a']
+    assert len(views.in_category(category_code, 5, 10)) == 0
+
+
+def test_results_ranked_partially_are_ranked_like_all_results():
+    rng = np.random.default_rng(0)
+    labels = LabelTable([(str(category), str(label)) for label, category in enumerate(rng.integers(0, 20, 500))])
+    # scores with many ties, which keep their order
+    results = Results(rng.permutation(500), rng.integers(0, 50, 500) / 50)
+    expected = results.sorted()
+    partial = results.sorted(top_k=25)
+    assert partial.ranked == 25
+    np.testing.assert_array_equal(partial.indices[:25], expected.indices[:25])
+    assert sorted(partial.indices) == sorted(expected.indices)
+
+    # the views of the partially ranked results show the same pages, also beyond the ranked results
+    mask = rng.random(500) < 0.8
+    for sorted_results, partial_results in (
+        (expected, partial),
+        (expected[mask[expected.indices]], partial[mask[partial.indices]]),
+    ):
+        views = ResultViews.from_results(partial_results, labels)
+        expected_views = ResultViews.from_results(sorted_results, labels)
+        np.testing.assert_array_equal(views.grouped(0, 20).indices, expected_views.grouped(0, 20).indices)
+        for category_code in range(len(labels.category_codes)):
+            assert views.count(category_code) == expected_views.count(category_code)
+            for start, end in ((0, 2), (2, 10), (0, None)):
+                np.testing.assert_array_equal(
+                    views.in_category(category_code, start, end).indices,
+                    expected_views.in_category(category_code, start, end).indices,
+                )
+
+
+def test_search_results_for_query_text(app):
+    results, errors = get_search_results(query_image=None, query_text='vlinder', text_filter=False)
+    assert not errors
+    assert len(results) == len(app.labels)
+    first = app.labels.materialize(results[:1])[0]
+    assert (first.category, first.label) == ('3040', '3040 vlinder xxl')
+
+    results, _ = get_search_results(query_image=None, query_text='vlinder', text_filter=True)
+    assert app.labels.materialize(results) == [first]
@@ -0,0 +1,69 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.snapshots import get_snapshot_revision, sync_snapshot, write_snapshot_manifest
+
+REPO_ID = 'owner/model'
+
+
+@pytest.fixture
+def hf_api(mocker):
+    info = SimpleNamespace(sha='abcdef0123456789', siblings=[SimpleNamespace(rfilename='model.bin')])
+    api = mocker.patch('app.snapshots.HfApi')
+    api.return_value.repo_info.return_value = info
+    return api
+
+
+@pytest.fixture
+def download(mocker):
+    def snapshot_download(repo_id, repo_type, local_dir, revision):
+        with open(os.path.join(local_dir, 'model.bin'), 'wb') as f:
+            f.write(b'weights')
+
+    return mocker.patch('app.snapshots.snapshot_download', side_effect=snapshot_download)
+
+
+def test_sync_snapshot_downloads_only_new_revision(tmp_path, hf_api, download):
+    assert sync_snapshot(REPO_ID, str(tmp_path)) == 'abcdef0123456789'
+    assert download.call_count == 1
+    assert get_snapshot_revision(str(tmp_path)) == 'abcdef0123456789'
+
+    assert sync_snapshot(REPO_ID, str(tmp_path)) == 'abcdef0123456789'
+    assert download.call_count == 1
+
+    hf_api.return_value.repo_info.return_value.sha = '9876543210fedcba'
+    assert sync_snapshot(REPO_ID, str(tmp_path)) == '9876543210fedcba'
+    assert download.call_count == 2
+
+
+def test_sync_snapshot_offline(tmp_path, hf_api, download):
+    with pytest.raises(ValueError):
+        sync_snapshot(REPO_ID, str(tmp_path), offline=True)
+
+    sync_snapshot(REPO_ID, str(tmp_path))
+    hf_api.reset_mock()
+    assert sync_snapshot(REPO_ID, str(tmp_path), offline=True) == 'abcdef0123456789'
+    hf_api.assert_not_called()
+
+    with open(tmp_path / 'model.bin', 'wb') as f:
+        f.write(b'modified')
+    with pytest.raises(ValueError):
+        sync_snapshot(REPO_ID, str(tmp_path), offline=True)
+    # online, the modified snapshot is downloaded again
+    sync_snapshot(REPO_ID, str(tmp_path))
+    assert download.call_count == 2
+
+
+@pytest.fixture
+def configuration(configuration, tmp_path):
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    write_snapshot_manifest(str(model_dir), REPO_ID, 'abcdef0123456789', ())
+    return configuration | {'MODEL_DIR': str(model_dir)}
+
+
+def test_help_page_shows_recorded_revision(client):
+    response = client.get('/help')
+    assert 'abcdef0' in response.get_data(as_text=True)
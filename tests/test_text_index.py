@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.calculations.text_index import TextIndex
+
+TEXTS = (
+    'cobra 6 shell',
+    'thunder king 1000',
+    '',
+    'super cobra xxl salute',
+    'cobra',
+    'a',
+    'gigant maroon 40 x',
+)
+
+
+@pytest.mark.parametrize(
+    'tokens',
+    [
+        ['cobra'],
+        ['co'],
+        ['c'],
+        ['cobra', 'xxl'],
+        ['xxl', 'cobra', 'cobra'],
+        ['a'],
+        ['00'],
+        ['1000', 'king'],
+        ['cobra 6'],
+        ['a' * 10],
+        ['obra', 'alut'],
+        ['cobra', 'thunder'],
+        ['x'],
+        [' '],
+        ['é'],
+        [''],
+        [],
+    ],
+)
+def test_contains_all_matches_substring_checks(tokens):
+    index = TextIndex(TEXTS)
+    expected = [all(token in text for token in tokens) for text in TEXTS]
+    assert index.contains_all(tokens).tolist() == expected
+
+
+def test_contains_matches_substring_checks_on_app_meta_data(app):
+    index = app.text_index
+    texts = [app.meta_data[category][label]['wrappers']['text'] for category, label in index.labels]
+    vocabulary = {text[i : i + n] for text in texts for n in (1, 2, 4, 8) for i in range(0, len(text), 3)}
+    for substring in sorted(vocabulary):
+        assert np.array_equal(index.contains(substring), [substring in text for text in texts])
+
+
+def test_empty_index():
+    index = TextIndex([])
+    assert index.contains('cobra').shape == (0,)
+    assert index.contains_all([]).shape == (0,)
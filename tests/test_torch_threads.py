@@ -0,0 +1,128 @@
+import pytest
+import torch
+
+from app.calculations.models import ViTEmbeddingModel, ViTModelConfig
+from app.torch_threads import (
+    Calibration,
+    ThreadCounts,
+    calibrate_threads,
+    get_available_cpus,
+    get_candidate_thread_counts,
+    get_model_processes,
+    get_thread_counts,
+    write_config_values,
+)
+
+
+def _load_model() -> ViTEmbeddingModel:
+    config = ViTModelConfig(
+        model_size="base",
+        embedding_size=128,
+        image_size=64,
+        patch_size=32,
+        add_pooling_layer=False,
+        mean_pooling=False,
+        device="cpu",
+        force_download=False,
+    )
+    return ViTEmbeddingModel(config=config)
+
+
+def _fail_to_load() -> ViTEmbeddingModel:
+    raise OSError('the model is missing')
+
+
+def test_available_cpus_are_limited_by_the_cgroup_quota(tmp_path, mocker):
+    mocker.patch('os.sched_getaffinity', return_value=set(range(8)))
+    assert get_available_cpus(str(tmp_path)) == 8
+
+    # cgroup v1
+    (tmp_path / 'cpu').mkdir()
+    (tmp_path / 'cpu' / 'cpu.cfs_quota_us').write_text('-1\n')
+    (tmp_path / 'cpu' / 'cpu.cfs_period_us').write_text('100000\n')
+    assert get_available_cpus(str(tmp_path)) == 8
+    (tmp_path / 'cpu' / 'cpu.cfs_quota_us').write_text('300000\n')
+    assert get_available_cpus(str(tmp_path)) == 3
+
+    # cgroup v2, where a fraction of a CPU counts as a CPU
+    (tmp_path / 'cpu.max').write_text('max 100000\n')
+    assert get_available_cpus(str(tmp_path)) == 8
+    (tmp_path / 'cpu.max').write_text('150000 100000\n')
+    assert get_available_cpus(str(tmp_path)) == 2
+    (tmp_path / 'cpu.max').write_text('1600000 100000\n')
+    assert get_available_cpus(str(tmp_path)) == 8
+
+
+def test_cpus_are_divided_over_the_processes_running_the_model(monkeypatch):
+    assert get_thread_counts(n_processes=4, available_cpus=8) == ThreadCounts(2, 1)
+    assert get_thread_counts(n_processes=3, available_cpus=8) == ThreadCounts(2, 1)
+    assert get_thread_counts(n_processes=4, available_cpus=2) == ThreadCounts(1, 1)
+    assert get_thread_counts(n_processes=4, available_cpus=8, intra_op=6, inter_op=2) == ThreadCounts(6, 2)
+
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    assert get_model_processes({}) == 3
+    assert get_model_processes({'APP_PROCESSES': 2}) == 2
+    assert get_model_processes({'INFERENCE_SOCKET': 'inference.sock', 'INFERENCE_WORKERS': 4}) == 4
+
+
+def test_candidate_thread_counts():
+    assert get_candidate_thread_counts(n_processes=2, available_cpus=12, inter_op=(1,)) == [
+        ThreadCounts(1, 1),
+        ThreadCounts(2, 1),
+        ThreadCounts(4, 1),
+        ThreadCounts(6, 1),
+    ]
+    assert get_candidate_thread_counts(n_processes=4, available_cpus=2) == [ThreadCounts(1, 1), ThreadCounts(1, 2)]
+
+
+def test_calibrate_threads():
+    threads = torch.get_num_threads()
+    calibrations = calibrate_threads(_load_model, [ThreadCounts(1, 1)], n_processes=2, n_iterations=2)
+    assert [calibration.threads for calibration in calibrations] == [ThreadCounts(1, 1)]
+    assert calibrations[0].throughput > 0
+    assert calibrations[0].latency > 0
+    # the thread counts are only set in the (spawned) process measuring them
+    assert torch.get_num_threads() == threads
+
+    with pytest.raises(RuntimeError):
+        calibrate_threads(_fail_to_load, [ThreadCounts(1, 1)], n_processes=2, n_iterations=2)
+
+
+def test_write_config_values(tmp_path):
+    config_file = tmp_path / 'setup.cfg'
+    config_file.write_text('RESULTS_PER_PAGE = 5\n# the threads\nTORCH_THREADS = None\nLANGUAGES = {"nl": "NL"}\n')
+    write_config_values(str(config_file), {'TORCH_THREADS': 4, 'TORCH_INTEROP_THREADS': 1})
+    assert config_file.read_text() == (
+        'RESULTS_PER_PAGE = 5\n# the threads\nTORCH_THREADS = 4\nLANGUAGES = {"nl": "NL"}\nTORCH_INTEROP_THREADS = 1\n'
+    )
+
+
+def test_calibrate_threads_command(mocker, app, tmp_path):
+    config_file = tmp_path / 'setup.cfg'
+    config_file.write_text('TORCH_THREADS = None\nTORCH_INTEROP_THREADS = None\n')
+    calibrate = mocker.patch(
+        'app.cli.calibrate_threads',
+        return_value=[
+            Calibration(ThreadCounts(1, 1), throughput=10.0, latency=100.0),
+            Calibration(ThreadCounts(2, 1), throughput=15.0, latency=130.0),
+            Calibration(ThreadCounts(2, 2), throughput=14.0, latency=140.0),
+        ],
+    )
+
+    args = ['calibrate-threads', '--processes', '2', '--config-file', str(config_file)]
+    result = app.test_cli_runner().invoke(args=args + ['--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert calibrate.call_args.kwargs['n_processes'] == 2
+    assert 'best: 2 intra-op and 1 inter-op threads' in result.output
+    assert config_file.read_text() == 'TORCH_THREADS = None\nTORCH_INTEROP_THREADS = None\n'
+
+    result = app.test_cli_runner().invoke(args=args)
+    assert result.exit_code == 0, result.output
+    assert config_file.read_text() == 'TORCH_THREADS = 2\nTORCH_INTEROP_THREADS = 1\n'
+
+
+def test_app_configures_the_torch_threads(mocker, request, configuration):
+    set_num_threads = mocker.patch('app.torch_threads.torch.set_num_threads')
+    configuration.update({'TORCH_THREADS': 3, 'TORCH_INTEROP_THREADS': torch.get_num_interop_threads()})
+    request.getfixturevalue('app')
+    set_num_threads.assert_called_once_with(3)